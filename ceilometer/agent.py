@@ -16,6 +16,7 @@
 import fnmatch
 import os
 import pkg_resources
+import re
 
 from oslo_log import log
 import yaml
@@ -65,6 +66,59 @@ class ConfigManagerBase(object):
         return conf
 
 
+class NameMatcher(object):
+    """Compiled matcher for a list of included/excluded name patterns.
+
+    The patterns follow the semantics of :meth:`Source.is_supported`. Exact
+    names are kept in sets, wildcard patterns are folded into a single
+    regular expression per direction and verdicts are memoized, as the same
+    names are checked over and over again.
+    """
+
+    def __init__(self, dataset, cache_size=4096):
+        included = [d for d in dataset if d[0] != '!']
+        excluded = [d[1:] for d in dataset if d[0] == '!']
+        self._included, self._included_re = self._compile(included)
+        self._excluded, self._excluded_re = self._compile(excluded)
+        # if we only have negation, we suppose the default is allow
+        self._default = not included
+        self._cache = {}
+        self._cache_size = cache_size
+
+    @staticmethod
+    def _compile(patterns):
+        literals = set()
+        wildcards = []
+        for pattern in patterns:
+            if any(c in pattern for c in '*?['):
+                wildcards.append(fnmatch.translate(pattern))
+            else:
+                literals.add(pattern)
+        regex = re.compile('|'.join(wildcards)) if wildcards else None
+        return frozenset(literals), regex
+
+    def _evaluate(self, name):
+        # Start with negation, we consider that the order is deny, allow
+        if name in self._excluded or (self._excluded_re and
+                                      self._excluded_re.match(name)):
+            return False
+        if name in self._included or (self._included_re and
+                                      self._included_re.match(name)):
+            return True
+        return self._default
+
+    def __call__(self, name):
+        try:
+            return self._cache[name]
+        except KeyError:
+            pass
+        verdict = self._evaluate(name)
+        if len(self._cache) >= self._cache_size:
+            self._cache.clear()
+        self._cache[name] = verdict
+        return verdict
+
+
 class Source(object):
     """Represents a generic source"""
 
@@ -14,12 +14,16 @@
 # under the License.
 
 """Simple wrapper for oslo_cache."""
+import threading
+import time
 import uuid
 
+import cachetools
 from ceilometer import keystone_client
 from keystoneauth1 import exceptions as ka_exceptions
 from oslo_cache import core as cache
 from oslo_cache import exception
+from oslo_config import cfg
 from oslo_log import log
 from oslo_utils.secretutils import md5
 
@@ -33,40 +37,161 @@ CACHE_NAMESPACE = uuid.UUID(
 
 LOG = log.getLogger(__name__)
 
+OPTS = [
+    cfg.IntOpt('cache_local_size',
+               default=0,
+               min=0,
+               help='Number of entries of the cache backend kept in the '
+                    'memory of the process, in front of the backend. The '
+                    'default, 0, disables the local cache.'),
+    cfg.IntOpt('cache_local_ttl',
+               default=60,
+               min=1,
+               help='Time in seconds after which the entries of the local '
+                    'cache are read again from the cache backend.'),
+    cfg.BoolOpt('cache_local_write_through',
+                default=True,
+                help='Whether the values written to the cache backend are '
+                     'also kept in the local cache. When disabled, they are '
+                     'only kept once read back from the backend.'),
+]
+
 
 class CacheClient(object):
     def __init__(self, region, conf):
         self.region = region
         self.conf = conf
+        self._keystone = None
+        # NOTE: bounded in-process cache in front of the region, sparing a
+        # round-trip to the backend for the keys read often
+        self._local = None
+        if conf.cache_local_size:
+            self._local = cachetools.TTLCache(conf.cache_local_size,
+                                              conf.cache_local_ttl)
+            self._local_lock = threading.Lock()
+
+    def _get_local(self, key):
+        if self._local is None:
+            return cache.NO_VALUE
+        with self._local_lock:
+            return self._local.get(key, cache.NO_VALUE)
+
+    def _set_local(self, mapping, from_backend=False):
+        if self._local is None:
+            return
+        with self._local_lock:
+            for key, value in mapping.items():
+                if from_backend or self.conf.cache_local_write_through:
+                    self._local[key] = value
+                else:
+                    self._local.pop(key, None)
 
     def get(self, key):
+        value = self._get_local(key)
+        if value is not cache.NO_VALUE:
+            return value
         value = self.region.get(key)
         if value == cache.NO_VALUE:
             return None
+        self._set_local({key: value}, from_backend=True)
         return value
 
+    def get_multi(self, keys):
+        """Return the values of keys, None for the missing ones.
+
+        The keys missing from the local cache are read from the backend in
+        a single round-trip.
+        """
+        values = [self._get_local(key) for key in keys]
+        missing = [key for key, value in zip(keys, values)
+                   if value is cache.NO_VALUE]
+        found = {}
+        if missing:
+            for key, value in zip(missing, self.region.get_multi(missing)):
+                if value != cache.NO_VALUE:
+                    found[key] = value
+            self._set_local(found, from_backend=True)
+        return [found.get(key) if value is cache.NO_VALUE else value
+                for key, value in zip(keys, values)]
+
     def set(self, key, value):
+        self._set_local({key: value})
         return self.region.set(key, value)
 
+    def set_multi(self, mapping):
+        """Set the values of several keys in a single round-trip."""
+        self._set_local(mapping)
+        return self.region.set_multi(mapping)
+
     def delete(self, key):
+        if self._local is not None:
+            with self._local_lock:
+                self._local.pop(key, None)
         return self.region.delete(key)
 
     def resolve_uuid_from_cache(self, attr, uuid):
-        resource_name = self.get(uuid)
-        if resource_name:
-            return resource_name
-        else:
-            # Retrieve project and user names from Keystone only
-            # if ceilometer doesn't have a caching backend
-            resource_name = self._resolve_uuid_from_keystone(attr, uuid)
-            self.set(uuid, resource_name)
-            return resource_name
+        return self.resolve_uuids_from_cache(attr, [uuid]).get(uuid)
+
+    def resolve_uuids_from_cache(self, attr, uuids):
+        """Resolve project or user IDs to their names.
+
+        The IDs are read from the cache at once, the missing ones are
+        resolved from Keystone and cached, including the ones not found.
+
+        :param attr: 'projects' or 'users'
+        :return: a dict of the names of the IDs, None when not found.
+        """
+        uuids = list(dict.fromkeys(u for u in uuids if u))
+        names = {}
+        missing = []
+        now = time.time()
+        for res_id, cached in zip(uuids, self.get_multi(uuids)):
+            if isinstance(cached, str) and cached:
+                names[res_id] = cached
+            elif (isinstance(cached, (tuple, list)) and len(cached) == 2 and
+                  cached[0] is None and cached[1] > now):
+                # NOTE: negative entry, (None, expiry), some backends
+                # serialize it as a list
+                names[res_id] = None
+            else:
+                missing.append(res_id)
+        if not missing:
+            return names
+
+        resolved = self._resolve_uuids_from_keystone(attr, missing)
+        names.update((res_id, resolved[res_id]) for res_id in missing)
+        negative_ttl = self.conf.polling.tenant_name_discovery_negative_ttl
+        self.set_multi(dict(
+            (res_id, name if name or not negative_ttl
+             else (None, now + negative_ttl))
+            for res_id, name in resolved.items()))
+        return names
+
+    def _resolve_uuids_from_keystone(self, attr, uuids):
+        """Return the names of uuids, and of all the others when listed."""
+        names = {}
+        if self.conf.polling.tenant_name_discovery_prefetch:
+            try:
+                for resource in getattr(self._get_keystone(), attr).list():
+                    names[resource.id] = resource.name
+            except Exception as e:
+                LOG.warning("Found '%s' while listing %s", e, attr)
+        for res_id in uuids:
+            if res_id not in names:
+                names[res_id] = self._resolve_uuid_from_keystone(attr,
+                                                                 res_id)
+        return names
+
+    def _get_keystone(self):
+        # NOTE: the client and its session are reused, sparing a new
+        # authentication for each name resolved
+        if self._keystone is None:
+            self._keystone = keystone_client.get_client(self.conf)
+        return self._keystone
 
     def _resolve_uuid_from_keystone(self, attr, uuid):
         try:
-            return getattr(
-                keystone_client.get_client(self.conf), attr
-            ).get(uuid).name
+            return getattr(self._get_keystone(), attr).get(uuid).name
         except AttributeError as e:
             LOG.warning("Found '%s' while resolving uuid %s to name", e, uuid)
         except ka_exceptions.NotFound as e:
@@ -15,8 +15,8 @@
 
 import hashlib
 from lxml import etree
-import operator
 import threading
+import time
 
 import cachetools
 from novaclient import exceptions
@@ -36,7 +36,8 @@ from ceilometer.polling import plugin_base
 OPTS = [
     cfg.StrOpt('instance_discovery_method',
                default='libvirt_metadata',
-               choices=['naive', 'workload_partitioning', 'libvirt_metadata'],
+               choices=['naive', 'workload_partitioning', 'libvirt_metadata',
+                        'libvirt_events'],
                help="Ceilometer offers many methods to discover the instance "
                     "running on a compute node: \n"
                     "* naive: poll nova to get all instances\n"
@@ -44,7 +45,11 @@ OPTS = [
                     "the compute\n"
                     "* libvirt_metadata: get instances from libvirt metadata "
                     "  but without instance metadata (recommended for Gnocchi "
-                    "  backend"),
+                    "  backend\n"
+                    "* libvirt_events: like libvirt_metadata, but the "
+                    "instances are kept up to date by the libvirt domain "
+                    "lifecycle events instead of listing all the domains at "
+                    "each discovery"),
     cfg.IntOpt('resource_update_interval',
                default=0,
                min=0,
@@ -67,8 +72,22 @@ OPTS = [
                     "local cache by totally refreshing the local cache. "
                     "The minimum should be the value of the config option "
                     "of resource_update_interval. This option is only used "
-                    "for agent polling to Nova API, so it will work only "
-                    "when 'instance_discovery_method' is set to 'naive'.")
+                    "for agent polling to Nova API or to libvirt events, so "
+                    "it will work only when 'instance_discovery_method' is "
+                    "set to 'naive' or 'libvirt_events'."),
+    cfg.IntOpt('flavor_cache_ttl',
+               default=3600,
+               min=1,
+               help="Number of seconds the id of a flavor found by its name "
+                    "is kept by the libvirt_metadata and libvirt_events "
+                    "instance discovery methods."),
+    cfg.IntOpt('flavor_cache_negative_ttl',
+               default=300,
+               min=0,
+               help="Number of seconds a flavor name not found in Nova is "
+                    "kept by the libvirt_metadata and libvirt_events "
+                    "instance discovery methods before looking it up "
+                    "again."),
 ]
 
 LOG = log.getLogger(__name__)
@@ -87,6 +106,86 @@ class NovaLikeServer(object):
         return self.id == other.id
 
 
+class FlavorIdCache(object):
+    """Ids of the flavors by name, shared by the polling threads.
+
+    A single thread gets a missing flavor from Nova, the other threads
+    needing the same flavor wait for it. The first lookup lists all the
+    flavors at once to fill the cache.
+    """
+
+    def __init__(self, nova_cli, ttl, negative_ttl, maxsize=4096):
+        self._nova_cli = nova_cli
+        self._negative_ttl = negative_ttl
+        # flavor name -> (flavor id, or None if not found, expiry)
+        self._ids = cachetools.TTLCache(maxsize, ttl)
+        # flavor name -> [lock, number of threads using it]
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._warm_up_lock = threading.Lock()
+        self._warmed_up = False
+
+    def _get_cached(self, name):
+        with self._lock:
+            entry = self._ids.get(name)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry
+        return None
+
+    def _warm_up(self):
+        try:
+            flavors = self._nova_cli.nova_client.flavors.list(
+                detailed=True, is_public=None)
+        except Exception as e:
+            LOG.warning("Fail to list the flavors: %s", e)
+            return
+        ids = {}
+        for flavor in flavors:
+            ids.setdefault(flavor.name, []).append(flavor.id)
+        with self._lock:
+            for name, flavor_ids in ids.items():
+                # NOTE: flavors sharing a name are left to flavors.find
+                if len(flavor_ids) == 1:
+                    self._ids[name] = (flavor_ids[0], float('inf'))
+
+    def _load(self, name):
+        try:
+            flavor_id = self._nova_cli.nova_client.flavors.find(
+                name=name, is_public=None).id
+        except exceptions.NotFound:
+            return None, time.monotonic() + self._negative_ttl
+        return flavor_id, float('inf')
+
+    def get(self, name):
+        """Return the id of the flavor, or its name if it is not found."""
+        entry = self._get_cached(name)
+        if entry is None:
+            with self._lock:
+                loading = self._loading.setdefault(
+                    name, [threading.Lock(), 0])
+                loading[1] += 1
+            name_lock = loading[0]
+            try:
+                with name_lock:
+                    with self._warm_up_lock:
+                        if not self._warmed_up:
+                            self._warmed_up = True
+                            self._warm_up()
+                    entry = self._get_cached(name)
+                    if entry is None:
+                        entry = self._load(name)
+                        with self._lock:
+                            self._ids[name] = entry
+            finally:
+                # NOTE: the lock is dropped by the last thread using it, a
+                # new lock would let another thread load the same flavor
+                with self._lock:
+                    loading[1] -= 1
+                    if not loading[1]:
+                        del self._loading[name]
+        return name if entry[0] is None else entry[0]
+
+
 class InstanceDiscovery(plugin_base.DiscoveryBase):
     method = None
 
@@ -98,9 +197,20 @@ class InstanceDiscovery(plugin_base.DiscoveryBase):
         self.nova_cli = nova_client.Client(conf)
         self.expiration_time = conf.compute.resource_update_interval
         self.cache_expiry = conf.compute.resource_cache_expiry
-        if self.method == "libvirt_metadata":
+        if self.method in ("libvirt_metadata", "libvirt_events"):
             # 4096 instances on a compute should be enough :)
-            self._flavor_cache = cachetools.LRUCache(4096)
+            self._flavor_cache = FlavorIdCache(
+                self.nova_cli, conf.compute.flavor_cache_ttl,
+                conf.compute.flavor_cache_negative_ttl)
+            # NOTE: state of the libvirt_events method, the instances by
+            # domain UUID and the UUID of the domains changed since the
+            # last discovery, None when all the domains must be listed
+            self.lock = threading.Lock()
+            self.instances = {}
+            self.last_cache_expire = None
+            self._events_lock = threading.Lock()
+            self._events_connection = None
+            self._changed_domains = None
         else:
             self.lock = threading.Lock()
             self.instances = {}
@@ -111,9 +221,15 @@ class InstanceDiscovery(plugin_base.DiscoveryBase):
     def connection(self):
         return libvirt_utils.refresh_libvirt_connection(self.conf, self)
 
+    @property
+    def xml_cache(self):
+        return libvirt_utils.get_domain_xml_cache(self.conf)
+
     def discover(self, manager, param=None):
         """Discover resources to monitor."""
-        if self.method != "libvirt_metadata":
+        if self.method == "libvirt_events":
+            return self.discover_libvirt_events(manager, param=None)
+        elif self.method != "libvirt_metadata":
             return self.discover_nova_polling(manager, param=None)
         else:
             return self.discover_libvirt_polling(manager, param=None)
@@ -125,109 +241,191 @@ class InstanceDiscovery(plugin_base.DiscoveryBase):
             return int(elem.text)
         return 0
 
-    @cachetools.cachedmethod(operator.attrgetter('_flavor_cache'))
     def get_flavor_id(self, name):
+        return self._flavor_cache.get(name)
+
+    def _instance_from_domain(self, domain):
+        """Return the NovaLikeServer of a domain created by nova, or None."""
+        xml_cache = self.xml_cache
+        xml_string = xml_cache.metadata(domain)
+        if xml_string is None:
+            return None
+
+        full_xml = xml_cache.xml(domain)
+        os_type_xml = full_xml.find("./os/type")
+        metadata_xml = etree.fromstring(xml_string)
+
+        # TODO(sileht): We don't have the flavor ID here So the Gnocchi
+        # resource update will fail for compute sample (or put None ?)
+        # We currently poll nova to get the flavor ID, but storing the
+        # flavor_id doesn't have any sense because the flavor description
+        # can change over the time, we should store the detail of the
+        # flavor. this is why nova doesn't put the id in the libvirt
+        # metadata
+
         try:
-            return self.nova_cli.nova_client.flavors.find(
-                name=name, is_public=None).id
-        except exceptions.NotFound:
-            return name
+            flavor_xml = metadata_xml.find(
+                "./flavor")
+            user_id = metadata_xml.find(
+                "./owner/user").attrib["uuid"]
+            project_id = metadata_xml.find(
+                "./owner/project").attrib["uuid"]
+            instance_name = metadata_xml.find(
+                "./name").text
+            instance_arch = os_type_xml.attrib["arch"]
+
+            flavor = {
+                "id": self.get_flavor_id(flavor_xml.attrib["name"]),
+                "name": flavor_xml.attrib["name"],
+                "vcpus": self._safe_find_int(flavor_xml, "vcpus"),
+                "ram": self._safe_find_int(flavor_xml, "memory"),
+                "disk": self._safe_find_int(flavor_xml, "disk"),
+                "ephemeral": self._safe_find_int(flavor_xml, "ephemeral"),
+                "swap": self._safe_find_int(flavor_xml, "swap"),
+            }
+
+            # The image description is partial, but Gnocchi only care about
+            # the id, so we are fine
+            image_xml = metadata_xml.find("./root[@type='image']")
+            image = ({'id': image_xml.attrib['uuid']}
+                     if image_xml is not None else None)
+        except AttributeError:
+            LOG.error(
+                "Fail to get domain uuid %s metadata: "
+                "metadata was missing expected attributes",
+                domain.UUIDString())
+            return None
+
+        dom_state = domain.state()[0]
+        vm_state = libvirt_utils.LIBVIRT_POWER_STATE.get(dom_state)
+        status = libvirt_utils.LIBVIRT_STATUS.get(dom_state)
+
+        # From:
+        # https://github.com/openstack/nova/blob/852f40fd0c6e9d8878212ff3120556668023f1c4/nova/api/openstack/compute/views/servers.py#L214-L220
+        host_id = hashlib.sha224(
+            (project_id + self.conf.host).encode('utf-8')).hexdigest()
+
+        instance_data = {
+            "id": domain.UUIDString(),
+            "name": instance_name,
+            "flavor": flavor,
+            "image": image,
+            "os_type": os_type_xml.text,
+            "architecture": instance_arch,
+
+            "OS-EXT-SRV-ATTR:instance_name": domain.name(),
+            "OS-EXT-SRV-ATTR:host": self.conf.host,
+            "OS-EXT-STS:vm_state": vm_state,
+
+            "tenant_id": project_id,
+            "user_id": user_id,
+
+            "hostId": host_id,
+            "status": status,
+
+            # NOTE(sileht): Other fields that Ceilometer tracks
+            # where we can't get the value here, but their are
+            # retrieved by notification
+            "metadata": {},
+            # "OS-EXT-STS:task_state"
+            # 'reservation_id',
+            # 'OS-EXT-AZ:availability_zone',
+            # 'kernel_id',
+            # 'ramdisk_id',
+            # some image detail
+        }
+
+        LOG.debug("instance data: %s", instance_data)
+        return NovaLikeServer(**instance_data)
 
     @libvirt_utils.retry_on_disconnect
     def discover_libvirt_polling(self, manager, param=None):
         instances = []
-        for domain in self.connection.listAllDomains():
-            xml_string = libvirt_utils.instance_metadata(domain)
-            if xml_string is None:
-                continue
-
-            full_xml = etree.fromstring(domain.XMLDesc())
-            os_type_xml = full_xml.find("./os/type")
-            metadata_xml = etree.fromstring(xml_string)
-
-            # TODO(sileht): We don't have the flavor ID here So the Gnocchi
-            # resource update will fail for compute sample (or put None ?)
-            # We currently poll nova to get the flavor ID, but storing the
-            # flavor_id doesn't have any sense because the flavor description
-            # can change over the time, we should store the detail of the
-            # flavor. this is why nova doesn't put the id in the libvirt
-            # metadata
+        domains = self.connection.listAllDomains()
+        self.xml_cache.retain(domain.UUIDString() for domain in domains)
+        for domain in domains:
+            instance = self._instance_from_domain(domain)
+            if instance is not None:
+                instances.append(instance)
+        return instances
 
-            try:
-                flavor_xml = metadata_xml.find(
-                    "./flavor")
-                user_id = metadata_xml.find(
-                    "./owner/user").attrib["uuid"]
-                project_id = metadata_xml.find(
-                    "./owner/project").attrib["uuid"]
-                instance_name = metadata_xml.find(
-                    "./name").text
-                instance_arch = os_type_xml.attrib["arch"]
-
-                flavor = {
-                    "id": self.get_flavor_id(flavor_xml.attrib["name"]),
-                    "name": flavor_xml.attrib["name"],
-                    "vcpus": self._safe_find_int(flavor_xml, "vcpus"),
-                    "ram": self._safe_find_int(flavor_xml, "memory"),
-                    "disk": self._safe_find_int(flavor_xml, "disk"),
-                    "ephemeral": self._safe_find_int(flavor_xml, "ephemeral"),
-                    "swap": self._safe_find_int(flavor_xml, "swap"),
-                }
-
-                # The image description is partial, but Gnocchi only care about
-                # the id, so we are fine
-                image_xml = metadata_xml.find("./root[@type='image']")
-                image = ({'id': image_xml.attrib['uuid']}
-                         if image_xml is not None else None)
-            except AttributeError:
-                LOG.error(
-                    "Fail to get domain uuid %s metadata: "
-                    "metadata was missing expected attributes",
-                    domain.UUIDString())
-                continue
-
-            dom_state = domain.state()[0]
-            vm_state = libvirt_utils.LIBVIRT_POWER_STATE.get(dom_state)
-            status = libvirt_utils.LIBVIRT_STATUS.get(dom_state)
-
-            # From:
-            # https://github.com/openstack/nova/blob/852f40fd0c6e9d8878212ff3120556668023f1c4/nova/api/openstack/compute/views/servers.py#L214-L220
-            host_id = hashlib.sha224(
-                (project_id + self.conf.host).encode('utf-8')).hexdigest()
-
-            instance_data = {
-                "id": domain.UUIDString(),
-                "name": instance_name,
-                "flavor": flavor,
-                "image": image,
-                "os_type": os_type_xml.text,
-                "architecture": instance_arch,
-
-                "OS-EXT-SRV-ATTR:instance_name": domain.name(),
-                "OS-EXT-SRV-ATTR:host": self.conf.host,
-                "OS-EXT-STS:vm_state": vm_state,
-
-                "tenant_id": project_id,
-                "user_id": user_id,
-
-                "hostId": host_id,
-                "status": status,
-
-                # NOTE(sileht): Other fields that Ceilometer tracks
-                # where we can't get the value here, but their are
-                # retrieved by notification
-                "metadata": {},
-                # "OS-EXT-STS:task_state"
-                # 'reservation_id',
-                # 'OS-EXT-AZ:availability_zone',
-                # 'kernel_id',
-                # 'ramdisk_id',
-                # some image detail
-            }
+    def _domain_event(self, conn, domain, event, detail, opaque):
+        """Lifecycle callback, run in the libvirt event loop thread."""
+        uuid = domain.UUIDString()
+        LOG.debug("Domain %s lifecycle event %s (%s)", uuid, event, detail)
+        self.xml_cache.invalidate(uuid)
+        with self._events_lock:
+            if self._changed_domains is not None:
+                self._changed_domains.add(uuid)
+
+    def _connection_closed(self, conn, reason, opaque):
+        LOG.warning("Libvirt connection closed (reason: %s), the domains "
+                    "will be listed again", reason)
+        with self._events_lock:
+            self._changed_domains = None
+
+    def _watch_domains(self):
+        """Return the domains changed since the last call.
+
+        None is returned when all the domains must be listed, on the first
+        call, when the connection has been lost and after
+        resource_cache_expiry seconds.
+        """
+        utc_now = timeutils.utcnow(True)
+        with self._events_lock:
+            conn = self._events_connection
+            if conn is None or not conn.isAlive():
+                libvirt_utils.start_event_loop()
+                conn = libvirt_utils.new_libvirt_connection(self.conf)
+                conn.domainEventRegisterAny(
+                    None, libvirt_utils.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                    self._domain_event, None)
+                conn.registerCloseCallback(self._connection_closed, None)
+                self._events_connection = self._libvirt_connection = conn
+                self._changed_domains = None
+            if (self.last_cache_expire is None or
+                    timeutils.delta_seconds(self.last_cache_expire, utc_now)
+                    >= self.cache_expiry):
+                self._changed_domains = None
+            changed, self._changed_domains = self._changed_domains, set()
+        if changed is None:
+            self.last_cache_expire = utc_now
+        return changed
+
+    def _refresh_domain(self, uuid):
+        try:
+            domain = self.connection.lookupByUUIDString(uuid)
+        except libvirt.libvirtError as e:
+            if e.get_error_code() != libvirt_utils.VIR_ERR_NO_DOMAIN:
+                raise
+            LOG.debug("Domain %s is gone", uuid)
+            self.instances.pop(uuid, None)
+            return
+        instance = self._instance_from_domain(domain)
+        if instance is None:
+            self.instances.pop(uuid, None)
+        else:
+            self.instances[uuid] = instance
 
-            LOG.debug("instance data: %s", instance_data)
-            instances.append(NovaLikeServer(**instance_data))
-        return instances
+    @libvirt_utils.retry_on_disconnect
+    def discover_libvirt_events(self, manager, param=None):
+        with self.lock:
+            changed = self._watch_domains()
+            try:
+                if changed is None:
+                    self.instances = dict(
+                        (instance.id, instance) for instance in
+                        self.discover_libvirt_polling(manager, param))
+                else:
+                    for uuid in changed:
+                        self._refresh_domain(uuid)
+            except Exception:
+                # NOTE: the changes would be lost, list all the domains
+                # at the next discovery
+                with self._events_lock:
+                    self._changed_domains = None
+                raise
+            return list(self.instances.values())
 
     def discover_nova_polling(self, manager, param=None):
         secs_from_last_update = 0
@@ -13,6 +13,8 @@
 # under the License.
 
 import collections
+from concurrent import futures
+import threading
 from time import monotonic as now
 
 from oslo_log import log
@@ -45,6 +47,9 @@ class GenericComputePollster(plugin_base.PollsterBase):
     sample_stats_key = None
     inspector_method = None
 
+    _executor_lock = threading.Lock()
+    _load_stats_lock = threading.Lock()
+
     def setup_environment(self):
         super(GenericComputePollster, self).setup_environment()
         self.inspector = GenericComputePollster._get_inspector(self.conf)
@@ -64,6 +69,20 @@ class GenericComputePollster(plugin_base.PollsterBase):
             GenericComputePollster._inspector = inspector
         return inspector
 
+    @staticmethod
+    def _get_executor(conf):
+        # NOTE: the executor is shared by all the pollsters so that
+        # inspection_concurrency caps the calls made to the hypervisor
+        with GenericComputePollster._executor_lock:
+            try:
+                executor = GenericComputePollster._executor
+            except AttributeError:
+                executor = futures.ThreadPoolExecutor(
+                    max_workers=conf.inspection_concurrency,
+                    thread_name_prefix='inspector')
+                GenericComputePollster._executor = executor
+        return executor
+
     @property
     def default_discovery(self):
         return 'local_instances'
@@ -89,21 +108,52 @@ class GenericComputePollster(plugin_base.PollsterBase):
     def get_resource_id(instance, stats):
         return instance.id
 
+    def _inspect(self, instance, duration):
+        result = getattr(self.inspector, self.inspector_method)(
+            instance, duration)
+        polled_time = now()
+        # Ensure we don't cache an iterator
+        if isinstance(result, collections.abc.Iterable):
+            result = list(result)
+        else:
+            result = [result]
+        return polled_time, result
+
     def _inspect_cached(self, cache, instance, duration):
         cache.setdefault(self.inspector_method, {})
         if instance.id not in cache[self.inspector_method]:
-            result = getattr(self.inspector, self.inspector_method)(
+            cache[self.inspector_method][instance.id] = self._inspect(
                 instance, duration)
-            polled_time = now()
-            # Ensure we don't cache an iterator
-            if isinstance(result, collections.abc.Iterable):
-                result = list(result)
-            else:
-                result = [result]
-            cache[self.inspector_method][instance.id] = (polled_time, result)
         return cache[self.inspector_method][instance.id]
 
-    def _stats_to_sample(self, instance, stats, polled_time):
+    def _inspect_concurrently(self, cache, resources, duration):
+        """Inspect the instances not cached yet in the executor.
+
+        The results are cached as _inspect_cached does.
+
+        :return: the exceptions raised by the inspector, by instance id
+        """
+        cached = cache.setdefault(self.inspector_method, {})
+        missing = {}
+        for instance in resources:
+            if instance.id not in cached:
+                missing.setdefault(instance.id, instance)
+        if len(missing) < 2:
+            return {}
+
+        executor = self._get_executor(self.conf)
+        jobs = [(instance_id, executor.submit(self._inspect, instance,
+                                              duration))
+                for instance_id, instance in missing.items()]
+        errors = {}
+        for instance_id, job in jobs:
+            try:
+                cached[instance_id] = job.result()
+            except Exception as e:
+                errors[instance_id] = e
+        return errors
+
+    def _stats_to_sample(self, instance, stats, polled_time, cache=None):
         volume = getattr(stats, self.sample_stats_key)
         LOG.debug("%(instance_id)s/%(name)s volume: "
                   "%(volume)s" % {
@@ -126,18 +176,32 @@ class GenericComputePollster(plugin_base.PollsterBase):
             additional_metadata=self.get_additional_metadata(
                 instance, stats),
             monotonic_time=polled_time,
+            cache=cache,
         )
 
     def get_samples(self, manager, cache, resources):
         self._inspection_duration = self._record_poll_time()
+        # NOTE: the first compute pollster of a polling cycle lets the
+        # inspector load the statistics of all the instances at once
+        with self._load_stats_lock:
+            if 'inspector_stats_loaded' not in cache:
+                self.inspector.load_stats()
+                cache['inspector_stats_loaded'] = True
+        errors = {}
+        if self.conf.inspection_concurrency > 1:
+            errors = self._inspect_concurrently(
+                cache, resources, self._inspection_duration)
         for instance in resources:
             try:
+                if instance.id in errors:
+                    raise errors[instance.id]
                 polled_time, result = self._inspect_cached(
                     cache, instance, self._inspection_duration)
                 if not result:
                     continue
                 for stats in self.aggregate_method(result):
-                    yield self._stats_to_sample(instance, stats, polled_time)
+                    yield self._stats_to_sample(instance, stats, polled_time,
+                                                cache)
             except NoVolumeException:
                 # FIXME(sileht): This should be a removed... but I will
                 # not change the test logic for now
@@ -75,13 +75,34 @@ def _get_metadata_from_object(conf, instance):
                                              metadata)
 
 
+def _get_cached_metadata(conf, instance, cache):
+    """Return the metadata of the instance, built once per polling cycle.
+
+    The metadata are shared by all the samples of the instance and must
+    not be modified.
+    """
+    metadata_cache = cache.setdefault('instance_metadata', {})
+    key = (instance.id, getattr(instance, 'updated', None))
+    metadata = metadata_cache.get(key)
+    if metadata is None:
+        metadata = metadata_cache[key] = _get_metadata_from_object(
+            conf, instance)
+    return metadata
+
+
 def make_sample_from_instance(conf, instance, name, type, unit, volume,
                               resource_id=None, additional_metadata=None,
-                              monotonic_time=None):
-    additional_metadata = additional_metadata or {}
-    resource_metadata = _get_metadata_from_object(conf, instance)
-    resource_metadata.update(additional_metadata)
-    return sample.Sample(
+                              monotonic_time=None, cache=None):
+    """Build a sample of the instance.
+
+    :param cache: the cache of the polling cycle, when given the metadata
+                  of the instance are built once for all its samples.
+    """
+    if cache is None:
+        base_metadata = _get_metadata_from_object(conf, instance)
+    else:
+        base_metadata = _get_cached_metadata(conf, instance, cache)
+    s = sample.Sample(
         name=name,
         type=type,
         unit=unit,
@@ -89,9 +110,11 @@ def make_sample_from_instance(conf, instance, name, type, unit, volume,
         user_id=instance.user_id,
         project_id=instance.tenant_id,
         resource_id=resource_id or instance.id,
-        resource_metadata=resource_metadata,
         monotonic_time=monotonic_time,
     )
+    # NOTE: the base metadata are only copied if the metadata are accessed
+    s.set_metadata_template(base_metadata, additional_metadata)
+    return s
 
 
 def instance_name(instance):
@@ -28,6 +28,13 @@ OPTS = [
                default='libvirt',
                help='Inspector to use for inspecting the hypervisor layer. '
                     'Known inspectors are libvirt, hyperv, and vsphere.'),
+    cfg.IntOpt('inspection_concurrency',
+               default=1,
+               min=1,
+               help='Maximum number of instances the compute pollsters '
+                    'inspect at the same time, all pollsters together. With '
+                    'the default value of 1, the instances are inspected '
+                    'one after the other.'),
 ]
 
 
@@ -183,6 +190,15 @@ class Inspector(object):
     def __init__(self, conf):
         self.conf = conf
 
+    def load_stats(self):
+        """Load the statistics of all the instances at once.
+
+        Called by the compute pollsters at the beginning of each polling
+        cycle. Inspectors able to get the statistics of every instance in
+        a single call serve the inspect methods from what they loaded,
+        until the next call. The others do nothing.
+        """
+
     def inspect_instance(self, instance, duration):
         """Inspect the CPU statistics for an instance.
 
@@ -14,7 +14,9 @@
 # under the License.
 """Implementation of Inspector abstraction for libvirt."""
 
-from lxml import etree
+import collections
+import threading
+
 from oslo_log import log as logging
 from oslo_utils import units
 
@@ -37,12 +39,93 @@ class LibvirtInspector(virt_inspector.Inspector):
         super(LibvirtInspector, self).__init__(conf)
         # NOTE(sileht): create a connection on startup
         self.connection
-        self.cache = {}
+        self.counters = libvirt_utils.CounterStore(
+            conf.libvirt_counter_cache_size, conf.libvirt_counter_cache_ttl)
+        # domain UUID -> (domain, stats) from the last getAllDomainStats
+        self._domain_stats = {}
+        self._xml_cache = libvirt_utils.get_domain_xml_cache(conf)
+        # NOTE: the readings of the current polling cycle, shared by the
+        # inspect methods deriving several meters from the same counters.
+        # None until load_stats() starts the first cycle.
+        self._cycle_readings = None
+        self._cycle_lock = threading.Lock()
 
     @property
     def connection(self):
         return libvirt_utils.refresh_libvirt_connection(self.conf, self)
 
+    @libvirt_utils.retry_on_disconnect
+    def _get_all_domain_stats(self):
+        stats = (libvirt_utils.VIR_DOMAIN_STATS_STATE |
+                 libvirt_utils.VIR_DOMAIN_STATS_CPU_TOTAL |
+                 libvirt_utils.VIR_DOMAIN_STATS_BALLOON |
+                 libvirt_utils.VIR_DOMAIN_STATS_VCPU |
+                 libvirt_utils.VIR_DOMAIN_STATS_INTERFACE |
+                 libvirt_utils.VIR_DOMAIN_STATS_BLOCK |
+                 libvirt_utils.VIR_DOMAIN_STATS_PERF)
+        return self.connection.getAllDomainStats(stats, 0)
+
+    def load_stats(self):
+        with self._cycle_lock:
+            self._cycle_readings = {}
+        if not self.conf.libvirt_bulk_stats:
+            return
+        try:
+            records = self._get_all_domain_stats()
+        except Exception as ex:
+            LOG.warning('Failed to get the statistics of all the domains, '
+                        'querying each domain instead: %s', ex)
+            self._domain_stats = {}
+            return
+        self._domain_stats = dict(
+            (domain.UUIDString(), (domain, stats))
+            for domain, stats in records)
+
+    def _read_once_per_cycle(self, key, read):
+        """Return read(), called once per polling cycle for key."""
+        with self._cycle_lock:
+            readings = self._cycle_readings
+            if readings is None:
+                entry = None
+            else:
+                entry = readings.setdefault(key, [threading.Lock(), None])
+        if entry is None:
+            return read()
+        with entry[0]:
+            if entry[1] is None:
+                entry[1] = read()
+            return entry[1]
+
+    def _get_loaded_stats(self, instance):
+        """Return the loaded domain and statistics of an instance, if any."""
+        if not self._domain_stats:
+            return None
+        loaded = self._domain_stats.get(instance.id)
+        if loaded is not None:
+            if loaded[1].get('state.state') == libvirt.VIR_DOMAIN_SHUTOFF:
+                msg = _('Failed to inspect data of instance '
+                        '<name=%(name)s, id=%(id)s>, '
+                        'domain state is SHUTOFF.') % {
+                    'name': util.instance_name(instance), 'id': instance.id}
+                raise virt_inspector.InstanceShutOffException(msg)
+        return loaded
+
+    @staticmethod
+    def _get_device_stats(stats, group):
+        """Return the statistics of a group of devices, by device name.
+
+        The <group>.<index>.<field> keys of stats are gathered in a dict
+        of field to value for each device.
+        """
+        devices = collections.defaultdict(dict)
+        for key, value in stats.items():
+            parts = key.split('.', 2)
+            if (len(parts) == 3 and parts[0] == group and
+                    parts[1].isdigit()):
+                devices[parts[1]][parts[2]] = value
+        return dict((fields['name'], fields) for fields in devices.values()
+                    if 'name' in fields)
+
     def _lookup_by_uuid(self, instance):
         instance_name = util.instance_name(instance)
         try:
@@ -75,73 +158,64 @@ class LibvirtInspector(virt_inspector.Inspector):
 
         return domain
 
-    @libvirt_utils.retry_on_disconnect
-    def inspect_vnics(self, instance, duration):
-        domain = self._get_domain_not_shut_off_or_raise(instance)
+    def _inspect_vnic_counters(self, instance, kind):
+        """Return the counters of the vNICs of an instance.
+
+        The counters are read once per polling cycle.
+
+        :return: for each vNIC, its name, MAC address, filter reference,
+                 parameters, counters, the previous counters returned for
+                 this kind of statistics and the seconds elapsed since then.
+        """
+        for name, mac_address, fref, params, dom_stats in (
+                self._read_once_per_cycle(
+                    ('vnics', instance.id),
+                    lambda: self._read_vnic_counters(instance))):
+            prev, elapsed = self.counters.update(
+                (kind, instance.id, mac_address, name), dom_stats)
+            if prev is None:
+                LOG.debug('No delta meter predecessor for %s / %s' %
+                          (instance.id, name))
+            yield name, mac_address, fref, params, dom_stats, prev, elapsed
 
-        tree = etree.fromstring(domain.XMLDesc(0))
-        for iface in tree.findall('devices/interface'):
-            target = iface.find('target')
-            if target is not None:
-                name = target.get('dev')
-            else:
-                continue
-            mac = iface.find('mac')
-            if mac is not None:
-                mac_address = mac.get('address')
+    @libvirt_utils.retry_on_disconnect
+    def _read_vnic_counters(self, instance):
+        loaded = self._get_loaded_stats(instance)
+        if loaded is not None:
+            domain = loaded[0]
+            vnic_stats = self._get_device_stats(loaded[1], 'net')
+        else:
+            domain = self._get_domain_not_shut_off_or_raise(instance)
+            vnic_stats = {}
+
+        vnics = []
+        for name, mac_address, fref, params in (
+                self._xml_cache.interfaces(domain)):
+            fields = vnic_stats.get(name)
+            if fields is not None and 'rx.bytes' in fields:
+                dom_stats = (fields['rx.bytes'], fields['rx.pkts'],
+                             fields['rx.errs'], fields['rx.drop'],
+                             fields['tx.bytes'], fields['tx.pkts'],
+                             fields['tx.errs'], fields['tx.drop'])
             else:
-                continue
-            fref = iface.find('filterref')
-            if fref is not None:
-                fref = fref.get('filter')
-
-            params = dict((p.get('name').lower(), p.get('value'))
-                          for p in iface.findall('filterref/parameter'))
-
-            # Extract interface ID
-            try:
-                interfaceid = iface.find('virtualport').find(
-                    'parameters').get('interfaceid')
-            except AttributeError:
-                interfaceid = None
-
-            # Extract source bridge
-            try:
-                bridge = iface.find('source').get('bridge')
-            except AttributeError:
-                bridge = None
-
-            params['interfaceid'] = interfaceid
-            params['bridge'] = bridge
-
-            dom_stats = domain.interfaceStats(name)
-
-            # Retrieve previous values
-            prev = self.cache.get(name)
-
-            # Store values for next call
-            self.cache[name] = dom_stats
+                dom_stats = domain.interfaceStats(name)
+            vnics.append((name, mac_address, fref, params, dom_stats))
+        return vnics
 
+    def inspect_vnics(self, instance, duration):
+        for name, mac_address, fref, params, dom_stats, prev, __ in (
+                self._inspect_vnic_counters(instance, 'vnics')):
             if prev:
-                # Compute stats
-                rx_delta = dom_stats[0] - prev[0]
-                tx_delta = dom_stats[4] - prev[4]
-
-                # Avoid negative values
-                if rx_delta < 0:
-                    rx_delta = dom_stats[0]
-                if tx_delta < 0:
-                    tx_delta = dom_stats[4]
+                rx_delta = libvirt_utils.counter_delta(dom_stats[0], prev[0])
+                tx_delta = libvirt_utils.counter_delta(dom_stats[4], prev[4])
             else:
-                LOG.debug('No delta meter predecessor for %s / %s' %
-                          (instance.id, name))
                 rx_delta = 0
                 tx_delta = 0
 
             yield virt_inspector.InterfaceStats(name=name,
                                                 mac=mac_address,
                                                 fref=fref,
-                                                parameters=params,
+                                                parameters=dict(params),
                                                 rx_bytes=dom_stats[0],
                                                 rx_packets=dom_stats[1],
                                                 rx_errors=dom_stats[2],
@@ -153,40 +227,144 @@ class LibvirtInspector(virt_inspector.Inspector):
                                                 tx_drop=dom_stats[7],
                                                 tx_bytes_delta=tx_delta)
 
-    @staticmethod
-    def _get_disk_devices(domain):
-        tree = etree.fromstring(domain.XMLDesc(0))
-        return filter(bool, [target.get("dev") for target in
-                             tree.findall('devices/disk/target')
-                             if target.getparent().find('source') is not None])
+    def inspect_vnic_rates(self, instance, duration):
+        for name, mac_address, fref, params, dom_stats, prev, elapsed in (
+                self._inspect_vnic_counters(instance, 'vnic_rates')):
+            # NOTE: the rates are known from the second polling of a vNIC
+            if not prev or elapsed <= 0:
+                continue
+            yield virt_inspector.InterfaceRateStats(
+                name=name,
+                mac=mac_address,
+                fref=fref,
+                parameters=dict(params),
+                rx_bytes_rate=libvirt_utils.counter_delta(
+                    dom_stats[0], prev[0]) / elapsed,
+                tx_bytes_rate=libvirt_utils.counter_delta(
+                    dom_stats[4], prev[4]) / elapsed)
+
+    def _get_disk_devices(self, domain):
+        return self._xml_cache.disk_devices(domain)
 
-    @libvirt_utils.retry_on_disconnect
     def inspect_disks(self, instance, duration):
-        domain = self._get_domain_not_shut_off_or_raise(instance)
+        # NOTE: the disks are read once per polling cycle, the rates,
+        # latency and IOPS are computed from the same statistics
+        for disk in self._read_once_per_cycle(
+                ('disks', instance.id), lambda: self._read_disks(instance)):
+            yield disk
+
+    @libvirt_utils.retry_on_disconnect
+    def _read_disks(self, instance):
+        disks = []
+        loaded = self._get_loaded_stats(instance)
+        if loaded is not None:
+            domain = loaded[0]
+            disk_stats = self._get_device_stats(loaded[1], 'block')
+        else:
+            domain = self._get_domain_not_shut_off_or_raise(instance)
+            disk_stats = {}
         for device in self._get_disk_devices(domain):
+            fields = disk_stats.get(device)
+            if fields is not None and 'rd.reqs' in fields:
+                disks.append(virt_inspector.DiskStats(
+                    device=device,
+                    read_requests=fields['rd.reqs'],
+                    read_bytes=fields['rd.bytes'],
+                    write_requests=fields['wr.reqs'],
+                    write_bytes=fields['wr.bytes'],
+                    errors=fields.get('errs', -1),
+                    wr_total_times=fields['wr.times'],
+                    rd_total_times=fields['rd.times']))
+                continue
             try:
                 block_stats = domain.blockStats(device)
                 block_stats_flags = domain.blockStatsFlags(device, 0)
-                yield virt_inspector.DiskStats(
+                disks.append(virt_inspector.DiskStats(
                     device=device,
                     read_requests=block_stats[0], read_bytes=block_stats[1],
                     write_requests=block_stats[2], write_bytes=block_stats[3],
                     errors=block_stats[4],
                     wr_total_times=block_stats_flags['wr_total_times'],
-                    rd_total_times=block_stats_flags['rd_total_times'])
+                    rd_total_times=block_stats_flags['rd_total_times']))
             except libvirt.libvirtError as ex:
                 # raised error even if lock is acquired while live migration,
                 # even it looks normal.
                 LOG.warning(_("Error from libvirt while checking blockStats, "
                               "This may not be harmful, but please check : "
                               "%(ex)s") % {'ex': ex})
-                pass
+        return disks
+
+    def _inspect_disk_counters(self, instance, kind):
+        """Return the disk statistics with the previous ones for this kind.
+
+        :return: for each disk polled before, its statistics, the previous
+                 statistics and the seconds elapsed since then.
+        """
+        for disk in self.inspect_disks(instance, None):
+            prev, elapsed = self.counters.update(
+                (kind, instance.id, disk.device), disk)
+            # NOTE: the rates are known from the second polling of a disk
+            if prev is None or elapsed <= 0:
+                LOG.debug('No delta meter predecessor for %s / %s' %
+                          (instance.id, disk.device))
+                continue
+            yield disk, prev, elapsed
+
+    def inspect_disk_rates(self, instance, duration):
+        delta = libvirt_utils.counter_delta
+        for disk, prev, elapsed in self._inspect_disk_counters(
+                instance, 'disk_rates'):
+            yield virt_inspector.DiskRateStats(
+                device=disk.device,
+                read_bytes_rate=delta(
+                    disk.read_bytes, prev.read_bytes) / elapsed,
+                read_requests_rate=delta(
+                    disk.read_requests, prev.read_requests) / elapsed,
+                write_bytes_rate=delta(
+                    disk.write_bytes, prev.write_bytes) / elapsed,
+                write_requests_rate=delta(
+                    disk.write_requests, prev.write_requests) / elapsed)
+
+    def inspect_disk_latency(self, instance, duration):
+        delta = libvirt_utils.counter_delta
+        for disk, prev, __ in self._inspect_disk_counters(
+                instance, 'disk_latency'):
+            requests = (delta(disk.read_requests, prev.read_requests) +
+                        delta(disk.write_requests, prev.write_requests))
+            total_times = (delta(disk.rd_total_times, prev.rd_total_times) +
+                           delta(disk.wr_total_times, prev.wr_total_times))
+            # NOTE: the total times of libvirt are in nanoseconds
+            yield virt_inspector.DiskLatencyStats(
+                device=disk.device,
+                disk_latency=(total_times / requests / units.M
+                              if requests else 0))
+
+    def inspect_disk_iops(self, instance, duration):
+        delta = libvirt_utils.counter_delta
+        for disk, prev, elapsed in self._inspect_disk_counters(
+                instance, 'disk_iops'):
+            requests = (delta(disk.read_requests, prev.read_requests) +
+                        delta(disk.write_requests, prev.write_requests))
+            yield virt_inspector.DiskIOPSStats(device=disk.device,
+                                               iops_count=requests / elapsed)
 
     @libvirt_utils.retry_on_disconnect
     def inspect_disk_info(self, instance, duration):
-        domain = self._get_domain_not_shut_off_or_raise(instance)
+        loaded = self._get_loaded_stats(instance)
+        if loaded is not None:
+            domain = loaded[0]
+            disk_stats = self._get_device_stats(loaded[1], 'block')
+        else:
+            domain = self._get_domain_not_shut_off_or_raise(instance)
+            disk_stats = {}
         for device in self._get_disk_devices(domain):
-            block_info = domain.blockInfo(device)
+            fields = disk_stats.get(device, {})
+            if ('capacity' in fields and 'allocation' in fields and
+                    'physical' in fields):
+                block_info = (fields['capacity'], fields['allocation'],
+                              fields['physical'])
+            else:
+                block_info = domain.blockInfo(device)
             # if vm mount cdrom, libvirt will align by 4K bytes, capacity may
             # be smaller than physical, avoid with this.
             # https://libvirt.org/html/libvirt-libvirt-domain.html
@@ -199,11 +377,20 @@ class LibvirtInspector(virt_inspector.Inspector):
     @libvirt_utils.raise_nodata_if_unsupported
     @libvirt_utils.retry_on_disconnect
     def inspect_instance(self, instance, duration=None):
-        domain = self._get_domain_not_shut_off_or_raise(instance)
+        loaded = self._get_loaded_stats(instance)
+        if loaded is not None:
+            stats = loaded[1]
+            # NOTE: the balloon statistics are the ones of memoryStats
+            memory_stats = dict((key[len('balloon.'):], value)
+                                for key, value in stats.items()
+                                if key.startswith('balloon.'))
+        else:
+            domain = self._get_domain_not_shut_off_or_raise(instance)
+            memory_stats = domain.memoryStats()
+            stats = self.connection.domainListGetStats([domain], 0)[0][1]
 
         memory_used = memory_resident = None
         memory_swap_in = memory_swap_out = None
-        memory_stats = domain.memoryStats()
         # Stat provided from libvirt is in KB, converting it to MB.
         if 'usable' in memory_stats and 'available' in memory_stats:
             memory_used = (memory_stats['available'] -
@@ -217,9 +404,6 @@ class LibvirtInspector(virt_inspector.Inspector):
             memory_swap_in = memory_stats['swap_in'] / units.Ki
             memory_swap_out = memory_stats['swap_out'] / units.Ki
 
-        # TODO(sileht): stats also have the disk/vnic info
-        # we could use that instead of the old method for Queen
-        stats = self.connection.domainListGetStats([domain], 0)[0][1]
         cpu_time = 0
         current_cpus = stats.get('vcpu.current')
         # Iterate over the maximum number of CPUs here, and count the
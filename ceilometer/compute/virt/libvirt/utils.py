@@ -13,6 +13,12 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import threading
+import time
+from time import monotonic as now
+
+import cachetools
+from lxml import etree
 from oslo_config import cfg
 from oslo_log import log as logging
 import tenacity
@@ -24,6 +30,7 @@ except ImportError:
 
 from ceilometer.compute.virt import inspector as virt_inspector
 from ceilometer.i18n import _
+from ceilometer import utils
 
 LOG = logging.getLogger(__name__)
 
@@ -36,6 +43,33 @@ OPTS = [
                default='',
                help='Override the default libvirt URI '
                     '(which is dependent on libvirt_type).'),
+    cfg.BoolOpt('libvirt_bulk_stats',
+                default=False,
+                help='Get the statistics of all the domains with a single '
+                     'getAllDomainStats call at the beginning of each '
+                     'polling cycle, instead of querying each domain and '
+                     'device for each meter.'),
+    cfg.IntOpt('libvirt_domain_xml_cache_ttl',
+               default=0,
+               min=0,
+               help='Number of seconds the parsed description and the nova '
+                    'metadata of a domain are shared by the instance '
+                    'discovery and the inspector. The entry of a domain is '
+                    'also dropped when the domain is restarted. 0 disables '
+                    'the cache.'),
+    cfg.IntOpt('libvirt_counter_cache_size',
+               default=16384,
+               min=1,
+               help='Maximum number of devices of the instances for which '
+                    'the last counters read are kept to compute the deltas '
+                    'and the rates of the counters. The least recently '
+                    'used devices are dropped first.'),
+    cfg.IntOpt('libvirt_counter_cache_ttl',
+               default=3600,
+               min=1,
+               help='Number of seconds the last counters read of a device '
+                    'are kept. It must be larger than the polling interval '
+                    'of the delta and rate meters.'),
 ]
 
 LIBVIRT_PER_TYPE_URIS = dict(uml='uml:///system', lxc='lxc:///')
@@ -51,6 +85,19 @@ VIR_DOMAIN_SHUTOFF = 5
 VIR_DOMAIN_CRASHED = 6
 VIR_DOMAIN_PMSUSPENDED = 7
 
+# Domain events and errors
+VIR_DOMAIN_EVENT_ID_LIFECYCLE = 0
+VIR_ERR_NO_DOMAIN = 42
+
+# Statistics groups of getAllDomainStats
+VIR_DOMAIN_STATS_STATE = 1
+VIR_DOMAIN_STATS_CPU_TOTAL = 2
+VIR_DOMAIN_STATS_BALLOON = 4
+VIR_DOMAIN_STATS_VCPU = 8
+VIR_DOMAIN_STATS_INTERFACE = 16
+VIR_DOMAIN_STATS_BLOCK = 32
+VIR_DOMAIN_STATS_PERF = 64
+
 # Stolen from nova
 LIBVIRT_POWER_STATE = {
     VIR_DOMAIN_NOSTATE: 'pending',
@@ -102,6 +149,34 @@ def refresh_libvirt_connection(conf, klass):
     return connection
 
 
+_EVENT_LOOP = None
+_EVENT_LOOP_LOCK = threading.Lock()
+
+
+def _run_event_loop():
+    while True:
+        try:
+            libvirt.virEventRunDefaultImpl()
+        except Exception:
+            LOG.exception('Fail to run the libvirt event loop')
+            time.sleep(1)
+
+
+def start_event_loop():
+    """Start the libvirt default event loop, once per process.
+
+    The connections opened afterwards dispatch their domain events from
+    the event loop thread.
+    """
+    global _EVENT_LOOP
+    if not libvirt:
+        raise ImportError("python-libvirt module is missing")
+    with _EVENT_LOOP_LOCK:
+        if _EVENT_LOOP is None:
+            libvirt.virEventRegisterDefaultImpl()
+            _EVENT_LOOP = utils.spawn_thread(_run_event_loop)
+
+
 def is_disconnection_exception(e):
     if not libvirt:
         return False
@@ -159,3 +234,175 @@ def instance_metadata(domain):
             domain.UUIDString(), last_error
         )
     return xml_string
+
+
+def parse_interfaces(tree):
+    """Return the name, MAC, filter and filter parameters of the vNICs."""
+    interfaces = []
+    for iface in tree.findall('devices/interface'):
+        target = iface.find('target')
+        if target is not None:
+            name = target.get('dev')
+        else:
+            continue
+        mac = iface.find('mac')
+        if mac is not None:
+            mac_address = mac.get('address')
+        else:
+            continue
+        fref = iface.find('filterref')
+        if fref is not None:
+            fref = fref.get('filter')
+
+        params = dict((p.get('name').lower(), p.get('value'))
+                      for p in iface.findall('filterref/parameter'))
+
+        # Extract interface ID
+        try:
+            interfaceid = iface.find('virtualport').find(
+                'parameters').get('interfaceid')
+        except AttributeError:
+            interfaceid = None
+
+        # Extract source bridge
+        try:
+            bridge = iface.find('source').get('bridge')
+        except AttributeError:
+            bridge = None
+
+        params['interfaceid'] = interfaceid
+        params['bridge'] = bridge
+        interfaces.append((name, mac_address, fref, params))
+    return interfaces
+
+
+def parse_disk_devices(tree):
+    """Return the target device of the disks which have a source."""
+    return [dev for dev in (target.get("dev") for target in
+                            tree.findall('devices/disk/target')
+                            if target.getparent().find('source') is not None)
+            if dev]
+
+
+class DomainXMLCache(object):
+    """Parsed domain descriptions and nova metadata, by domain UUID.
+
+    The entry of a domain is dropped when its ID changes, which happens
+    when the domain is restarted, after ttl seconds, when invalidate() is
+    called for the domain and when invalidate_all() bumps the generation.
+    With a ttl of 0, nothing is cached.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.generation = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _get(self, domain, field, loader):
+        if not self.ttl:
+            return loader(domain)
+        uuid = domain.UUIDString()
+        key = (self.generation, domain.ID())
+        with self._lock:
+            entry = self._entries.get(uuid)
+            if (entry is None or entry['key'] != key or
+                    entry['expires'] <= now()):
+                entry = {'key': key, 'expires': now() + self.ttl}
+                self._entries[uuid] = entry
+        try:
+            return entry[field]
+        except KeyError:
+            value = entry[field] = loader(domain)
+            return value
+
+    def xml(self, domain):
+        """Return the parsed description of a domain."""
+        return self._get(domain, 'xml',
+                         lambda d: etree.fromstring(d.XMLDesc()))
+
+    def metadata(self, domain):
+        """Return the nova metadata of a domain, see instance_metadata."""
+        return self._get(domain, 'metadata', instance_metadata)
+
+    def interfaces(self, domain):
+        """Return the vNICs of a domain, see parse_interfaces."""
+        return self._get(domain, 'interfaces',
+                         lambda d: parse_interfaces(self.xml(d)))
+
+    def disk_devices(self, domain):
+        """Return the disk devices of a domain, see parse_disk_devices."""
+        return self._get(domain, 'disk_devices',
+                         lambda d: parse_disk_devices(self.xml(d)))
+
+    def invalidate(self, uuid):
+        with self._lock:
+            self._entries.pop(uuid, None)
+
+    def invalidate_all(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def retain(self, uuids):
+        """Drop the entries of the domains not in uuids."""
+        uuids = set(uuids)
+        with self._lock:
+            for uuid in list(self._entries):
+                if uuid not in uuids:
+                    del self._entries[uuid]
+
+
+class CounterStore(object):
+    """Last counters read from the devices of the instances.
+
+    The counters are stored by key, which must identify the instance and
+    the device, e.g. the instance id, the MAC address and the name of an
+    interface, so a device name reused by another instance doesn't mix
+    the counters of both devices. A bounded number of keys is kept and
+    each key expires after ttl seconds without update.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self._counters = cachetools.TTLCache(maxsize, ttl, timer=now)
+        self._lock = threading.Lock()
+
+    def update(self, key, counters):
+        """Store the counters of key.
+
+        :return: the previous counters of key and the number of seconds
+                 elapsed since they were stored, or (None, None).
+        """
+        timestamp = now()
+        with self._lock:
+            previous = self._counters.get(key)
+            self._counters[key] = (timestamp, counters)
+        if previous is None:
+            return None, None
+        return previous[1], timestamp - previous[0]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._counters)
+
+
+def counter_delta(current, previous):
+    """Return the delta of a counter, which may have been reset."""
+    delta = current - previous
+    return current if delta < 0 else delta
+
+
+_DOMAIN_XML_CACHE = None
+_DOMAIN_XML_CACHE_LOCK = threading.Lock()
+
+
+def get_domain_xml_cache(conf):
+    """Return the domain XML cache shared in the process."""
+    global _DOMAIN_XML_CACHE
+    with _DOMAIN_XML_CACHE_LOCK:
+        if _DOMAIN_XML_CACHE is None:
+            _DOMAIN_XML_CACHE = DomainXMLCache(
+                conf.libvirt_domain_xml_cache_ttl)
+        else:
+            _DOMAIN_XML_CACHE.ttl = conf.libvirt_domain_xml_cache_ttl
+    return _DOMAIN_XML_CACHE
@@ -12,7 +12,9 @@
 # under the License.
 
 import os
+import types
 
+from jsonpath_rw import jsonpath
 from jsonpath_rw_ext import parser
 from oslo_log import log
 import yaml
@@ -58,6 +60,101 @@ class NonOpenStackApisDynamicPollsterException\
     pass
 
 
+class DirectMatch(object):
+    """Result of a compiled getter, standing in for a jsonpath match."""
+
+    __slots__ = ('path', 'value')
+
+    def __init__(self, path, value):
+        self.path = path
+        self.value = value
+
+
+def _compile_branches(expr, at_root=True):
+    """Flatten a simple jsonpath expression into a list of direct paths.
+
+    Each branch is a (path, steps) tuple where steps is a sequence of
+    (is_index, key) lookups. Only expressions made of the root, plain
+    fields, indexes, children and unions are supported, anything else
+    returns None and is left to the jsonpath engine.
+    """
+    expr_type = type(expr)
+    if expr_type is jsonpath.Root and at_root:
+        return [((), ())]
+    if expr_type is jsonpath.Fields:
+        if '*' in expr.fields or jsonpath.auto_id_field is not None:
+            return None
+        return [((field,), ((False, field),)) for field in expr.fields]
+    if expr_type is jsonpath.Index:
+        return [((str(expr),), ((True, expr.index),))]
+    if expr_type is jsonpath.Child:
+        left = _compile_branches(expr.left, at_root)
+        right = left and _compile_branches(expr.right, False)
+        if not right:
+            return None
+        return [(lpath + rpath, lsteps + rsteps)
+                for lpath, lsteps in left
+                for rpath, rsteps in right]
+    if expr_type is jsonpath.Union:
+        left = _compile_branches(expr.left, at_root)
+        right = left and _compile_branches(expr.right, at_root)
+        if not right:
+            return None
+        return left + right
+    return None
+
+
+def compile_direct_getter(expr):
+    """Compile a parsed jsonpath expression into a plain dict-walk getter.
+
+    The getter returns the same values, in the same order, as the
+    expression's find() method but as DirectMatch objects. Like find(), it
+    is bound to the expression. None is returned when the expression is
+    too complex to be compiled.
+    """
+    branches = _compile_branches(expr)
+    if not branches:
+        return None
+    branches = [('.'.join(path), steps) for path, steps in branches]
+
+    def find(expr, obj):
+        matches = []
+        for path, steps in branches:
+            value = obj
+            for is_index, key in steps:
+                if is_index:
+                    # NOTE: same checks as jsonpath_rw.jsonpath.Index
+                    if len(value) <= key:
+                        break
+                    value = value[key]
+                else:
+                    try:
+                        value = value[key]
+                    except (TypeError, KeyError, AttributeError):
+                        break
+            else:
+                matches.append(DirectMatch(path, value))
+        return matches
+    return types.MethodType(find, expr)
+
+
+def compiled_root_fields(expr):
+    """Return the top level fields read by a compilable expression.
+
+    None is returned when the expression can't be compiled, or reads the
+    whole object.
+    """
+    branches = _compile_branches(expr)
+    if not branches:
+        return None
+    fields = set()
+    for path, steps in branches:
+        if not steps or steps[0][0]:
+            return None
+        fields.add(steps[0][1])
+    return frozenset(fields)
+
+
 class Definition(object):
     JSONPATH_RW_PARSER = parser.ExtentedJsonPathParser()
     GETTERS_CACHE = {}
@@ -66,6 +163,9 @@ class Definition(object):
         self.cfg = cfg
         self.name = name
         self.plugin = None
+        # NOTE: the top level fields of the parsed objects used by the
+        # definition, None if unknown
+        self.root_fields = None
         if isinstance(cfg, dict):
             if 'fields' not in cfg:
                 raise DefinitionException(
@@ -112,6 +212,7 @@ class Definition(object):
 
         if isinstance(fields, int):
             self.getter = fields
+            self.root_fields = frozenset()
         else:
             try:
                 self.getter = self.make_getter(fields)
@@ -122,6 +223,10 @@ class Definition(object):
                     % dict(jsonpath=fields, name=name, err=e), self.cfg)
 
     def _get_path(self, match):
+        if isinstance(match, DirectMatch):
+            if match.path:
+                yield match.path
+            return
         if match.context is not None:
             for path_element in self._get_path(match.context):
                 yield path_element
@@ -153,12 +258,15 @@ class Definition(object):
             return values[0] if values else None
 
     def make_getter(self, fields):
-        if fields in self.GETTERS_CACHE:
-            return self.GETTERS_CACHE[fields]
-        else:
-            getter = self.JSONPATH_RW_PARSER.parse(fields).find
-            self.GETTERS_CACHE[fields] = getter
-            return getter
+        if fields not in self.GETTERS_CACHE:
+            expr = self.JSONPATH_RW_PARSER.parse(fields)
+            getter = compile_direct_getter(expr)
+            root_fields = compiled_root_fields(expr) if getter else None
+            self.GETTERS_CACHE[fields] = (getter or expr.find, root_fields)
+        getter, root_fields = self.GETTERS_CACHE[fields]
+        if self.plugin is None:
+            self.root_fields = root_fields
+        return getter
 
 
 def load_definitions(conf, defaults, config_file, fallback_file=None):
@@ -14,7 +14,9 @@
 # under the License.
 
 import fnmatch
+import threading
 
+import cachetools
 from oslo_config import cfg
 from oslo_log import log
 from oslo_utils import timeutils
@@ -238,29 +240,60 @@ class NotificationEventsConverter(object):
 
     """
 
+    RESOLUTION_CACHE_SIZE = 1024
+
     def __init__(self, conf, events_config, trait_plugin_mgr):
         self.conf = conf
 
+        self._lock = threading.Lock()
+
         raw_levels = [level.lower() for level in self.conf.event.store_raw]
-        self.definitions = [
+        definitions = [
             EventDefinition(event_def, trait_plugin_mgr, raw_levels)
             for event_def in reversed(events_config)]
 
         add_catchall = not self.conf.event.drop_unmatched_notifications
-        if add_catchall and not any(d.is_catchall for d in self.definitions):
+        if add_catchall and not any(d.is_catchall for d in definitions):
             event_def = dict(event_type='*', traits={})
-            self.definitions.append(EventDefinition(event_def,
-                                                    trait_plugin_mgr,
-                                                    raw_levels))
+            definitions.append(EventDefinition(event_def,
+                                               trait_plugin_mgr,
+                                               raw_levels))
+        self.definitions = definitions
+
+    @property
+    def definitions(self):
+        return self._definitions
+
+    @definitions.setter
+    def definitions(self, definitions):
+        # NOTE: the resolution of an event_type only depends on the
+        # definitions, so forget every resolved type when they change
+        with self._lock:
+            self._definitions = definitions
+            self._resolved = cachetools.LRUCache(
+                maxsize=self.RESOLUTION_CACHE_SIZE)
+
+    def _resolve_definition(self, event_type):
+        for d in self._definitions:
+            if d.match_type(event_type):
+                return d
+
+    def get_definition(self, event_type):
+        """Return the definition handling event_type, or None."""
+        with self._lock:
+            try:
+                return self._resolved[event_type]
+            except KeyError:
+                pass
+        edef = self._resolve_definition(event_type)
+        with self._lock:
+            self._resolved[event_type] = edef
+        return edef
 
     def to_event(self, priority, notification_body):
         event_type = notification_body['event_type']
         message_id = notification_body['metadata']['message_id']
-        edef = None
-        for d in self.definitions:
-            if d.match_type(event_type):
-                edef = d
-                break
+        edef = self.get_definition(event_type)
 
         if edef is None:
             msg = (_('Dropping Notification %(type)s (uuid:%(msgid)s)')
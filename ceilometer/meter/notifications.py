@@ -14,6 +14,9 @@ import glob
 import itertools
 import os
 import re
+import threading
+
+import cachetools
 
 from ceilometer import cache_utils
 from oslo_config import cfg
@@ -166,29 +169,121 @@ class MeterDefinition(object):
 
             # NOTE(sileht): Transform the sample with multiple values per
             # attribute into multiple samples with one value per attribute.
-            for values in zip(*samples_values):
-                sample = dict((attributes[idx], value)
-                              for idx, value in enumerate(values))
-
-                if (
-                    self.conf.polling.tenant_name_discovery and
-                    self._cache
-                ):
-                    # populate user_name and project_name fields in the sample
-                    # created from notifications
+            samples = [dict((attributes[idx], value)
+                            for idx, value in enumerate(values))
+                       for values in zip(*samples_values)]
+
+            if (
+                self.conf.polling.tenant_name_discovery and
+                self._cache
+            ):
+                # populate user_name and project_name fields in the samples
+                # created from notifications, resolving the IDs at once
+                user_names = self._cache.resolve_uuids_from_cache(
+                    'users', [sample['user_id'] for sample in samples])
+                project_names = self._cache.resolve_uuids_from_cache(
+                    'projects', [sample['project_id'] for sample in samples])
+                for sample in samples:
                     if sample['user_id']:
-                        sample['user_name'] = \
-                            self._cache.resolve_uuid_from_cache(
-                                'users', sample['user_id'])
+                        sample['user_name'] = user_names.get(
+                            sample['user_id'])
                     if sample['project_id']:
-                        sample['project_name'] = \
-                            self._cache.resolve_uuid_from_cache(
-                                'projects', sample['project_id'])
+                        sample['project_name'] = project_names.get(
+                            sample['project_id'])
+            for sample in samples:
                 yield sample
         else:
             yield sample
 
 
+# Characters which end the literal head of an event_type regex
+_REGEX_SPECIAL = frozenset('\\[](){}*+?|^$')
+
+
+class _TrieNode(object):
+    __slots__ = ('children', 'entries')
+
+    def __init__(self):
+        self.children = {}
+        self.entries = []
+
+
+class EventTypeIndex(object):
+    """Dispatch index from notification event_type to meter definitions.
+
+    The event_type patterns of the definitions are regular expressions
+    applied with ``re.match``, so they only anchor at the beginning of the
+    event_type and ``.`` matches any character. The literal head of each
+    pattern is stored in a character trie where ``.`` is a wildcard edge;
+    walking the trie with an event_type yields the few candidate patterns
+    which are then confirmed with the regex. Resolved event_types are
+    memoized in a bounded LRU, so notifications of an already seen type,
+    matched or not, cost a single dict lookup.
+    """
+
+    def __init__(self, definitions, cache_size=1024):
+        self._definitions = list(definitions)
+        self._root = _TrieNode()
+        for idx, definition in enumerate(self._definitions):
+            for regex in definition._event_type:
+                node = self._root
+                for c in self._literal_head(regex.pattern):
+                    node = node.children.setdefault(c, _TrieNode())
+                node.entries.append((idx, regex))
+        self._cache = cachetools.LRUCache(maxsize=cache_size)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _literal_head(pattern):
+        # NOTE: an alternation anywhere may make any prefix optional
+        if '|' in pattern:
+            return ''
+        head = []
+        for c in pattern:
+            if c in _REGEX_SPECIAL:
+                if c in '*?{' and head:
+                    # the previous character is optional
+                    head.pop()
+                break
+            head.append(c)
+        return ''.join(head)
+
+    def _candidates(self, event_type):
+        entries = list(self._root.entries)
+        nodes = [self._root]
+        for c in event_type:
+            next_nodes = []
+            for node in nodes:
+                child = node.children.get(c)
+                if child is not None:
+                    next_nodes.append(child)
+                if c not in ('.', '\n'):
+                    child = node.children.get('.')
+                    if child is not None:
+                        next_nodes.append(child)
+            if not next_nodes:
+                break
+            for node in next_nodes:
+                entries.extend(node.entries)
+            nodes = next_nodes
+        return entries
+
+    def _resolve(self, event_type):
+        matched = set(idx for idx, regex in self._candidates(event_type)
+                      if regex.match(event_type))
+        return tuple(self._definitions[idx] for idx in sorted(matched))
+
+    def lookup(self, event_type):
+        """Return the definitions matching event_type, in load order."""
+        with self._lock:
+            definitions = self._cache.get(event_type)
+        if definitions is None:
+            definitions = self._resolve(event_type)
+            with self._lock:
+                self._cache[event_type] = definitions
+        return definitions
+
+
 class ProcessMeterNotifications(endpoint.SampleEndpoint):
 
     event_types = []
@@ -197,6 +292,15 @@ class ProcessMeterNotifications(endpoint.SampleEndpoint):
         super(ProcessMeterNotifications, self).__init__(conf, publisher)
         self.definitions = self._load_definitions()
 
+    @property
+    def definitions(self):
+        return self._definitions
+
+    @definitions.setter
+    def definitions(self, definitions):
+        self._definitions = definitions
+        self._index = EventTypeIndex(definitions)
+
     def _load_definitions(self):
         plugin_manager = extension.ExtensionManager(
             namespace='ceilometer.event.trait_plugin')
@@ -226,7 +330,6 @@ class ProcessMeterNotifications(endpoint.SampleEndpoint):
         return definitions.values()
 
     def build_sample(self, notification):
-        for d in self.definitions:
-            if d.match_type(notification['event_type']):
-                for s in d.to_samples(notification):
-                    yield sample_util.Sample.from_notification(**s)
+        for d in self._index.lookup(notification['event_type']):
+            for s in d.to_samples(notification):
+                yield sample_util.Sample.from_notification(**s)
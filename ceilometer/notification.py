@@ -23,6 +23,7 @@ from stevedore import named
 
 from ceilometer.i18n import _
 from ceilometer import messaging
+from ceilometer.pipeline import conversion
 
 
 LOG = log.getLogger(__name__)
@@ -51,6 +52,23 @@ OPTS = [
                help='Number of seconds to wait before dispatching samples '
                     'when batch_size is not reached (None means indefinitely).'
                ),
+    cfg.BoolOpt('batch_publish',
+                default=False,
+                help='Convert every notification of a batch received from '
+                     'the message bus before publishing, so that each '
+                     'sample publisher is called once per batch instead of '
+                     'once per notification. Only meaningful when '
+                     'batch_size is greater than 1.'),
+    cfg.IntOpt('conversion_workers',
+               default=0,
+               min=0,
+               help='Number of processes converting notifications into '
+                    'samples and events for each notification worker. '
+                    'Notifications are partitioned by resource, so the '
+                    'ones about the same resource are converted in order. '
+                    'Samples are then published once per batch, as with '
+                    'batch_publish. 0 converts the notifications in the '
+                    'listener threads.'),
     cfg.IntOpt('workers',
                default=1,
                min=1,
@@ -93,6 +111,7 @@ class NotificationService(cotyledon.Service):
         self.startup_delay = worker_id
         self.conf = conf
         self.listeners = []
+        self.conversion_pool = None
 
     def get_targets(self):
         """Return a sequence of oslo_messaging.Target
@@ -117,6 +136,10 @@ class NotificationService(cotyledon.Service):
 
         super(NotificationService, self).run()
 
+        if self.conf.notification.conversion_workers:
+            self.conversion_pool = conversion.ConversionPool(
+                self.conf, self.conf.notification.conversion_workers)
+
         self.managers = [ext.obj for ext in named.NamedExtensionManager(
             namespace='ceilometer.notification.pipeline',
             names=self.conf.notification.pipelines, invoke_on_load=True,
@@ -137,6 +160,8 @@ class NotificationService(cotyledon.Service):
             LOG.debug("Loaded endpoints [%s] for manager [%s].",
                       endpoint, pipe_mgr)
             endpoints.extend(endpoint)
+        for endpoint in endpoints:
+            endpoint.conversion_pool = self.conversion_pool
         targets = self.get_targets()
 
         urls = self.conf.notification.messaging_urls or [None]
@@ -164,5 +189,7 @@ class NotificationService(cotyledon.Service):
 
     def terminate(self):
         self.kill_listeners(self.listeners)
+        if self.conversion_pool is not None:
+            self.conversion_pool.shutdown()
 
         super(NotificationService, self).terminate()
@@ -12,7 +12,9 @@
 # under the License.
 
 import functools
+import threading
 
+import cachetools
 import glanceclient
 import novaclient
 from novaclient import api_versions
@@ -28,8 +30,31 @@ SERVICE_OPTS = [
                help='Nova service type.'),
 ]
 
+OPTS = [
+    cfg.IntOpt('nova_lookup_cache_ttl',
+               default=0,
+               min=0,
+               help='Number of seconds the flavors and images of the '
+                    'instances, including the ones not found, are kept '
+                    'between two instance discoveries using the Nova API. '
+                    '0 only keeps them during a discovery.'),
+    cfg.IntOpt('nova_lookup_cache_size',
+               default=1024,
+               min=1,
+               help='Maximum number of flavors and of images kept when '
+                    'nova_lookup_cache_ttl is set. The least recently used '
+                    'ones are dropped first.'),
+    cfg.BoolOpt('nova_prefetch_flavors',
+                default=False,
+                help='Get all the flavors with a single request when the '
+                     'flavor of some of the discovered instances is not '
+                     'known, instead of getting each flavor.'),
+]
+
 LOG = log.getLogger(__name__)
 
+_MISSING = object()
+
 
 def logged(func):
 
@@ -69,25 +94,66 @@ class Client(object):
             interface=creds.interface,
             service_type=conf.service_types.glance)
 
+        ttl = conf.compute.nova_lookup_cache_ttl
+        if ttl:
+            size = conf.compute.nova_lookup_cache_size
+            self._flavor_cache = cachetools.TTLCache(size, ttl)
+            self._image_cache = cachetools.TTLCache(size, ttl)
+        else:
+            self._flavor_cache = self._image_cache = None
+        self._cache_lock = threading.Lock()
+        self._prefetch_flavors = conf.compute.nova_prefetch_flavors
+
     def _with_flavor_and_image(self, instances):
-        flavor_cache = {}
-        image_cache = {}
+        flavor_cache = (self._flavor_cache if self._flavor_cache is not None
+                        else {})
+        image_cache = (self._image_cache if self._image_cache is not None
+                       else {})
+        if self._prefetch_flavors:
+            self._prefetch(instances, flavor_cache)
         for instance in instances:
             self._with_flavor(instance, flavor_cache)
             self._with_image(instance, image_cache)
 
         return instances
 
+    def _lookup(self, cache, key, getter, not_found):
+        """Return the cached value of key, or get and cache it.
+
+        None is cached and returned when getter raises not_found.
+        """
+        with self._cache_lock:
+            value = cache.get(key, _MISSING)
+        if value is _MISSING:
+            try:
+                value = getter(key)
+            except not_found:
+                value = None
+            with self._cache_lock:
+                cache[key] = value
+        return value
+
+    def _prefetch(self, instances, cache):
+        with self._cache_lock:
+            missing = set(instance.flavor['id'] for instance in instances
+                          if instance.flavor['id'] not in cache)
+        if not missing:
+            return
+        try:
+            flavors = self.nova_client.flavors.list(detailed=True,
+                                                    is_public=None)
+        except Exception as e:
+            LOG.warning('Fail to list the flavors, getting them one by '
+                        'one: %s', e)
+            return
+        with self._cache_lock:
+            for flavor in flavors:
+                cache[flavor.id] = flavor
+
     def _with_flavor(self, instance, cache):
         fid = instance.flavor['id']
-        if fid in cache:
-            flavor = cache.get(fid)
-        else:
-            try:
-                flavor = self.nova_client.flavors.get(fid)
-            except novaclient.exceptions.NotFound:
-                flavor = None
-            cache[fid] = flavor
+        flavor = self._lookup(cache, fid, self.nova_client.flavors.get,
+                              novaclient.exceptions.NotFound)
 
         attr_defaults = [('name', 'unknown-id-%s' % fid),
                          ('vcpus', 0), ('ram', 0), ('disk', 0),
@@ -108,14 +174,8 @@ class Client(object):
             instance.ramdisk_id = None
             return
 
-        if iid in cache:
-            image = cache.get(iid)
-        else:
-            try:
-                image = self.glance_client.images.get(iid)
-            except glanceclient.exc.HTTPNotFound:
-                image = None
-            cache[iid] = image
+        image = self._lookup(cache, iid, self.glance_client.images.get,
+                             glanceclient.exc.HTTPNotFound)
 
         attr_defaults = [('kernel_id', None),
                          ('ramdisk_id', None)]
@@ -17,6 +17,7 @@ import socket
 from keystoneauth1 import loading
 from oslo_config import cfg
 
+import ceilometer.cache_utils
 import ceilometer.compute.discovery
 import ceilometer.compute.virt.inspector
 import ceilometer.compute.virt.libvirt.utils
@@ -66,7 +67,8 @@ def list_opts():
     # This have been removed due to a recursive import issue
     return [
         ('DEFAULT',
-         itertools.chain(ceilometer.compute.virt.inspector.OPTS,
+         itertools.chain(ceilometer.cache_utils.OPTS,
+                         ceilometer.compute.virt.inspector.OPTS,
                          ceilometer.compute.virt.libvirt.utils.OPTS,
                          ceilometer.objectstore.swift.OPTS,
                          ceilometer.pipeline.base.OPTS,
@@ -74,7 +76,9 @@ def list_opts():
                          ceilometer.sample.OPTS,
                          ceilometer.utils.OPTS,
                          OPTS)),
-        ('compute', ceilometer.compute.discovery.OPTS),
+        ('compute',
+         itertools.chain(ceilometer.compute.discovery.OPTS,
+                         ceilometer.nova_client.OPTS)),
         ('coordination', [
             cfg.StrOpt(
                 'backend_url',
@@ -21,6 +21,7 @@ from oslo_log import log
 import oslo_messaging
 
 from ceilometer import agent
+from ceilometer.pipeline import conversion
 from ceilometer import publisher
 
 OPTS = [
@@ -310,6 +311,9 @@ class NotificationEndpoint(object):
     event_types = []
     """List of strings to filter messages on."""
 
+    conversion_pool = None
+    """Optional pool of processes converting the notifications."""
+
     def __init__(self, conf, publisher):
         super(NotificationEndpoint, self).__init__()
         # NOTE(gordc): this is filter rule used by oslo.messaging to dispatch
@@ -327,6 +331,21 @@ class NotificationEndpoint(object):
         :param message: Message to process.
         """
 
+    def convert_notification(self, priority, notification):
+        """Return the list of samples or events built from a notification.
+
+        :param priority: Priority of the notification.
+        :param notification: Notification to convert.
+        """
+        raise NotImplementedError()
+
+    def _convert_notifications(self, priority, notifications):
+        if self.conversion_pool is not None:
+            return self.conversion_pool.convert(self, priority,
+                                                notifications)
+        return conversion.convert_notifications(self, priority,
+                                                notifications)
+
     @classmethod
     def _consume_and_drop(cls, notifications):
         """RPC endpoint for useless notification level"""
@@ -0,0 +1,166 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Conversion of notifications into samples and events."""
+
+from concurrent import futures
+from concurrent.futures import process
+import multiprocessing
+import threading
+
+from oslo_log import log
+
+LOG = log.getLogger(__name__)
+
+# NOTE: state of a conversion worker process, the configuration is
+# sent by the notification agent and the endpoints are loaded
+# on first use so each process holds its own copy of the definitions.
+_WORKER_CONF = None
+_WORKER_ENDPOINTS = {}
+
+
+def convert_notifications(endpoint, priority, notifications):
+    """Convert notifications with endpoint, isolating failures.
+
+    :return: a list with, for each notification, a tuple of the converted
+             items and the exception raised while converting it, if any.
+    """
+    results = []
+    for message in notifications:
+        try:
+            results.append((endpoint.convert_notification(priority, message),
+                            None))
+        except Exception as e:
+            LOG.error('Fail to process notification message [%s]'
+                      % message, exc_info=True)
+            results.append(([], e))
+    return results
+
+
+def _init_worker(conf):
+    global _WORKER_CONF
+    _WORKER_CONF = conf
+    _WORKER_ENDPOINTS.clear()
+
+
+def _convert_in_worker(endpoint_cls, priority, notifications):
+    endpoint = _WORKER_ENDPOINTS.get(endpoint_cls)
+    if endpoint is None:
+        endpoint = endpoint_cls(_WORKER_CONF, None)
+        _WORKER_ENDPOINTS[endpoint_cls] = endpoint
+    return convert_notifications(endpoint, priority, notifications)
+
+
+def _noop():
+    pass
+
+
+def resource_key(message):
+    """Return the key used to partition a notification."""
+    payload = message.get('payload')
+    if isinstance(payload, dict):
+        payload = payload.get('nova_object.data', payload)
+        for field in ('resource_id', 'instance_id', 'instance_uuid', 'uuid',
+                      'id'):
+            value = payload.get(field)
+            if value:
+                return str(value)
+    return str(message.get('publisher_id'))
+
+
+class ConversionPool(object):
+    """Pool of processes converting notifications for the endpoints.
+
+    Each partition is served by its own single process executor and
+    notifications are partitioned by resource, so the notifications of a
+    resource are always converted by the same process, in order. The
+    processes share nothing with the agent but the configuration.
+    """
+
+    def __init__(self, conf, workers):
+        self._conf = conf
+        self._executors_lock = threading.Lock()
+        # NOTE: the processes are spawned and not forked, the processes
+        # replacing the dead ones are started while the listener threads
+        # run and a forked process could inherit a lock held by one of them
+        self._mp_context = multiprocessing.get_context('spawn')
+        self._executors = [self._new_executor() for __ in range(workers)]
+        for f in [e.submit(_noop) for e in self._executors]:
+            f.result()
+
+    def _new_executor(self):
+        return futures.ProcessPoolExecutor(
+            max_workers=1, mp_context=self._mp_context,
+            initializer=_init_worker, initargs=(self._conf,))
+
+    def _replace_executor(self, partition, broken):
+        """Replace the executor of a partition whose process died."""
+        with self._executors_lock:
+            if self._executors[partition] is broken:
+                LOG.warning('The conversion process of partition %d died, '
+                            'starting a new one', partition)
+                broken.shutdown(wait=False)
+                self._executors[partition] = self._new_executor()
+            return self._executors[partition]
+
+    def _submit(self, partition, endpoint, priority, notifications):
+        executor = self._executors[partition]
+        try:
+            return executor, executor.submit(
+                _convert_in_worker, type(endpoint), priority, notifications)
+        except process.BrokenProcessPool:
+            executor = self._replace_executor(partition, executor)
+            return executor, executor.submit(
+                _convert_in_worker, type(endpoint), priority, notifications)
+
+    def convert(self, endpoint, priority, notifications):
+        """Convert notifications in the pool, see convert_notifications."""
+        partitions = {}
+        for idx, message in enumerate(notifications):
+            partition = hash(resource_key(message)) % len(self._executors)
+            partitions.setdefault(partition, []).append(idx)
+
+        jobs = []
+        for partition, indexes in partitions.items():
+            batch = [notifications[idx] for idx in indexes]
+            jobs.append((partition, indexes, batch) + self._submit(
+                partition, endpoint, priority, batch))
+
+        results = [None] * len(notifications)
+        for partition, indexes, batch, executor, job in jobs:
+            try:
+                try:
+                    partition_results = job.result()
+                except process.BrokenProcessPool:
+                    # NOTE: the process died, converting this batch or a
+                    # previous one, the batch is retried once in a new one
+                    self._replace_executor(partition, executor)
+                    executor, job = self._submit(partition, endpoint,
+                                                 priority, batch)
+                    try:
+                        partition_results = job.result()
+                    except process.BrokenProcessPool:
+                        self._replace_executor(partition, executor)
+                        raise
+            except Exception as e:
+                LOG.error('Fail to convert notifications in the conversion '
+                          'pool', exc_info=True)
+                partition_results = [([], e)] * len(indexes)
+            for idx, result in zip(indexes, partition_results):
+                results[idx] = result
+        return results
+
+    def shutdown(self):
+        with self._executors_lock:
+            executors = list(self._executors)
+        for executor in executors:
+            executor.shutdown(wait=True)
@@ -48,7 +48,13 @@ class EventEndpoint(base.NotificationEndpoint):
         """
         return self.process_notifications('error', notifications)
 
+    def convert_notification(self, priority, notification):
+        event = self.event_converter.to_event(priority, notification)
+        return [event] if event is not None else []
+
     def process_notifications(self, priority, notifications):
+        if self.conversion_pool is not None:
+            return self._process_notifications_pool(priority, notifications)
         for message in notifications:
             try:
                 event = self.event_converter.to_event(priority, message)
@@ -61,6 +67,29 @@ class EventEndpoint(base.NotificationEndpoint):
                 LOG.error('Fail to process a notification', exc_info=True)
         return oslo_messaging.NotificationResult.HANDLED
 
+    def _process_notifications_pool(self, priority, notifications):
+        # NOTE: as when converting in the listener thread, the events
+        # built before a failing notification are still published when the
+        # batch is requeued.
+        result = oslo_messaging.NotificationResult.HANDLED
+        events = []
+        for items, error in self._convert_notifications(priority,
+                                                        notifications):
+            if (error is not None and
+                    not self.conf.notification.ack_on_event_error):
+                result = oslo_messaging.NotificationResult.REQUEUE
+                break
+            events.extend(items)
+        try:
+            if events:
+                with self.publisher as p:
+                    p(events)
+        except Exception:
+            if not self.conf.notification.ack_on_event_error:
+                return oslo_messaging.NotificationResult.REQUEUE
+            LOG.error('Fail to process a notification', exc_info=True)
+        return result
+
 
 class EventSource(base.PipelineSource):
     """Represents a source of events.
@@ -76,9 +105,10 @@ class EventSource(base.PipelineSource):
             self.check_source_filtering(self.events, 'events')
         except agent.SourceException as err:
             raise base.PipelineException(err.msg, cfg)
+        self._event_matcher = agent.NameMatcher(self.events)
 
     def support_event(self, event_name):
-        return self.is_supported(self.events, event_name)
+        return self._event_matcher(event_name)
 
 
 class EventSink(base.Sink):
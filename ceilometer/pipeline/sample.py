@@ -15,6 +15,7 @@ from stevedore import extension
 
 from ceilometer import agent
 from ceilometer.pipeline import base
+from ceilometer import sample as sample_util
 
 LOG = log.getLogger(__name__)
 
@@ -36,6 +37,9 @@ class SampleEndpoint(base.NotificationEndpoint):
         return self.process_notifications('sample', notifications)
 
     def process_notifications(self, priority, notifications):
+        if (self.conversion_pool is not None or
+                self.conf.notification.batch_publish):
+            return self._process_notifications_batch(priority, notifications)
         for message in notifications:
             try:
                 LOG.debug("Processing sample notification [%s] for publisher "
@@ -48,6 +52,31 @@ class SampleEndpoint(base.NotificationEndpoint):
                           % message, exc_info=True)
                 raise e
 
+    def _process_notifications_batch(self, priority, notifications):
+        """Convert a whole batch of notifications and publish it at once.
+
+        As in the per-notification mode, a notification that fails to be
+        converted stops the batch: the samples of the notifications before
+        it are published, then the error is raised and the batch requeued.
+        """
+        samples = []
+        error = None
+        for items, error in self._convert_notifications(priority,
+                                                        notifications):
+            if error is not None:
+                break
+            samples.extend(items)
+        if samples:
+            with self.publisher as p:
+                p(samples)
+        if error is not None:
+            raise error
+
+    def convert_notification(self, priority, notification):
+        LOG.debug("Processing sample notification [%s] with priority [%s] "
+                  "using the agent [%s].", notification, priority, self)
+        return list(self.build_sample(notification))
+
     def build_sample(notification):
         """Build sample from provided notification."""
         pass
@@ -71,9 +100,10 @@ class SampleSource(base.PipelineSource):
             self.check_source_filtering(self.meters, 'meters')
         except agent.SourceException as err:
             raise base.PipelineException(err.msg, cfg)
+        self._meter_matcher = agent.NameMatcher(self.meters)
 
     def support_meter(self, meter_name):
-        return self.is_supported(self.meters, meter_name)
+        return self._meter_matcher(meter_name)
 
 
 class SampleSink(base.Sink):
@@ -81,13 +111,20 @@ class SampleSink(base.Sink):
     def publish_samples(self, samples):
         """Push samples into pipeline for publishing.
 
-        :param samples: Sample list.
+        :param samples: Sample list or SampleBatch.
         """
 
         if samples:
+            rows = None
             for p in self.publishers:
                 try:
-                    p.publish_samples(samples)
+                    if (getattr(p, 'accepts_sample_batch', False) or
+                            not isinstance(samples, sample_util.SampleBatch)):
+                        p.publish_samples(samples)
+                    else:
+                        if rows is None:
+                            rows = list(samples)
+                        p.publish_samples(rows)
                 except Exception:
                     LOG.error("Pipeline %(pipeline)s: Continue after "
                               "error from publisher %(pub)s"
@@ -132,16 +169,33 @@ class SamplePipeline(base.Pipeline):
         return True
 
     def publish_data(self, samples):
-        if not isinstance(samples, list):
-            samples = [samples]
-        supported = [s for s in samples if self.supported(s)
-                     and self._validate_volume(s)]
-        self.sink.publish_samples(supported)
+        batch = sample_util.SampleBatch.from_data(samples)
+        batch = batch.filter_names(self.source.support_meter)
+        # NOTE: only the rows whose volume did not convert to a float go
+        # through _validate_volume, which logs why they are dropped
+        valid = [v or self._validate_volume(s)
+                 for v, s in zip(batch.valid_volumes(), batch)]
+        self.sink.publish_samples(batch.filter(valid))
 
     def supported(self, sample):
         return self.source.support_meter(sample.name)
 
 
+class SamplePublishContext(base.PublishContext):
+    """Publish context converting the samples to a batch once.
+
+    The SampleBatch is shared by all the pipelines instead of having each
+    of them walk through the list of samples.
+    """
+
+    def __enter__(self):
+        publish = super(SamplePublishContext, self).__enter__()
+
+        def p(data):
+            publish(sample_util.SampleBatch.from_data(data))
+        return p
+
+
 class SamplePipelineManager(base.PipelineManager):
 
     pm_type = 'sample'
@@ -153,6 +207,9 @@ class SamplePipelineManager(base.PipelineManager):
         super(SamplePipelineManager, self).__init__(
             conf, conf.pipeline_cfg_file)
 
+    def publisher(self):
+        return SamplePublishContext(self.pipelines)
+
     def get_main_endpoints(self):
         exts = extension.ExtensionManager(
             namespace='ceilometer.sample.endpoint',
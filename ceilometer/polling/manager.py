@@ -19,7 +19,10 @@ import glob
 import itertools
 import logging
 import os
+import queue
 import random
+import threading
+import time
 import uuid
 
 from concurrent import futures
@@ -29,6 +32,7 @@ from keystoneauth1 import exceptions as ka_exceptions
 from oslo_config import cfg
 from oslo_log import log
 import oslo_messaging
+from oslo_serialization import jsonutils
 from oslo_utils import timeutils
 from stevedore import extension
 from tooz import coordination
@@ -77,6 +81,34 @@ POLLING_OPTS = [
                      'recommended that ceilometer be configured with a '
                      'caching backend to reduce the number of calls '
                      'made to keystone.'),
+    cfg.IntOpt('tenant_name_discovery_negative_ttl',
+               default=300,
+               min=0,
+               help='Time in seconds a project or user ID which could not '
+                    'be resolved to a name is not looked up again in '
+                    'keystone. Set to 0 to look it up every time.'),
+    cfg.BoolOpt('tenant_name_discovery_prefetch',
+                default=False,
+                help='List all the projects or users in keystone when IDs '
+                     'of a batch of samples are missing from the cache, '
+                     'instead of looking each of them up.'),
+    cfg.IntOpt('pollster_workers',
+               default=1,
+               min=1,
+               help='Number of pollsters of a polling task run concurrently, '
+                    'each in its own thread. With the default value of 1, '
+                    'the pollsters run one after the other.'),
+    cfg.IntOpt('pollster_timeout',
+               default=0,
+               min=0,
+               help='Time in seconds a polling task waits for a pollster. '
+                    'Once it is elapsed, the samples of the pollster are '
+                    'dropped and the polling task moves on to the other '
+                    'pollsters. Its thread keeps a worker until it exits '
+                    'and the pollster is not polled again until then. Set '
+                    'to 0 to wait without limit. With a timeout the '
+                    'pollsters run in threads, even if pollster_workers '
+                    'is 1.'),
 ]
 
 
@@ -121,6 +153,18 @@ class Resources(object):
         return '%s-%s' % (source_name, pollster.name)
 
 
+class PollsterJob(object):
+    """A pollster polled in its own thread by a polling task."""
+
+    def __init__(self, source_name, pollster, key, resources):
+        self.source_name = source_name
+        self.pollster = pollster
+        self.key = key
+        self.resources = resources
+        self.deadline = None
+        self.abandoned = False
+
+
 def iter_random(iterable):
     """Iter over iterable in a random fashion."""
     lst = list(iterable)
@@ -147,8 +191,21 @@ class PollingTask(object):
         self.resources = collections.defaultdict(resource_factory)
 
         self._batch_size = self.manager.conf.polling.batch_size
+        self._pollster_workers = self.manager.conf.polling.pollster_workers
+        self._pollster_timeout = self.manager.conf.polling.pollster_timeout
+        # NOTE: the jobs whose thread finished, and the jobs abandoned after
+        # a timeout whose thread still runs, taking a worker
+        self._finished = queue.Queue()
+        self._abandoned = set()
+        self._send_lock = threading.Lock()
 
         self._telemetry_secret = self.manager.conf.publisher.telemetry_secret
+        self._batch_signing = (
+            self.manager.conf.publisher_notifier.telemetry_signing in
+            ('batch', 'batch_required'))
+        # NOTE: when the batches are signed the samples are not
+        self._sample_secret = (None if self._batch_signing
+                               else self._telemetry_secret)
 
         self.ks_client = self.manager.keystone
 
@@ -164,6 +221,11 @@ class PollingTask(object):
         cache = {}
         discovery_cache = {}
         poll_history = {}
+        # NOTE: the resources are always discovered in this thread, only
+        # the pollsters run concurrently. They share the cache, which they
+        # only use to get and set keys, atomic operations on a dict.
+        concurrent = self._pollster_workers > 1 or self._pollster_timeout
+        jobs = []
         for source_name, pollsters in iter_random(
                 self.pollster_matches.items()):
             for pollster in iter_random(pollsters):
@@ -195,97 +257,198 @@ class PollingTask(object):
                               {'name': pollster.name, 'p_context': p_context})
                     continue
 
-                LOG.info("Polling pollster %(poll)s in the context of "
-                         "%(src)s",
-                         dict(poll=pollster.name, src=source_name))
-                try:
-                    polling_timestamp = timeutils.utcnow().isoformat()
-                    samples = pollster.obj.get_samples(
-                        manager=self.manager,
-                        cache=cache,
-                        resources=polling_resources
-                    )
-                    sample_batch = []
-
-                    for sample in samples:
-                        # Note(yuywz): Unify the timestamp of polled samples
-                        sample.set_timestamp(polling_timestamp)
-
-                        if (
-                            self.manager.conf.polling.tenant_name_discovery and
-                            self._cache
-                        ):
-
-                            # Try to resolve project UUIDs from cache first,
-                            # and then keystone
-                            LOG.debug("Ceilometer is configured to resolve "
-                                      "project IDs to name; loading the "
-                                      "project name for project ID [%s] in "
-                                      "sample [%s].", sample.project_id,
-                                      sample)
-                            if sample.project_id:
-                                sample.project_name = \
-                                    self._cache.resolve_uuid_from_cache(
-                                        "projects",
-                                        sample.project_id
-                                    )
-
-                            # Try to resolve user UUIDs from cache first,
-                            # and then keystone
-
-                            LOG.debug("Ceilometer is configured to resolve "
-                                      "user IDs to name; loading the "
-                                      "user name for user ID [%s] in "
-                                      "sample [%s].", sample.user_id,
-                                      sample)
-                            if sample.user_id:
-                                sample.user_name = \
-                                    self._cache.resolve_uuid_from_cache(
-                                        "users",
-                                        sample.user_id
-                                    )
-
-                            LOG.debug("Final sample generated after loading "
-                                      "the project and user names bases on "
-                                      "the IDs [%s].", sample)
-
-                        sample_dict = (
-                            publisher_utils.meter_message_from_counter(
-                                sample, self._telemetry_secret
-                            ))
-                        if self._batch_size:
-                            if len(sample_batch) >= self._batch_size:
-                                self._send_notification(sample_batch)
-                                sample_batch = []
-                            sample_batch.append(sample_dict)
-                        else:
-                            self._send_notification([sample_dict])
-
-                    if sample_batch:
-                        self._send_notification(sample_batch)
-
-                    LOG.info("Finished polling pollster %(poll)s in the "
-                             "context of %(src)s", dict(poll=pollster.name,
-                                                        src=source_name))
-                except plugin_base.PollsterPermanentError as err:
-                    LOG.error(
-                        'Prevent pollster %(name)s from '
-                        'polling %(res_list)s on source %(source)s anymore!',
-                        dict(name=pollster.name,
-                             res_list=str(err.fail_res_list),
-                             source=source_name))
-                    self.resources[key].blacklist.extend(err.fail_res_list)
-                except Exception as err:
-                    LOG.error(
-                        'Continue after error from %(name)s: %(error)s'
-                        % ({'name': pollster.name, 'error': err}),
-                        exc_info=True)
+                if concurrent:
+                    jobs.append(PollsterJob(source_name, pollster, key,
+                                            polling_resources))
+                else:
+                    self._poll(source_name, pollster, key, polling_resources,
+                               cache, self._send_notification)
+        if jobs:
+            self._poll_concurrently(jobs, cache)
+
+    def _poll_concurrently(self, jobs, cache):
+        """Run the pollsters of jobs in at most pollster_workers threads.
+
+        The threads of the pollsters abandoned after a timeout take a
+        worker until they exit, and these pollsters are not polled again
+        until then.
+        """
+        running = set()
+
+        def collect(timeout):
+            """Wait for a thread to exit, return False on timeout."""
+            try:
+                job = self._finished.get(timeout=timeout)
+            except queue.Empty:
+                return False
+            if job in running:
+                running.discard(job)
+            else:
+                self._abandoned.discard(job)
+            return True
+
+        while collect(0):
+            pass
+
+        waiting = collections.deque()
+        abandoned_keys = set(job.key for job in self._abandoned)
+        for job in jobs:
+            if job.key in abandoned_keys:
+                LOG.warning('Skip pollster %(name)s in the context of '
+                            '%(src)s, its previous polling is still running',
+                            {'name': job.pollster.name,
+                             'src': job.source_name})
+            else:
+                waiting.append(job)
+
+        while waiting or running:
+            while waiting and (len(running) + len(self._abandoned) <
+                               self._pollster_workers):
+                job = waiting.popleft()
+                if self._pollster_timeout:
+                    job.deadline = time.monotonic() + self._pollster_timeout
+                running.add(job)
+                utils.spawn_thread(self._run_job, job, cache, self._finished)
+
+            if not running:
+                # NOTE: all the workers are taken by abandoned pollsters
+                if not collect(self._pollster_timeout):
+                    LOG.error('No worker left by the pollsters which did not '
+                              'finish polling, skipping %d pollsters this '
+                              'cycle', len(waiting))
+                    return
+                continue
+
+            timeout = None
+            if self._pollster_timeout:
+                timeout = max(0, min(job.deadline for job in running) -
+                              time.monotonic())
+            if not collect(timeout):
+                now = time.monotonic()
+                for job in [j for j in running if j.deadline <= now]:
+                    # NOTE: a thread can not be stopped, the pollster keeps
+                    # running but its samples are no longer sent.
+                    job.abandoned = True
+                    running.discard(job)
+                    self._abandoned.add(job)
+                    LOG.error('Pollster %(name)s did not finish polling in '
+                              'the context of %(src)s within %(timeout)s '
+                              'seconds, dropping its samples',
+                              {'name': job.pollster.name,
+                               'src': job.source_name,
+                               'timeout': self._pollster_timeout})
+
+    def _run_job(self, job, cache, finished):
+        def send(samples):
+            with self._send_lock:
+                if not job.abandoned:
+                    self._send_notification(samples)
+        try:
+            self._poll(job.source_name, job.pollster, job.key, job.resources,
+                       cache, send)
+        finally:
+            finished.put(job)
+
+    def _resolve_names(self, samples):
+        """Set the project and user names of the samples, batch by batch.
+
+        The names of the distinct project and user IDs of a batch are
+        resolved at once, from the cache first and then keystone. Without
+        a batch size, the names of all the samples are resolved at once.
+        """
+        samples = iter(samples)
+        while True:
+            batch = list(itertools.islice(samples, self._batch_size or None))
+            if not batch:
+                return
+            LOG.debug("Ceilometer is configured to resolve project and "
+                      "user IDs to name; loading the names for %d "
+                      "samples.", len(batch))
+            project_names = self._cache.resolve_uuids_from_cache(
+                "projects", [s.project_id for s in batch])
+            user_names = self._cache.resolve_uuids_from_cache(
+                "users", [s.user_id for s in batch])
+            for sample in batch:
+                if sample.project_id:
+                    sample.project_name = project_names.get(
+                        sample.project_id)
+                if sample.user_id:
+                    sample.user_name = user_names.get(sample.user_id)
+                yield sample
+
+    def _poll(self, source_name, pollster, key, polling_resources, cache,
+              send):
+        LOG.info("Polling pollster %(poll)s in the context of "
+                 "%(src)s",
+                 dict(poll=pollster.name, src=source_name))
+        try:
+            polling_timestamp = timeutils.utcnow().isoformat()
+            samples = pollster.obj.get_samples(
+                manager=self.manager,
+                cache=cache,
+                resources=polling_resources
+            )
+            sample_batch = []
+
+            if (
+                self.manager.conf.polling.tenant_name_discovery and
+                self._cache
+            ):
+                samples = self._resolve_names(samples)
+
+            for sample in samples:
+                # Note(yuywz): Unify the timestamp of polled samples
+                sample.set_timestamp(polling_timestamp)
+
+                sample_dict = (
+                    publisher_utils.meter_message_from_counter(
+                        sample, self._sample_secret
+                    ))
+                if self._batch_size:
+                    if len(sample_batch) >= self._batch_size:
+                        send(sample_batch)
+                        sample_batch = []
+                    sample_batch.append(sample_dict)
+                else:
+                    send([sample_dict])
+
+            if sample_batch:
+                send(sample_batch)
+
+            LOG.info("Finished polling pollster %(poll)s in the "
+                     "context of %(src)s", dict(poll=pollster.name,
+                                                src=source_name))
+        except plugin_base.PollsterPermanentError as err:
+            LOG.error(
+                'Prevent pollster %(name)s from '
+                'polling %(res_list)s on source %(source)s anymore!',
+                dict(name=pollster.name,
+                     res_list=str(err.fail_res_list),
+                     source=source_name))
+            self.resources[key].blacklist.extend(err.fail_res_list)
+        except Exception as err:
+            LOG.error(
+                'Continue after error from %(name)s: %(error)s'
+                % ({'name': pollster.name, 'error': err}),
+                exc_info=True)
 
     def _send_notification(self, samples):
+        payload = {'samples': samples}
+        if self._batch_signing:
+            # NOTE: the batch is verified once serialized by the messaging
+            # layer, so the signature is computed over its JSON form, where
+            # dict keys are strings and datetimes are converted. Alone,
+            # jsonutils.to_primitive() leaves the dict keys as they are.
+            payload = jsonutils.loads(jsonutils.dumps(payload))
+            # NOTE: the mark tells the notification agents to verify the
+            # batch, whatever their own configuration
+            payload['signing'] = 'batch'
+            payload['message_signature'] = publisher_utils.compute_signature(
+                payload, self._telemetry_secret)
         self.manager.notifier.sample(
             {},
             'telemetry.polling',
-            {'samples': samples}
+            payload
         )
 
 
@@ -730,9 +893,10 @@ class PollingSource(agent.Source):
             self.check_source_filtering(self.meters, 'meters')
         except agent.SourceException as err:
             raise PollingException(err.msg, cfg)
+        self._meter_matcher = agent.NameMatcher(self.meters)
 
     def get_interval(self):
         return self.interval
 
     def support_meter(self, meter_name):
-        return self.is_supported(self.meters, meter_name)
+        return self._meter_matcher(meter_name)
@@ -38,6 +38,10 @@ def get_publisher(conf, url, namespace):
 class ConfigPublisherBase(object, metaclass=abc.ABCMeta):
     """Base class for plugins that publish data."""
 
+    # NOTE: publishers setting this get the samples as a SampleBatch,
+    # the others as a list of Sample
+    accepts_sample_batch = False
+
     def __init__(self, conf, parsed_url):
         self.conf = conf
 
@@ -13,13 +13,15 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 from collections import defaultdict
+from concurrent import futures
 import fnmatch
+import hashlib
 import itertools
 import json
-import operator
 import pkg_resources
 import tenacity
 import threading
+import time
 
 from gnocchiclient import exceptions as gnocchi_exc
 from keystoneauth1 import exceptions as ka_exceptions
@@ -34,6 +36,7 @@ from ceilometer import gnocchi_client
 from ceilometer.i18n import _
 from ceilometer import keystone_client
 from ceilometer import publisher
+from ceilometer import sample as sample_util
 
 LOG = log.getLogger(__name__)
 
@@ -68,6 +71,15 @@ class ResourcesDefinition(object):
             self._event_attributes[name] = declarative.Definition(
                 name, attr_cfg, plugin_manager)
 
+        # NOTE: the sample fields read by the attributes, None when they
+        # can't be known and the whole sample has to be serialized
+        self._sample_fields = None
+        root_fields = [d.root_fields for d in self._attributes.values()]
+        if None not in root_fields:
+            self._sample_fields = tuple(sorted(
+                set().union(*root_fields).intersection(
+                    sample_util.Sample.FIELDS)))
+
         self.metrics = {}
 
         # NOTE(sileht): Convert old list to new dict format
@@ -131,13 +143,32 @@ class ResourcesDefinition(object):
             if fnmatch.fnmatch(event_type, e):
                 return EVENT_UPDATE
 
-    def sample_attributes(self, sample):
+    def sample_attributes(self, sample, memo=None):
+        """Return the resource attributes of a sample.
+
+        :param memo: an optional dict shared by the samples of a batch, the
+                     attributes of a resource are only parsed again when the
+                     sample fields they are read from change.
+        """
+        if self._sample_fields is None:
+            sample_dict = sample.as_dict()
+        else:
+            sample_dict = {field: getattr(sample, field)
+                           for field in self._sample_fields}
+            if memo is not None:
+                key = (id(self), sample.resource_id)
+                cached = memo.get(key)
+                if cached is not None and cached[0] == sample_dict:
+                    return cached[1]
+
         attrs = {}
-        sample_dict = sample.as_dict()
         for name, definition in self._attributes.items():
             value = definition.parse(sample_dict)
             if value is not None:
                 attrs[name] = value
+
+        if self._sample_fields is not None and memo is not None:
+            memo[key] = (sample_dict, attrs)
         return attrs
 
     def event_attributes(self, event):
@@ -182,7 +213,14 @@ class GnocchiPublisher(publisher.ConfigPublisherBase):
     look like the following:
 
       gnocchi://?archive_policy=low&filter_project=gnocchi
+
+    The resources are created and updated one at a time, unless the
+    resource_workers option sets the number of threads doing it, bounded by
+    the max_parallel_requests option.
     """
+
+    accepts_sample_batch = True
+
     def __init__(self, conf, parsed_url):
         super(GnocchiPublisher, self).__init__(conf, parsed_url)
         # TODO(jd) allow to override Gnocchi endpoint via the host in the URL
@@ -209,11 +247,26 @@ class GnocchiPublisher(publisher.ConfigPublisherBase):
         # we want to avoid the cache pathways entirely if the
         # cache has not been configured explicitly.
         self.cache = cache_utils.get_client(conf)
+        # NOTE: how long, in seconds, the cached attributes of a resource
+        # are trusted, and a resource is known not to exist after an
+        # update failed to find it. 0 disables the expiration and the
+        # negative caching.
+        self.resource_cache_ttl = int(
+            options.get('resource_cache_ttl', [0])[-1])
+        self.resource_cache_negative_ttl = int(
+            options.get('resource_cache_negative_ttl', [0])[-1])
 
         self._gnocchi_project_id = None
         self._gnocchi_project_id_lock = threading.Lock()
         self._gnocchi_resource_lock = LockedDefaultDict(threading.Lock)
 
+        resource_workers = min(
+            int(options.get('resource_workers', [1])[-1]),
+            conf.max_parallel_requests)
+        self._resource_executor = (
+            futures.ThreadPoolExecutor(max_workers=resource_workers)
+            if resource_workers > 1 else None)
+
         try:
             self._gnocchi = self._get_gnocchi_client(conf, timeout)
         except tenacity.RetryError as e:
@@ -332,43 +385,46 @@ class GnocchiPublisher(publisher.ConfigPublisherBase):
         This method will filter out the samples that are generated by
         Gnocchi itself.
         """
-        filtered_samples = []
+        batch = isinstance(samples, sample_util.SampleBatch)
+        keep = []
         for sample in samples:
             if not self._is_gnocchi_activity(sample):
-                filtered_samples.append(sample)
+                keep.append(True)
                 LOG.debug("Sample [%s] is not a Gnocchi activity; therefore, "
                           "we do not filter it out and push it to Gnocchi.",
                           sample)
             else:
+                keep.append(False)
                 LOG.debug("Sample [%s] is a Gnocchi activity; therefore, "
                           "we filter it out and do not push it to Gnocchi.",
                           sample)
-        return filtered_samples
+        if batch:
+            return samples.filter(keep)
+        return [sample for sample, k in zip(samples, keep) if k]
 
     def publish_samples(self, data):
         self.ensures_archives_policies()
 
-        data = self.filter_gnocchi_activity_openstack(data)
+        data = self.filter_gnocchi_activity_openstack(
+            sample_util.SampleBatch.from_data(data))
 
-        def value_to_sort(object_to_sort):
-            value = object_to_sort.resource_id
-            if not value:
-                LOG.debug("Resource ID was not defined for sample data [%s]. "
+        def value_to_sort(resource_id):
+            if not resource_id:
+                LOG.debug("Resource ID was not defined for sample data. "
                           "Therefore, we will use an empty string as the "
-                          "resource ID.", object_to_sort)
-                value = ''
+                          "resource ID.")
+                return ''
+            return resource_id
 
-            return value
-
-        data.sort(key=value_to_sort)
-        resource_grouped_samples = itertools.groupby(
-            data, key=operator.attrgetter('resource_id'))
+        groups = data.group_by_resource()
 
         gnocchi_data = {}
         measures = {}
-        for resource_id, samples_of_resource in resource_grouped_samples:
-            for sample in samples_of_resource:
-                metric_name = sample.name
+        attributes_memo = {}
+        for resource_id in sorted(groups, key=value_to_sort):
+            for idx in groups[resource_id]:
+                sample = data[idx]
+                metric_name = data.names[idx]
                 LOG.debug("Processing sample [%s] for resource ID [%s].",
                           sample, resource_id)
                 rd = self.metric_map.get(metric_name)
@@ -386,18 +442,19 @@ class GnocchiPublisher(publisher.ConfigPublisherBase):
                         'resource_type': rd.cfg['resource_type'],
                         'resource': {"id": resource_id,
                                      "user_id": sample.user_id,
-                                     "project_id": sample.project_id}}
+                                     "project_id": data.project_ids[idx]}}
 
                 gnocchi_data[resource_id].setdefault(
-                    "resource_extra", {}).update(rd.sample_attributes(sample))
+                    "resource_extra", {}).update(
+                        rd.sample_attributes(sample, attributes_memo))
                 measures.setdefault(resource_id, {}).setdefault(
                     metric_name,
                     {"measures": [],
                      "archive_policy_name":
                      rd.metrics[metric_name]["archive_policy_name"],
-                     "unit": sample.unit}
+                     "unit": data.units[idx]}
                 )["measures"].append(
-                    {'timestamp': sample.timestamp,
+                    {'timestamp': data.timestamps[idx],
                      'value': sample.volume}
                 )
 
@@ -412,26 +469,52 @@ class GnocchiPublisher(publisher.ConfigPublisherBase):
                       "gnocchi data [%s]: [%s].", measures, gnocchi_data,
                       str(e), exc_info=True)
 
-        for info in gnocchi_data.values():
-            resource = info["resource"]
-            resource_type = info["resource_type"]
-            resource_extra = info["resource_extra"]
-            if not resource_extra:
+        updates = [(info["resource_type"], info["resource"]["id"],
+                    info["resource_extra"])
+                   for info in gnocchi_data.values()
+                   if info["resource_extra"]]
+        if self.cache and updates:
+            updates = self._filter_cached_resources(updates)
+        for (resource_type, resource_id, resource_extra), error in (
+                self._map_resources(self._if_not_cached, updates)):
+            if error is None:
                 continue
             try:
-                self._if_not_cached(resource_type, resource['id'],
-                                    resource_extra)
+                raise error
             except gnocchi_exc.ClientException as e:
                 LOG.error("Gnocchi client exception updating resource type "
                           "[%s] with ID [%s] for resource data [%s]: [%s].",
-                          resource_type, resource.get('id'), resource_extra,
+                          resource_type, resource_id, resource_extra,
                           str(e))
             except Exception as e:
                 LOG.error("Unexpected exception updating resource type [%s] "
                           "with ID [%s] for resource data [%s]: [%s].",
-                          resource_type, resource.get('id'), resource_extra,
+                          resource_type, resource_id, resource_extra,
                           str(e), exc_info=True)
 
+    def _map_resources(self, func, calls):
+        """Call func with the arguments of each call.
+
+        The calls are made in the resource executor, if any.
+
+        :return: for each call, its arguments and the exception raised, if
+                 any.
+        """
+        if self._resource_executor is None or len(calls) < 2:
+            results = []
+            for args in calls:
+                try:
+                    func(*args)
+                except Exception as e:
+                    results.append((args, e))
+                else:
+                    results.append((args, None))
+            return results
+
+        jobs = [(args, self._resource_executor.submit(func, *args))
+                for args in calls]
+        return [(args, job.exception()) for args, job in jobs]
+
     @staticmethod
     def _extract_resources_from_error(e, resource_infos):
         resource_ids = set([r['original_resource_id']
@@ -457,24 +540,19 @@ class GnocchiPublisher(publisher.ConfigPublisherBase):
                 raise
 
             resources = self._extract_resources_from_error(e, resource_infos)
-            for resource_type, resource, resource_extra in resources:
-                try:
-                    resource.update(resource_extra)
-                    self._create_resource(resource_type, resource)
-                except gnocchi_exc.ResourceAlreadyExists:
-                    # NOTE(sileht): resource created in the meantime
-                    pass
-                except gnocchi_exc.ClientException as e:
-                    LOG.error('Error creating resource %(id)s: %(err)s',
-                              {'id': resource['id'], 'err': str(e)})
-                    # We cannot post measures for this resource
-                    # and we can't patch it later
-                    del measures[resource['id']]
-                    del resource_infos[resource['id']]
-                else:
-                    if self.cache and resource_extra:
-                        self.cache.set(resource['id'],
-                                       self._hash_resource(resource_extra))
+            for (resource_type, resource, resource_extra), error in (
+                    self._map_resources(self._create_missing_resource,
+                                        resources)):
+                if error is None:
+                    continue
+                if not isinstance(error, gnocchi_exc.ClientException):
+                    raise error
+                LOG.error('Error creating resource %(id)s: %(err)s',
+                          {'id': resource['id'], 'err': str(error)})
+                # We cannot post measures for this resource
+                # and we can't patch it later
+                del measures[resource['id']]
+                del resource_infos[resource['id']]
 
             # NOTE(sileht): we have created missing resources/metrics,
             # now retry to post measures
@@ -488,6 +566,20 @@ class GnocchiPublisher(publisher.ConfigPublisherBase):
                 for m in measures[rid].values()),
             sum(len(m) for m in measures.values()), len(resource_infos))
 
+    def _create_missing_resource(self, resource_type, resource,
+                                 resource_extra):
+        try:
+            resource.update(resource_extra)
+            self._create_resource(resource_type, resource)
+        except gnocchi_exc.ResourceAlreadyExists:
+            # NOTE(sileht): resource created in the meantime
+            pass
+        else:
+            if self.cache and resource_extra:
+                self._cache_resource(resource['id'],
+                                     self._hash_resource(resource_extra),
+                                     self.resource_cache_ttl)
+
     def _create_resource(self, resource_type, resource):
         self._gnocchi.resource.create(resource_type, resource)
         LOG.debug('Resource %s created', resource["id"])
@@ -504,10 +596,19 @@ class GnocchiPublisher(publisher.ConfigPublisherBase):
                     # NOTE(luogangyi): there is a possibility that the
                     # resource was already built in cache by another
                     # ceilometer-notification-agent when we get the lock here.
-                    if self._resource_cache_diff(res_id, attribute_hash):
-                        self._update_resource(resource_type, res_id,
-                                              resource_extra)
-                        self.cache.set(res_id, attribute_hash)
+                    if self._resource_shared_cache_diff(res_id,
+                                                        attribute_hash):
+                        try:
+                            self._update_resource(resource_type, res_id,
+                                                  resource_extra)
+                        except gnocchi_exc.ResourceNotFound:
+                            if self.resource_cache_negative_ttl:
+                                self._cache_resource(
+                                    res_id, None,
+                                    self.resource_cache_negative_ttl)
+                            raise
+                        self._cache_resource(res_id, attribute_hash,
+                                             self.resource_cache_ttl)
                     else:
                         LOG.debug('Resource cache hit for %s', res_id)
                 self._gnocchi_resource_lock.pop(res_id, None)
@@ -518,11 +619,63 @@ class GnocchiPublisher(publisher.ConfigPublisherBase):
 
     @staticmethod
     def _hash_resource(resource):
-        return hash(tuple(i for i in resource.items() if i[0] != 'metrics'))
+        # NOTE: the cache can be shared by several agents, so the
+        # fingerprint must not depend on the hash seed of the process
+        attributes = json.dumps(
+            dict(i for i in resource.items() if i[0] != 'metrics'),
+            sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.blake2b(attributes.encode('utf-8'),
+                               digest_size=16).hexdigest()
+
+    def _cache_resource(self, key, attribute_hash, ttl):
+        """Cache the attributes fingerprint of a resource.
+
+        A None fingerprint records that the resource doesn't exist.
+        """
+        expiry = time.time() + ttl if ttl else None
+        self.cache.set(key, (attribute_hash, expiry))
+
+    def _filter_cached_resources(self, updates):
+        """Return the resource updates not already done, from the cache.
+
+        The cached fingerprints of all the resources are read at once,
+        _if_not_cached checks them again before updating a resource.
+        """
+        try:
+            cached = self.cache.get_multi([res_id
+                                           for __, res_id, __ in updates])
+        except Exception:
+            LOG.warning("Fail to read the resource cache", exc_info=True)
+            return updates
+        filtered = []
+        for update, cached_hash in zip(updates, cached):
+            __, res_id, resource_extra = update
+            if self._cached_resource_diff(
+                    cached_hash, self._hash_resource(resource_extra)):
+                filtered.append(update)
+            else:
+                LOG.debug('Resource cache hit for %s', res_id)
+        return filtered
 
     def _resource_cache_diff(self, key, attribute_hash):
-        cached_hash = self.cache.get(key)
-        return not cached_hash or cached_hash != attribute_hash
+        return self._cached_resource_diff(self.cache.get(key), attribute_hash)
+
+    def _resource_shared_cache_diff(self, key, attribute_hash):
+        # NOTE: the local cache layer of the client is bypassed, only the
+        # backend tells what the other agents wrote
+        return self._cached_resource_diff(self.cache.region.get(key),
+                                          attribute_hash)
+
+    @staticmethod
+    def _cached_resource_diff(cached, attribute_hash):
+        if not isinstance(cached, (tuple, list)) or len(cached) != 2:
+            return True
+        cached_hash, expiry = cached
+        if expiry is not None and expiry <= time.time():
+            return True
+        # NOTE: a missing resource can't be updated, it is created with
+        # its attributes when measures are pushed for it
+        return cached_hash is not None and cached_hash != attribute_hash
 
     def publish_events(self, events):
         for event in events:
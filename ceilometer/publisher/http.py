@@ -22,6 +22,7 @@ from requests import adapters
 from urllib import parse as urlparse
 
 from ceilometer import publisher
+from ceilometer import sample as sample_util
 
 LOG = log.getLogger(__name__)
 
@@ -70,6 +71,8 @@ class HttpPublisher(publisher.ConfigPublisherBase):
 
     HEADERS = {'Content-type': 'application/json'}
 
+    accepts_sample_batch = True
+
     def __init__(self, conf, parsed_url):
         super(HttpPublisher, self).__init__(conf, parsed_url)
 
@@ -188,7 +191,7 @@ class HttpPublisher(publisher.ConfigPublisherBase):
 
         :param samples: Samples from pipeline after transformation
         """
-        self.poster([sample.as_dict() for sample in samples])
+        self.poster(sample_util.SampleBatch.from_data(samples).as_dicts())
 
     def publish_events(self, events):
         """Send an event message for publishing
@@ -53,7 +53,28 @@ NOTIFIER_OPTS = [
                help='The driver that ceilometer uses for metering '
                'notifications.',
                deprecated_name='metering_driver',
-               )
+               ),
+    cfg.StrOpt('telemetry_signing',
+               default='sample',
+               choices=[('sample', 'Sign each sample sent by the polling '
+                                   'agents. The notification agents verify '
+                                   'the batches signed as a whole and accept '
+                                   'the others.'),
+                        ('batch', 'Sign once each batch of samples sent by '
+                                  'the polling agents. The notification '
+                                  'agents verify the batches signed as a '
+                                  'whole and accept the others.'),
+                        ('batch_required', 'Same as batch, but the '
+                                           'notification agents also drop '
+                                           'the batches not signed as a '
+                                           'whole.')],
+               help='How the samples sent by the polling agents to the '
+                    'notification agents on the telemetry_driver '
+                    'notifications are signed with telemetry_secret. Only '
+                    'these notifications are concerned, the publishers keep '
+                    'signing each sample they publish. The batches signed '
+                    'as a whole are marked as such, so the agents of a '
+                    'deployment may be switched one by one.'),
 ]
 
 
@@ -104,11 +125,8 @@ class MessagingPublisher(publisher.ConfigPublisherBase, metaclass=abc.ABCMeta):
 
         """
 
-        meters = [
-            utils.meter_message_from_counter(
-                sample, self.conf.publisher.telemetry_secret)
-            for sample in samples
-        ]
+        meters = utils.meter_messages_from_counters(
+            samples, self.conf.publisher.telemetry_secret)
         topic = self.conf.publisher_notifier.metering_topic
         with self.queue_lock:
             self.local_queue.append((topic, meters))
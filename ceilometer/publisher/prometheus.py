@@ -44,21 +44,24 @@ class PrometheusPublisher(http.HttpPublisher):
         if not samples:
             return
 
-        data = ""
+        batch = sample.SampleBatch.from_data(samples)
+        lines = []
         doc_done = set()
-        for s in samples:
+        for name, type_, resource_id, project_id, s in zip(
+                batch.names, batch.types, batch.resource_ids,
+                batch.project_ids, batch):
             # NOTE(sileht): delta can't be converted into prometheus data
             # format so don't set the metric type for it
             metric_type = None
-            if s.type == sample.TYPE_CUMULATIVE:
+            if type_ == sample.TYPE_CUMULATIVE:
                 metric_type = "counter"
-            elif s.type == sample.TYPE_GAUGE:
+            elif type_ == sample.TYPE_GAUGE:
                 metric_type = "gauge"
 
-            curated_sname = s.name.replace(".", "_")
+            curated_sname = name.replace(".", "_")
 
             if metric_type and curated_sname not in doc_done:
-                data += "# TYPE %s %s\n" % (curated_sname, metric_type)
+                lines.append("# TYPE %s %s\n" % (curated_sname, metric_type))
                 doc_done.add(curated_sname)
 
             # NOTE(sileht): prometheus pushgateway doesn't allow to push
@@ -71,8 +74,9 @@ class PrometheusPublisher(http.HttpPublisher):
             # data += '%s{resource_id="%s"} %s %d\n' % (
             #     curated_sname, s.resource_id, s.volume, timestamp_ms)
 
-            data += '%s{resource_id="%s", project_id="%s"} %s\n' % (
-                curated_sname, s.resource_id, s.project_id, s.volume)
+            lines.append('%s{resource_id="%s", project_id="%s"} %s\n' % (
+                curated_sname, resource_id, project_id, s.volume))
+        data = "".join(lines)
         self._do_post(data)
 
     @staticmethod
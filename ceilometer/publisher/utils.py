@@ -15,6 +15,7 @@
 """Utils for publishers
 """
 
+import functools
 import hashlib
 import hmac
 
@@ -74,8 +75,12 @@ def recursive_keypairs(d, separator=':'):
             yield name, value
 
 
-def compute_signature(message, secret):
-    """Return the signature for a message dictionary."""
+def compute_signature_reference(message, secret):
+    """Return the signature for a message dictionary.
+
+    Reference implementation of compute_signature, built on
+    recursive_keypairs.
+    """
     if not secret:
         return ''
 
@@ -92,6 +97,90 @@ def compute_signature(message, secret):
     return digest_maker.hexdigest()
 
 
+def _decoded_repr(value):
+    """Return str(decode_unicode(value)) without building the copy."""
+    if isinstance(value, dict):
+        return '{%s}' % ', '.join(
+            '%s: %s' % (_decoded_repr(k), _decoded_repr(v))
+            for k, v in sorted(value.items()))
+    elif isinstance(value, (tuple, list)):
+        return '[%s]' % ', '.join(_decoded_repr(v) for v in value)
+    elif isinstance(value, str):
+        return repr(value.encode('utf-8'))
+    elif isinstance(value, bytes):
+        return repr(value.decode('utf-8'))
+    else:
+        return repr(value)
+
+
+def _canonical_parts(d, prefix, parts):
+    """Append the names and values signed for d to parts.
+
+    The result is the sequence recursive_keypairs produces, flattened
+    into strings, so that joining it gives the signed content.
+    """
+    append = parts.append
+    for name in sorted(d):
+        value = d[name]
+        name = prefix + str(name)
+        if type(value) is str:
+            pass
+        elif isinstance(value, dict):
+            _canonical_parts(value, name + ':', parts)
+            continue
+        elif isinstance(value, (tuple, list)):
+            value = _decoded_repr(value)
+        else:
+            value = str(value)
+        if name == 'message_signature':
+            # Skip any existing signature value, which would not have
+            # been part of the original message.
+            continue
+        append(name)
+        append(value)
+
+
+def canonical_message(message):
+    """Return the bytes signed for a message dictionary."""
+    parts = []
+    _canonical_parts(message, '', parts)
+    return ''.join(parts).encode('utf-8')
+
+
+@functools.lru_cache(maxsize=8)
+def _hmac_template(secret):
+    # NOTE: the key schedule is computed once per secret, each signature
+    # is then computed on a copy of the keyed HMAC
+    return hmac.new(secret, b'', hashlib.sha256)
+
+
+def _sign(template, message):
+    digest_maker = template.copy()
+    digest_maker.update(canonical_message(message))
+    return digest_maker.hexdigest()
+
+
+def compute_signature(message, secret):
+    """Return the signature for a message dictionary."""
+    if not secret:
+        return ''
+
+    if isinstance(secret, str):
+        secret = secret.encode('utf-8')
+    return _sign(_hmac_template(secret), message)
+
+
+def compute_signatures(messages, secret):
+    """Return the signatures for a list of message dictionaries."""
+    if not secret:
+        return [''] * len(messages)
+
+    if isinstance(secret, str):
+        secret = secret.encode('utf-8')
+    template = _hmac_template(secret)
+    return [_sign(template, message) for message in messages]
+
+
 def verify_signature(message, secret):
     """Check the signature in the message.
 
@@ -114,12 +203,7 @@ def verify_signature(message, secret):
     return secretutils.constant_time_compare(new_sig, old_sig)
 
 
-def meter_message_from_counter(sample, secret, publisher_id=None):
-    """Make a metering message ready to be published or stored.
-
-    Returns a dictionary containing a metering message
-    for a notification message and a Sample instance.
-    """
+def _meter_message(sample, publisher_id):
     msg = {'source': sample.source,
            'counter_name': sample.name,
            'counter_type': sample.type,
@@ -137,10 +221,32 @@ def meter_message_from_counter(sample, secret, publisher_id=None):
            }
     if publisher_id is not None:
         msg['publisher_id'] = publisher_id
+    return msg
+
+
+def meter_message_from_counter(sample, secret, publisher_id=None):
+    """Make a metering message ready to be published or stored.
+
+    Returns a dictionary containing a metering message
+    for a notification message and a Sample instance.
+    """
+    msg = _meter_message(sample, publisher_id)
     msg['message_signature'] = compute_signature(msg, secret)
     return msg
 
 
+def meter_messages_from_counters(samples, secret, publisher_id=None):
+    """Make the metering messages of a list of samples.
+
+    Same as meter_message_from_counter for each sample, the messages are
+    signed with compute_signatures.
+    """
+    msgs = [_meter_message(sample, publisher_id) for sample in samples]
+    for msg, signature in zip(msgs, compute_signatures(msgs, secret)):
+        msg['message_signature'] = signature
+    return msgs
+
+
 def message_from_event(event, secret):
     """Make an event message ready to be published or stored.
 
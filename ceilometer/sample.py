@@ -20,7 +20,8 @@ ensure that all of the appropriate fields have been filled
 in by the plugins that create them.
 """
 
-import copy
+import array
+import math
 import uuid
 
 from oslo_config import cfg
@@ -92,6 +93,19 @@ def add_reserved_user_metadata(conf, src_metadata, dest_metadata):
 class Sample(object):
     SOURCE_DEFAULT = "openstack"
 
+    # NOTE: the id is only generated and the metadata of samples built from
+    # a notification only copied from its payload when they are accessed,
+    # many samples never need them.
+    __slots__ = ('name', 'type', 'unit', 'volume', 'user_id', 'user_name',
+                 'project_id', 'project_name', 'resource_id', 'timestamp',
+                 '_resource_metadata', '_metadata_template', 'source', '_id',
+                 'monotonic_time')
+
+    # NOTE: the keys of as_dict()
+    FIELDS = ('name', 'type', 'unit', 'volume', 'user_id', 'user_name',
+              'project_id', 'project_name', 'resource_id', 'timestamp',
+              'resource_metadata', 'source', 'id', 'monotonic_time')
+
     def __init__(self, name, type, unit, volume, user_id, project_id,
                  resource_id, timestamp=None, resource_metadata=None,
                  source=None, id=None, monotonic_time=None,
@@ -106,13 +120,60 @@ class Sample(object):
         self.project_name = project_name
         self.resource_id = resource_id
         self.timestamp = timestamp
-        self.resource_metadata = resource_metadata or {}
+        self._resource_metadata = resource_metadata or {}
+        self._metadata_template = None
         self.source = source or self.SOURCE_DEFAULT
-        self.id = id or str(uuid.uuid1())
+        self._id = id
         self.monotonic_time = monotonic_time
 
+    @property
+    def id(self):
+        if not self._id:
+            self._id = str(uuid.uuid1())
+        return self._id
+
+    @id.setter
+    def id(self, value):
+        self._id = value
+
+    @property
+    def resource_metadata(self):
+        if self._metadata_template is not None:
+            base, extra = self._metadata_template
+            self._metadata_template = None
+            metadata = dict(base)
+            metadata.update(extra)
+            self._resource_metadata = metadata
+        return self._resource_metadata
+
+    @resource_metadata.setter
+    def resource_metadata(self, value):
+        self._metadata_template = None
+        self._resource_metadata = value
+
     def as_dict(self):
-        return copy.copy(self.__dict__)
+        return {'name': self.name,
+                'type': self.type,
+                'unit': self.unit,
+                'volume': self.volume,
+                'user_id': self.user_id,
+                'user_name': self.user_name,
+                'project_id': self.project_id,
+                'project_name': self.project_name,
+                'resource_id': self.resource_id,
+                'timestamp': self.timestamp,
+                'resource_metadata': self.resource_metadata,
+                'source': self.source,
+                'id': self.id,
+                'monotonic_time': self.monotonic_time}
+
+    def __getstate__(self):
+        return self.as_dict()
+
+    def __setstate__(self, state):
+        self._metadata_template = None
+        for field, value in state.items():
+            setattr(self, field, value)
 
     def __repr__(self):
         return '<name: %s, volume: %s, resource_id: %s, timestamp: %s>' % (
@@ -123,25 +184,37 @@ class Sample(object):
                           user_id, project_id, resource_id,
                           message, timestamp=None, metadata=None, source=None,
                           user_name=None, project_name=None):
-        if not metadata:
-            metadata = (copy.copy(message['payload'])
-                        if isinstance(message['payload'], dict) else {})
-            metadata['event_type'] = message['event_type']
-            metadata['host'] = message['publisher_id']
         ts = timestamp if timestamp else message['metadata']['timestamp']
         ts = timeutils.parse_isotime(ts).isoformat()  # add UTC if necessary
-        return cls(name=name,
-                   type=type,
-                   volume=volume,
-                   unit=unit,
-                   user_id=user_id,
-                   project_id=project_id,
-                   resource_id=resource_id,
-                   timestamp=ts,
-                   resource_metadata=metadata,
-                   source=source,
-                   user_name=user_name,
-                   project_name=project_name)
+        s = cls(name=name,
+                type=type,
+                volume=volume,
+                unit=unit,
+                user_id=user_id,
+                project_id=project_id,
+                resource_id=resource_id,
+                timestamp=ts,
+                resource_metadata=metadata,
+                source=source,
+                user_name=user_name,
+                project_name=project_name)
+        if not metadata:
+            # NOTE: the payload is only copied if the metadata is accessed
+            payload = message['payload']
+            s.set_metadata_template(
+                payload if isinstance(payload, dict) else {},
+                {'event_type': message['event_type'],
+                 'host': message['publisher_id']})
+        return s
+
+    def set_metadata_template(self, base, extra=None):
+        """Use a copy of base updated with extra as resource metadata.
+
+        The copy is only made when the metadata are accessed, so base can
+        be shared by many samples but must not be modified.
+        """
+        self._resource_metadata = {}
+        self._metadata_template = (base, extra or {})
 
     def set_timestamp(self, timestamp):
         self.timestamp = timestamp
@@ -151,13 +224,116 @@ class Sample(object):
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            return self.as_dict() == other.as_dict()
         return False
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
 
+def _volume_as_float(volume):
+    """Return the volume as a float, NaN when it is not a number.
+
+    Volumes out of the range of floats, such as huge integers, are
+    infinite.
+    """
+    if volume is None:
+        return math.nan
+    try:
+        return float(volume)
+    except (TypeError, ValueError):
+        return math.nan
+    except OverflowError:
+        try:
+            return math.inf if volume > 0 else -math.inf
+        except TypeError:
+            return math.nan
+
+
+class SampleBatch(object):
+    """Columnar view of a list of samples.
+
+    The attributes the pipelines and publishers look at are stored in
+    parallel columns, the volumes in a float array where NaN marks a
+    volume which is not a number. Operations on the batch work on the
+    columns and return new batches sharing the Sample objects, which are
+    still reachable by iterating over the batch.
+    """
+
+    __slots__ = ('samples', 'names', 'types', 'units', 'volumes',
+                 'resource_ids', 'project_ids', 'timestamps')
+
+    def __init__(self, samples=()):
+        self.samples = list(samples)
+        self.names = [s.name for s in self.samples]
+        self.types = [s.type for s in self.samples]
+        self.units = [s.unit for s in self.samples]
+        self.volumes = array.array(
+            'd', [_volume_as_float(s.volume) for s in self.samples])
+        self.resource_ids = [s.resource_id for s in self.samples]
+        self.project_ids = [s.project_id for s in self.samples]
+        self.timestamps = [s.timestamp for s in self.samples]
+
+    @classmethod
+    def from_data(cls, data):
+        """Return data as a batch, data is a batch, a sample or a list."""
+        if isinstance(data, cls):
+            return data
+        if isinstance(data, Sample):
+            data = [data]
+        return cls(data)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __iter__(self):
+        return iter(self.samples)
+
+    def __getitem__(self, index):
+        return self.samples[index]
+
+    def take(self, indexes):
+        """Return a new batch made of the rows at indexes."""
+        batch = object.__new__(self.__class__)
+        for column in self.__slots__:
+            values = getattr(self, column)
+            selected = [values[i] for i in indexes]
+            if column == 'volumes':
+                selected = array.array('d', selected)
+            setattr(batch, column, selected)
+        return batch
+
+    def filter(self, mask):
+        """Return a new batch made of the rows where mask is true."""
+        mask = list(mask)
+        if all(mask):
+            return self
+        return self.take([i for i, keep in enumerate(mask) if keep])
+
+    def filter_names(self, predicate):
+        """Return a new batch made of the rows whose name matches predicate.
+
+        The predicate is evaluated once per distinct name.
+        """
+        verdicts = {name: predicate(name) for name in set(self.names)}
+        return self.filter(verdicts[name] for name in self.names)
+
+    def valid_volumes(self):
+        """Return the mask of the rows whose volume is a number."""
+        return [not math.isnan(v) for v in self.volumes]
+
+    def group_by_resource(self):
+        """Return the row indexes of each resource, in order of appearance."""
+        groups = {}
+        for i, resource_id in enumerate(self.resource_ids):
+            groups.setdefault(resource_id, []).append(i)
+        return groups
+
+    def as_dicts(self):
+        """Return the samples serialized as a list of dicts."""
+        return [s.as_dict() for s in self.samples]
+
+
 def setup(conf):
     # NOTE(sileht): Instead of passing the cfg.CONF everywhere in ceilometer
     # prepare_service will override this default
@@ -10,9 +10,14 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+from oslo_log import log
+
 from ceilometer.pipeline import sample as endpoint
+from ceilometer.publisher import utils
 from ceilometer import sample
 
+LOG = log.getLogger(__name__)
+
 
 class TelemetryIpc(endpoint.SampleEndpoint):
     """Handle sample from notification bus
@@ -23,7 +28,22 @@ class TelemetryIpc(endpoint.SampleEndpoint):
     event_types = ['telemetry.polling']
 
     def build_sample(self, message):
-        samples = message['payload']['samples']
+        payload = message['payload']
+        if payload.get('signing') == 'batch':
+            if not utils.verify_signature(
+                    payload, self.conf.publisher.telemetry_secret):
+                LOG.warning('Dropping %d samples from %s, the signature of '
+                            'the batch is not valid.',
+                            len(payload['samples']),
+                            message.get('publisher_id'))
+                return
+        elif (self.conf.publisher_notifier.telemetry_signing ==
+                'batch_required'):
+            LOG.warning('Dropping %d samples from %s, the batch is not '
+                        'signed as a whole.', len(payload['samples']),
+                        message.get('publisher_id'))
+            return
+        samples = payload['samples']
         for sample_dict in samples:
             yield sample.Sample(
                 name=sample_dict['counter_name'],
@@ -14,7 +14,9 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import copy
 import time
+from unittest import mock
 
 from ceilometer.compute.pollsters import instance_stats
 from ceilometer.compute.virt import inspector as virt_inspector
@@ -52,6 +54,35 @@ class TestCPUPollster(base.TestPollsterBase):
     # the following apply to all instance resource pollsters but are tested
     # here alone.
 
+    def test_get_samples_concurrently(self):
+        self.CONF.set_override('inspection_concurrency', 4)
+        instances = []
+        for instance_id in range(1, 5):
+            instance = copy.copy(self.instance)
+            instance.id = instance_id
+            instances.append(instance)
+
+        def inspect(instance, duration):
+            if instance.id == 3:
+                raise virt_inspector.InstanceNotFoundException()
+            return virt_inspector.InstanceStats(cpu_time=instance.id,
+                                                cpu_number=2)
+
+        self.inspector.inspect_instance = mock.Mock(side_effect=inspect)
+        mgr = manager.AgentManager(0, self.CONF)
+        cache = {}
+        for pollster in (instance_stats.CPUPollster(self.CONF),
+                         instance_stats.CPUPollster(self.CONF)):
+            samples = list(pollster.get_samples(mgr, cache, instances))
+            self.assertEqual([instance.id for instance in instances
+                              if instance.id != 3],
+                             [s.resource_id for s in samples])
+        self.assertEqual([1, 2, 4], sorted(cache['inspect_instance']))
+        # the instances cached by the first pollster are not inspected again
+        self.assertEqual(5, self.inspector.inspect_instance.call_count)
+        # the statistics are loaded once per polling cycle
+        self.inspector.load_stats.assert_called_once_with()
+
     def test_get_metadata(self):
         mgr = manager.AgentManager(0, self.CONF)
         pollster = instance_stats.CPUPollster(self.CONF)
@@ -16,6 +16,8 @@
 """Tests for the compute pollsters.
 """
 
+from unittest import mock
+
 from oslotest import base
 
 from ceilometer.compute.pollsters import util
@@ -117,3 +119,24 @@ class TestLocationMetadata(base.BaseTestCase):
         md = util._get_metadata_from_object(self.CONF, self.instance)
         self.assertEqual(1, md['image_ref'])
         self.assertIsNone(md['image_ref_url'])
+
+    def test_metadata_built_once_per_cycle(self):
+        self.INSTANCE_PROPERTIES.update({'user_id': 'user',
+                                         'tenant_id': 'project'})
+        self.instance = FauxInstance(**self.INSTANCE_PROPERTIES)
+        cache = {}
+        with mock.patch.object(util, '_get_metadata_from_object',
+                               wraps=util._get_metadata_from_object) as get:
+            cpu = util.make_sample_from_instance(
+                self.CONF, self.instance, 'cpu', 'cumulative', 'ns', 1,
+                cache=cache)
+            vnic = util.make_sample_from_instance(
+                self.CONF, self.instance, 'network.incoming.bytes',
+                'cumulative', 'B', 1, additional_metadata={'mac': 'fa:16'},
+                cache=cache)
+        self.assertEqual(1, get.call_count)
+
+        self.assertEqual('fa:16', vnic.resource_metadata['mac'])
+        self.assertNotIn('mac', cpu.resource_metadata)
+        cpu.resource_metadata['status'] = 'changed'
+        self.assertEqual('active', vnic.resource_metadata['status'])
@@ -12,6 +12,8 @@
 # under the License.
 import datetime
 import iso8601
+import threading
+import time
 from unittest import mock
 
 import fixtures
@@ -263,6 +265,60 @@ class TestDiscovery(base.BaseTestCase):
         self.assertEqual("hvm", metadata["os_type"])
         self.assertEqual("x86_64", metadata["architecture"])
 
+    @mock.patch.object(utils, "start_event_loop")
+    @mock.patch.object(utils, "libvirt")
+    @mock.patch.object(discovery, "libvirt")
+    def test_discovery_with_libvirt_events(self, libvirt, libvirt2,
+                                           start_event_loop):
+        class FakeLibvirtError(Exception):
+            def get_error_code(self):
+                return utils.VIR_ERR_NO_DOMAIN
+
+        self.CONF.set_override("instance_discovery_method",
+                               "libvirt_events",
+                               group="compute")
+        libvirt.libvirtError = FakeLibvirtError
+        libvirt2.VIR_DOMAIN_METADATA_ELEMENT = 2
+        conn = mock.MagicMock()
+        conn.listAllDomains.return_value = [FakeDomain()]
+        conn.lookupByUUIDString.return_value = FakeDomain()
+        libvirt2.openReadOnly.return_value = conn
+        dsc = discovery.InstanceDiscovery(self.CONF)
+
+        resources = dsc.discover(mock.MagicMock())
+        self.assertEqual(1, len(resources))
+        start_event_loop.assert_called_once_with()
+        self.assertEqual(1, conn.domainEventRegisterAny.call_count)
+        callback = conn.domainEventRegisterAny.call_args[0][2]
+        closed = conn.registerCloseCallback.call_args[0][0]
+
+        # nothing changed, the domains are not listed again
+        self.assertEqual(resources, dsc.discover(mock.MagicMock()))
+        self.assertEqual(1, conn.listAllDomains.call_count)
+        conn.lookupByUUIDString.assert_not_called()
+
+        # the domain changed, only this domain is looked up
+        callback(conn, FakeDomain(), 4, 0, None)
+        self.assertEqual(1, len(dsc.discover(mock.MagicMock())))
+        conn.lookupByUUIDString.assert_called_once_with(
+            "a75c2fa5-6c03-45a8-bbf7-b993cfcdec27")
+        self.assertEqual(1, conn.listAllDomains.call_count)
+
+        # the domain has been undefined
+        conn.lookupByUUIDString.side_effect = FakeLibvirtError()
+        callback(conn, FakeDomain(), 1, 0, None)
+        self.assertEqual(0, len(dsc.discover(mock.MagicMock())))
+
+        # the connection has been closed, all the domains are listed
+        closed(conn, 0, None)
+        self.assertEqual(1, len(dsc.discover(mock.MagicMock())))
+        self.assertEqual(2, conn.listAllDomains.call_count)
+
+        # the table expired
+        self.utc_now.return_value += datetime.timedelta(hours=2)
+        dsc.discover(mock.MagicMock())
+        self.assertEqual(3, conn.listAllDomains.call_count)
+
     def test_discovery_with_legacy_resource_cache_cleanup(self):
         self.CONF.set_override("instance_discovery_method", "naive",
                                group="compute")
@@ -327,3 +383,112 @@ class TestDiscovery(base.BaseTestCase):
 
         ret_flavor_id = dsc.get_flavor_id(flavor_name)
         self.assertEqual(flavor_name, ret_flavor_id)
+
+
+class TestFlavorIdCache(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestFlavorIdCache, self).setUp()
+        self.nova_cli = mock.MagicMock()
+        self.flavors = self.nova_cli.nova_client.flavors
+        self.flavors.list.return_value = []
+        self.cache = discovery.FlavorIdCache(self.nova_cli, 3600, 300)
+
+    @staticmethod
+    def _flavor(name, flavor_id):
+        flavor = mock.Mock(id=flavor_id)
+        flavor.name = name
+        return flavor
+
+    def test_warm_up(self):
+        self.flavors.list.return_value = [
+            self._flavor('m1.tiny', '1'), self._flavor('m1.small', '2'),
+            self._flavor('dup', '3'), self._flavor('dup', '4')]
+        self.flavors.find.return_value = self._flavor('dup', '4')
+        self.assertEqual('1', self.cache.get('m1.tiny'))
+        self.assertEqual('2', self.cache.get('m1.small'))
+        self.assertEqual('4', self.cache.get('dup'))
+        self.flavors.list.assert_called_once_with(detailed=True,
+                                                  is_public=None)
+        self.flavors.find.assert_called_once_with(name='dup',
+                                                  is_public=None)
+
+    def test_warm_up_failure(self):
+        self.flavors.list.side_effect = Exception('boom')
+        self.flavors.find.return_value = self._flavor('m1.tiny', '1')
+        self.assertEqual('1', self.cache.get('m1.tiny'))
+        self.assertEqual('1', self.cache.get('m1.tiny'))
+        self.assertEqual(1, self.flavors.find.call_count)
+
+    def test_not_found(self):
+        self.flavors.find.side_effect = exceptions.NotFound(404)
+        with mock.patch('time.monotonic', return_value=1000):
+            self.assertEqual('gone', self.cache.get('gone'))
+            self.assertEqual('gone', self.cache.get('gone'))
+            self.assertEqual(1, self.flavors.find.call_count)
+        with mock.patch('time.monotonic', return_value=1301):
+            self.assertEqual('gone', self.cache.get('gone'))
+            self.assertEqual(2, self.flavors.find.call_count)
+
+    def test_single_flight(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def find(name, is_public):
+            started.set()
+            release.wait(10)
+            return self._flavor(name, '1')
+
+        self.flavors.find.side_effect = find
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(self.cache.get('m1.tiny')))
+            for __ in range(4)]
+        for thread in threads:
+            thread.start()
+        started.wait(10)
+        release.set()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(['1'] * 4, results)
+        self.assertEqual(1, self.flavors.find.call_count)
+
+    def test_single_flight_while_waiting(self):
+        self.cache = discovery.FlavorIdCache(self.nova_cli, 3600, 0)
+        loading = [threading.Event(), threading.Event(), threading.Event()]
+        release = [threading.Event(), threading.Event(), threading.Event()]
+        running = []
+        concurrency = []
+
+        def find(name, is_public):
+            call = self.flavors.find.call_count - 1
+            running.append(call)
+            concurrency.append(len(running))
+            loading[call].set()
+            release[call].wait(10)
+            running.remove(call)
+            raise exceptions.NotFound(404)
+
+        self.flavors.find.side_effect = find
+        threads = [threading.Thread(target=self.cache.get,
+                                    args=('m1.tiny',))
+                   for __ in range(3)]
+        threads[0].start()
+        loading[0].wait(10)
+        threads[1].start()
+        time.sleep(0.1)
+        release[0].set()
+        threads[0].join(10)
+        loading[1].wait(10)
+        # NOTE: the first thread is done while the second one loads, the
+        # third one must still wait for it
+        threads[2].start()
+        time.sleep(0.1)
+        release[1].set()
+        loading[2].wait(10)
+        release[2].set()
+        for thread in threads[1:]:
+            thread.join(10)
+        self.assertEqual(3, self.flavors.find.call_count)
+        self.assertEqual([1, 1, 1], concurrency)
+        self.assertEqual({}, self.cache._loading)
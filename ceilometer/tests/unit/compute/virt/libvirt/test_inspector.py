@@ -253,6 +253,90 @@ class TestLibvirtInspection(base.BaseTestCase):
             self.assertEqual(31, vnic2.tx_errors)
             self.assertEqual(32, vnic2.tx_drop)
 
+    def test_inspect_vnic_deltas_and_rates(self):
+        dom_xml = """
+             <domain type='kvm'>
+                 <devices>
+                     <interface type='bridge'>
+                       <mac address='fa:16:3e:71:ec:6d'/>
+                       <source bridge='br100'/>
+                       <target dev='vnet0'/>
+                     </interface>
+                 </devices>
+             </domain>
+        """
+        domain = mock.Mock()
+        domain.XMLDesc.return_value = dom_xml
+        domain.info.return_value = (0, 0, 0, 2, 999999)
+        # NOTE: the counters are read once per polling cycle
+        domain.interfaceStats.side_effect = [
+            (100, 1, 0, 0, 200, 2, 0, 0),
+            (700, 7, 0, 0, 500, 5, 0, 0),
+        ]
+        conn = mock.Mock()
+        conn.lookupByUUIDString.return_value = domain
+
+        with mock.patch('ceilometer.compute.virt.libvirt.utils.'
+                        'refresh_libvirt_connection', return_value=conn):
+            self.inspector.load_stats()
+            with mock.patch('ceilometer.compute.virt.libvirt.utils.now',
+                            return_value=1000):
+                vnics = list(self.inspector.inspect_vnics(
+                    self.instance, None))
+                self.assertEqual(0, vnics[0].rx_bytes_delta)
+                self.assertEqual([], list(self.inspector.inspect_vnic_rates(
+                    self.instance, None)))
+            self.inspector.load_stats()
+            with mock.patch('ceilometer.compute.virt.libvirt.utils.now',
+                            return_value=1060):
+                vnics = list(self.inspector.inspect_vnics(
+                    self.instance, None))
+                rates = list(self.inspector.inspect_vnic_rates(
+                    self.instance, None))
+
+        self.assertEqual(600, vnics[0].rx_bytes_delta)
+        self.assertEqual(300, vnics[0].tx_bytes_delta)
+        self.assertEqual(1, len(rates))
+        self.assertEqual('vnet0', rates[0].name)
+        self.assertEqual('fa:16:3e:71:ec:6d', rates[0].mac)
+        self.assertEqual(10, rates[0].rx_bytes_rate)
+        self.assertEqual(5, rates[0].tx_bytes_rate)
+
+    def test_inspect_vnics_reused_device_name(self):
+        dom_xml = """
+             <domain type='kvm'>
+                 <devices>
+                     <interface type='bridge'>
+                       <mac address='%s'/>
+                       <target dev='vnet0'/>
+                     </interface>
+                 </devices>
+             </domain>
+        """
+        domain = mock.Mock()
+        domain.XMLDesc.return_value = dom_xml % 'fa:16:3e:71:ec:6d'
+        domain.info.return_value = (0, 0, 0, 2, 999999)
+        domain.interfaceStats.return_value = (100, 1, 0, 0, 200, 2, 0, 0)
+        other_domain = mock.Mock()
+        other_domain.XMLDesc.return_value = dom_xml % 'fa:16:3e:71:ec:6e'
+        other_domain.info.return_value = (0, 0, 0, 2, 999999)
+        other_domain.interfaceStats.return_value = (5, 1, 0, 0, 5, 1, 0, 0)
+        other_instance = VMInstance()
+        other_instance.id = 'a6f5d3e1-5d0e-4bbb-9c0e-7f3b3c1a4b2d'
+        conn = mock.Mock()
+        conn.lookupByUUIDString.side_effect = {
+            self.instance.id: domain, other_instance.id: other_domain}.get
+
+        with mock.patch('ceilometer.compute.virt.libvirt.utils.'
+                        'refresh_libvirt_connection', return_value=conn):
+            list(self.inspector.inspect_vnics(self.instance, None))
+            # the device name is reused by another instance
+            vnics = list(self.inspector.inspect_vnics(other_instance, None))
+            self.assertEqual(0, vnics[0].rx_bytes_delta)
+            domain.interfaceStats.return_value = (150, 1, 0, 0, 200, 2, 0, 0)
+            vnics = list(self.inspector.inspect_vnics(self.instance, None))
+            self.assertEqual(50, vnics[0].rx_bytes_delta)
+
     def test_inspect_vnics_with_domain_shutoff(self):
         domain = mock.Mock()
         domain.info.return_value = (5, 0, 0, 2, 999999)
@@ -309,6 +393,61 @@ class TestLibvirtInspection(base.BaseTestCase):
             self.assertEqual(91752302267, disks[0].wr_total_times)
             self.assertEqual(29142253616, disks[0].rd_total_times)
 
+    def test_inspect_disk_rates_once_per_cycle(self):
+        dom_xml = """
+             <domain type='kvm'>
+                 <devices>
+                     <disk type='file' device='disk'>
+                         <source file='/path/instance-00000001/disk'/>
+                         <target dev='vda' bus='virtio'/>
+                     </disk>
+                     <disk type='file' device='disk'>
+                         <source file='/path/instance-00000001/disk.eph0'/>
+                         <target dev='vdb' bus='virtio'/>
+                     </disk>
+                 </devices>
+             </domain>
+        """
+        domain = mock.Mock()
+        domain.XMLDesc.return_value = dom_xml
+        domain.info.return_value = (0, 0, 0, 2, 999999)
+        domain.blockStats.side_effect = [(1, 2, 3, 4, -1)] * 2 + [
+            (101, 4002, 103, 2004, -1)] * 2
+        domain.blockStatsFlags.side_effect = [
+            {'rd_total_times': 0, 'wr_total_times': 0}] * 2 + [
+            {'rd_total_times': 100 * 10 ** 6,
+             'wr_total_times': 300 * 10 ** 6}] * 2
+        conn = mock.Mock()
+        conn.lookupByUUIDString.return_value = domain
+        methods = (self.inspector.inspect_disks,
+                   self.inspector.inspect_disk_rates,
+                   self.inspector.inspect_disk_latency,
+                   self.inspector.inspect_disk_iops)
+
+        with mock.patch('ceilometer.compute.virt.libvirt.utils.'
+                        'refresh_libvirt_connection', return_value=conn):
+            self.inspector.load_stats()
+            with mock.patch('ceilometer.compute.virt.libvirt.utils.now',
+                            return_value=1000):
+                for method in methods:
+                    list(method(self.instance, None))
+            self.assertEqual(2, domain.blockStats.call_count)
+
+            self.inspector.load_stats()
+            with mock.patch('ceilometer.compute.virt.libvirt.utils.now',
+                            return_value=1010):
+                disks, rates, latency, iops = [
+                    list(method(self.instance, None)) for method in methods]
+
+        self.assertEqual([mock.call('vda'), mock.call('vdb')] * 2,
+                         domain.blockStats.call_args_list)
+        self.assertEqual(4, domain.blockStatsFlags.call_count)
+        self.assertEqual(101, disks[0].read_requests)
+        self.assertEqual(['vda', 'vdb'], [r.device for r in rates])
+        self.assertEqual(400, rates[0].read_bytes_rate)
+        self.assertEqual(2, latency[0].disk_latency)
+        self.assertEqual(20, iops[1].iops_count)
+
     def test_inspect_disks_with_domain_shutoff(self):
         domain = mock.Mock()
         domain.info.return_value = (5, 0, 0, 2, 999999)
@@ -518,6 +657,308 @@ class TestLibvirtInspection(base.BaseTestCase):
             self.assertIsNone(stats.cache_misses)
 
 
+class TestLibvirtBulkInspection(base.BaseTestCase):
+
+    DOM_XML = """
+         <domain type='kvm'>
+             <devices>
+                 <disk type='file' device='disk'>
+                     <source file='/path/instance-00000001/disk'/>
+                     <target dev='vda' bus='virtio'/>
+                 </disk>
+                 <interface type='bridge'>
+                   <mac address='fa:16:3e:71:ec:6d'/>
+                   <source bridge='br100'/>
+                   <target dev='vnet0'/>
+                 </interface>
+             </devices>
+         </domain>
+    """
+
+    def setUp(self):
+        super(TestLibvirtBulkInspection, self).setUp()
+        conf = service.prepare_service([], [])
+        conf.set_override('libvirt_bulk_stats', True)
+
+        self.instance = VMInstance()
+        libvirt_inspector.libvirt = mock.Mock()
+        libvirt_inspector.libvirt.VIR_DOMAIN_SHUTOFF = 5
+        libvirt_inspector.libvirt.libvirtError = FakeLibvirtError
+        utils.libvirt = libvirt_inspector.libvirt
+        with mock.patch('ceilometer.compute.virt.libvirt.utils.'
+                        'refresh_libvirt_connection', return_value=None):
+            self.inspector = libvirt_inspector.LibvirtInspector(conf)
+
+        self.domain = mock.Mock()
+        self.domain.UUIDString.return_value = self.instance.id
+        self.domain.XMLDesc.return_value = self.DOM_XML
+        self.stats = {
+            'state.state': 1,
+            'cpu.time': 999999,
+            'vcpu.current': 2,
+            'vcpu.maximum': 2,
+            'vcpu.0.time': 10000,
+            'vcpu.0.wait': 10000,
+            'vcpu.1.time': 10000,
+            'vcpu.1.wait': 10000,
+            'balloon.available': 51200,
+            'balloon.unused': 25600,
+            'balloon.rss': 30000,
+            'perf.cmt': 90112,
+            'net.count': 1,
+            'net.0.name': 'vnet0',
+            'net.0.rx.bytes': 1,
+            'net.0.rx.pkts': 2,
+            'net.0.rx.errs': 21,
+            'net.0.rx.drop': 22,
+            'net.0.tx.bytes': 3,
+            'net.0.tx.pkts': 4,
+            'net.0.tx.errs': 23,
+            'net.0.tx.drop': 24,
+            'block.count': 1,
+            'block.0.name': 'vda',
+            'block.0.rd.reqs': 1,
+            'block.0.rd.bytes': 2,
+            'block.0.rd.times': 29142253616,
+            'block.0.wr.reqs': 3,
+            'block.0.wr.bytes': 4,
+            'block.0.wr.times': 91752302267,
+            'block.0.allocation': 2,
+            'block.0.capacity': 1,
+            'block.0.physical': 3,
+        }
+        self.conn = mock.Mock()
+        self.conn.getAllDomainStats.return_value = [(self.domain,
+                                                     self.stats)]
+        self.useFixture(fixtures.MockPatch(
+            'ceilometer.compute.virt.libvirt.utils.'
+            'refresh_libvirt_connection', return_value=self.conn))
+        self.inspector.load_stats()
+
+    def _assert_no_domain_call(self):
+        self.conn.lookupByUUIDString.assert_not_called()
+        self.conn.domainListGetStats.assert_not_called()
+        self.domain.memoryStats.assert_not_called()
+        self.domain.interfaceStats.assert_not_called()
+        self.domain.blockStats.assert_not_called()
+        self.domain.blockInfo.assert_not_called()
+
+    def test_load_stats_once(self):
+        self.inspector.inspect_instance(self.instance, None)
+        list(self.inspector.inspect_vnics(self.instance, None))
+        list(self.inspector.inspect_disks(self.instance, None))
+        list(self.inspector.inspect_disk_info(self.instance, None))
+        self.assertEqual(1, self.conn.getAllDomainStats.call_count)
+        self._assert_no_domain_call()
+
+    def test_inspect_instance(self):
+        stats = self.inspector.inspect_instance(self.instance, None)
+        self.assertEqual(2, stats.cpu_number)
+        self.assertEqual(40000, stats.cpu_time)
+        self.assertEqual(90112, stats.cpu_l3_cache_usage)
+        self.assertEqual(25600 / units.Ki, stats.memory_usage)
+        self.assertEqual(30000 / units.Ki, stats.memory_resident)
+        self.assertIsNone(stats.memory_swap_in)
+
+    def test_inspect_vnics(self):
+        vnics = list(self.inspector.inspect_vnics(self.instance, None))
+        self.assertEqual(1, len(vnics))
+        self.assertEqual('vnet0', vnics[0].name)
+        self.assertEqual('fa:16:3e:71:ec:6d', vnics[0].mac)
+        self.assertEqual((1, 2, 21, 22, 3, 4, 23, 24),
+                         (vnics[0].rx_bytes, vnics[0].rx_packets,
+                          vnics[0].rx_errors, vnics[0].rx_drop,
+                          vnics[0].tx_bytes, vnics[0].tx_packets,
+                          vnics[0].tx_errors, vnics[0].tx_drop))
+
+    def test_inspect_disks(self):
+        disks = list(self.inspector.inspect_disks(self.instance, None))
+        self.assertEqual(1, len(disks))
+        self.assertEqual('vda', disks[0].device)
+        self.assertEqual((1, 2, 3, 4, -1),
+                         (disks[0].read_requests, disks[0].read_bytes,
+                          disks[0].write_requests, disks[0].write_bytes,
+                          disks[0].errors))
+        self.assertEqual(91752302267, disks[0].wr_total_times)
+        self.assertEqual(29142253616, disks[0].rd_total_times)
+
+    def test_inspect_disk_rates_latency_iops(self):
+        methods = (self.inspector.inspect_disk_rates,
+                   self.inspector.inspect_disk_latency,
+                   self.inspector.inspect_disk_iops)
+        with mock.patch('ceilometer.compute.virt.libvirt.utils.now',
+                        return_value=1000):
+            for method in methods:
+                self.assertEqual([], list(method(self.instance, None)))
+
+        self.stats.update({'block.0.rd.reqs': 101,
+                           'block.0.rd.bytes': 4002,
+                           'block.0.rd.times': 29142253616 + 100 * 10 ** 6,
+                           'block.0.wr.reqs': 103,
+                           'block.0.wr.bytes': 2004,
+                           'block.0.wr.times': 91752302267 + 300 * 10 ** 6})
+        self.inspector.load_stats()
+        with mock.patch('ceilometer.compute.virt.libvirt.utils.now',
+                        return_value=1010):
+            rates, latency, iops = [list(method(self.instance, None))
+                                    for method in methods]
+
+        self.assertEqual(1, len(rates))
+        self.assertEqual('vda', rates[0].device)
+        self.assertEqual(400, rates[0].read_bytes_rate)
+        self.assertEqual(10, rates[0].read_requests_rate)
+        self.assertEqual(200, rates[0].write_bytes_rate)
+        self.assertEqual(10, rates[0].write_requests_rate)
+        # 400ms for 200 requests
+        self.assertEqual(2, latency[0].disk_latency)
+        self.assertEqual(20, iops[0].iops_count)
+        self._assert_no_domain_call()
+
+    def test_inspect_disk_info(self):
+        disks = list(self.inspector.inspect_disk_info(self.instance, None))
+        self.assertEqual(1, len(disks))
+        self.assertEqual(3, disks[0].capacity)
+        self.assertEqual(2, disks[0].allocation)
+        self.assertEqual(3, disks[0].physical)
+
+    def test_inspect_with_domain_shutoff(self):
+        self.stats['state.state'] = 5
+        self.assertRaises(virt_inspector.InstanceShutOffException,
+                          self.inspector.inspect_instance,
+                          self.instance, None)
+        self.assertRaises(virt_inspector.InstanceShutOffException,
+                          list, self.inspector.inspect_disks(self.instance,
+                                                             None))
+
+    def test_inspect_unknown_domain(self):
+        self.conn.getAllDomainStats.return_value = []
+        self.inspector.load_stats()
+        domain = mock.Mock()
+        domain.info.return_value = (0, 0, 0, 2, 999999)
+        domain.memoryStats.return_value = {}
+        self.conn.lookupByUUIDString.return_value = domain
+        self.conn.domainListGetStats.return_value = [({}, {
+            'vcpu.current': 2, 'cpu.time': 999999})]
+        stats = self.inspector.inspect_instance(self.instance, None)
+        self.assertEqual(999999, stats.cpu_time)
+        self.conn.lookupByUUIDString.assert_called_once_with(
+            self.instance.id)
+
+    def test_load_stats_failure(self):
+        self.conn.getAllDomainStats.side_effect = Exception('boom')
+        with mock.patch('tenacity.nap.time.sleep'):
+            self.inspector.load_stats()
+        self.conn.lookupByUUIDString.side_effect = FakeLibvirtError()
+        self.conn.lookupByUUIDString.side_effect.get_error_code = mock.Mock()
+        self.assertRaises(virt_inspector.InstanceNotFoundException,
+                          self.inspector.inspect_instance,
+                          self.instance, None)
+
+
+class TestDomainXMLCache(base.BaseTestCase):
+
+    DOM_XML = """
+         <domain type='kvm'>
+             <devices>
+                 <disk type='file' device='disk'>
+                     <source file='/path/instance-00000001/disk'/>
+                     <target dev='vda' bus='virtio'/>
+                 </disk>
+                 <disk type='file' device='cdrom'>
+                     <target dev='hdc' bus='ide'/>
+                 </disk>
+                 <interface type='bridge'>
+                     <mac address='fa:16:3e:71:ec:6d'/>
+                     <source bridge='br100'/>
+                     <target dev='vnet0'/>
+                     <filterref filter='nova-instance-00000001-fa163e71ec6d'>
+                         <parameter name='IP' value='10.0.0.2'/>
+                     </filterref>
+                 </interface>
+             </devices>
+         </domain>
+    """
+
+    def setUp(self):
+        super(TestDomainXMLCache, self).setUp()
+        self.cache = utils.DomainXMLCache(300)
+        self.domain = mock.Mock()
+        self.domain.UUIDString.return_value = VMInstance.id
+        self.domain.ID.return_value = 1
+        self.domain.XMLDesc.return_value = self.DOM_XML
+
+    def test_parse_once(self):
+        self.assertEqual(['vda'], self.cache.disk_devices(self.domain))
+        interfaces = self.cache.interfaces(self.domain)
+        self.assertEqual(1, len(interfaces))
+        name, mac, fref, params = interfaces[0]
+        self.assertEqual('vnet0', name)
+        self.assertEqual('fa:16:3e:71:ec:6d', mac)
+        self.assertEqual('nova-instance-00000001-fa163e71ec6d', fref)
+        self.assertEqual('10.0.0.2', params['ip'])
+        self.assertEqual('br100', params['bridge'])
+        self.assertIs(self.cache.xml(self.domain),
+                      self.cache.xml(self.domain))
+        self.assertEqual(1, self.domain.XMLDesc.call_count)
+
+    def test_disabled(self):
+        cache = utils.DomainXMLCache(0)
+        cache.disk_devices(self.domain)
+        cache.disk_devices(self.domain)
+        self.assertEqual(2, self.domain.XMLDesc.call_count)
+
+    def test_domain_restarted(self):
+        self.cache.disk_devices(self.domain)
+        self.domain.ID.return_value = 2
+        self.cache.disk_devices(self.domain)
+        self.assertEqual(2, self.domain.XMLDesc.call_count)
+
+    def test_expired(self):
+        with mock.patch('ceilometer.compute.virt.libvirt.utils.now',
+                        return_value=0):
+            self.cache.disk_devices(self.domain)
+        with mock.patch('ceilometer.compute.virt.libvirt.utils.now',
+                        return_value=301):
+            self.cache.disk_devices(self.domain)
+        self.assertEqual(2, self.domain.XMLDesc.call_count)
+
+    def test_invalidate(self):
+        self.cache.disk_devices(self.domain)
+        self.cache.invalidate(VMInstance.id)
+        self.cache.disk_devices(self.domain)
+        self.cache.invalidate_all()
+        self.cache.disk_devices(self.domain)
+        self.cache.retain([])
+        self.cache.disk_devices(self.domain)
+        self.assertEqual(4, self.domain.XMLDesc.call_count)
+
+
+class TestCounterStore(base.BaseTestCase):
+
+    def test_update(self):
+        with mock.patch('ceilometer.compute.virt.libvirt.utils.now',
+                        return_value=0) as now:
+            store = utils.CounterStore(10, 60)
+            self.assertEqual((None, None), store.update('a', (1, 2)))
+            now.return_value = 30
+            self.assertEqual(((1, 2), 30), store.update('a', (3, 4)))
+            # expired
+            now.return_value = 100
+            self.assertEqual((None, None), store.update('a', (5, 6)))
+
+    def test_bounded(self):
+        store = utils.CounterStore(2, 60)
+        for key in ('a', 'b', 'c'):
+            store.update(key, (1,))
+        self.assertEqual(2, len(store))
+        self.assertEqual((None, None), store.update('a', (1,)))
+
+    def test_counter_delta(self):
+        self.assertEqual(5, utils.counter_delta(15, 10))
+        # the counter has been reset
+        self.assertEqual(3, utils.counter_delta(3, 10))
+
+
 class TestLibvirtInspectionWithError(base.BaseTestCase):
 
     def setUp(self):
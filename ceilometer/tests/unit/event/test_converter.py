@@ -684,6 +684,32 @@ class TestNotificationConverter(ConverterBase):
         e = c.to_event('INFO', self.test_notification2)
         self.assertIsNotValidEvent(e, self.test_notification2)
 
+    def test_converter_definition_resolution_cached(self):
+        self.CONF.set_override('drop_unmatched_notifications', False,
+                               group='event')
+        c = converter.NotificationEventsConverter(
+            self.CONF, self.valid_event_def1, self.fake_plugin_mgr)
+        with mock.patch.object(c, '_resolve_definition',
+                               wraps=c._resolve_definition) as resolve:
+            for i in range(3):
+                c.to_event('INFO', self.test_notification1)
+                c.to_event('INFO', self.test_notification2)
+            self.assertEqual(2, resolve.call_count)
+        self.assertIs(c.definitions[0],
+                      c.get_definition('compute.instance.create.start'))
+        self.assertIs(c.definitions[1], c.get_definition('foo.bar'))
+
+    def test_converter_definition_resolution_reset(self):
+        self.CONF.set_override('drop_unmatched_notifications', True,
+                               group='event')
+        c = converter.NotificationEventsConverter(
+            self.CONF, self.valid_event_def1, self.fake_plugin_mgr)
+        self.assertIsNone(c.get_definition('foo.bar'))
+        catchall = converter.EventDefinition(
+            dict(event_type='*', traits={}), self.fake_plugin_mgr, [])
+        c.definitions = c.definitions + [catchall]
+        self.assertIs(catchall, c.get_definition('foo.bar'))
+
     @staticmethod
     def _convert_message(convert, level):
         message = {'priority': level, 'event_type': "foo", 'publisher_id': "1",
@@ -189,3 +189,43 @@ class TestEventEndpoint(tests_base.BaseTestCase):
             exception_mock = mock_logger.error
             self.assertIn('Continue after error from publisher',
                           exception_mock.call_args_list[0][0][0])
+
+    def _setup_pool(self, results):
+        self.endpoint.conversion_pool = mock.Mock()
+        self.endpoint.conversion_pool.convert.return_value = results
+        return [{'event_type': 'test.test', 'id': i}
+                for i in range(len(results))]
+
+    def test_message_to_event_pool(self):
+        self._setup_endpoint(['test://'])
+        events = [mock.MagicMock(event_type='test.test') for i in range(3)]
+        messages = self._setup_pool([([events[0]], None), ([], None),
+                                     (events[1:], None)])
+        ret = self.endpoint.info(messages)
+        self.assertEqual(oslo_messaging.NotificationResult.HANDLED, ret)
+        self.endpoint.conversion_pool.convert.assert_called_once_with(
+            self.endpoint, 'info', messages)
+        self.fake_publisher.publish_events.assert_called_once_with(events)
+
+    def test_bad_event_pool_ack(self):
+        self._setup_endpoint(['test://'])
+        events = [mock.MagicMock(event_type='test.test') for i in range(2)]
+        messages = self._setup_pool([([events[0]], None),
+                                     ([], ValueError()),
+                                     ([events[1]], None)])
+        ret = self.endpoint.info(messages)
+        self.assertEqual(oslo_messaging.NotificationResult.HANDLED, ret)
+        self.fake_publisher.publish_events.assert_called_once_with(events)
+
+    def test_bad_event_pool_non_ack_and_requeue(self):
+        self._setup_endpoint(['test://'])
+        self.CONF.set_override("ack_on_event_error", False,
+                               group="notification")
+        events = [mock.MagicMock(event_type='test.test') for i in range(2)]
+        messages = self._setup_pool([([events[0]], None),
+                                     ([], ValueError()),
+                                     ([events[1]], None)])
+        ret = self.endpoint.info(messages)
+        self.assertEqual(oslo_messaging.NotificationResult.REQUEUE, ret)
+        self.fake_publisher.publish_events.assert_called_once_with(
+            events[:1])
@@ -913,3 +913,70 @@ class TestMeterProcessing(test.BaseTestCase):
         args, kwargs = LOG.error.call_args_list[0]
         self.assertEqual("Error loading meter definition: %s", args[0])
         self.assertTrue(args[1].endswith("Invalid type bad_type specified"))
+
+
+class TestEventTypeIndex(test.BaseTestCase):
+
+    EVENT_TYPES = ['compute.instance.create.end', 'compute.instance.exists',
+                   'compute.metrics.update', 'volume.create.end',
+                   'snapshot.delete.start', 'image.send', 'imageXsend',
+                   'image.upload.extra', 'l3.meter', 'capacity.pool',
+                   'capacity.pool.foo', 'objectstore.http.request',
+                   'floatingip.update.end', 'unknown.event', '', 'c']
+
+    def setUp(self):
+        super(TestEventTypeIndex, self).setUp()
+        self.CONF = ceilometer_service.prepare_service([], [])
+        self.handler = notifications.ProcessMeterNotifications(
+            self.CONF, mock.Mock())
+
+    def _definition(self, *event_types):
+        return notifications.MeterDefinition(
+            dict(name="test", event_type=list(event_types), type="delta",
+                 unit="B", volume="$.payload.volume",
+                 resource_id="$.payload.resource_id"),
+            self.CONF, mock.Mock())
+
+    def _expected(self, definitions, event_type):
+        return tuple(d for d in definitions if d.match_type(event_type))
+
+    def test_same_matches_as_definitions(self):
+        definitions = list(self.handler.definitions)
+        index = notifications.EventTypeIndex(definitions)
+        for event_type in self.EVENT_TYPES:
+            self.assertEqual(self._expected(definitions, event_type),
+                             index.lookup(event_type), event_type)
+
+    def test_regex_patterns(self):
+        definitions = [self._definition('test.create'),
+                       self._definition('te?st.*'),
+                       self._definition('(foo|test).create'),
+                       self._definition('^test'),
+                       self._definition('test\\.cr'),
+                       self._definition('.*create'),
+                       self._definition('tex', 'test.cre+')]
+        index = notifications.EventTypeIndex(definitions)
+        for event_type in ['test.create', 'tst.create', 'foo.create',
+                           'testXcreate', 'test.update', 'tex.update']:
+            self.assertEqual(self._expected(definitions, event_type),
+                             index.lookup(event_type), event_type)
+
+    def test_lookup_memoized(self):
+        index = notifications.EventTypeIndex(
+            [self._definition('test.create')], cache_size=2)
+        with mock.patch.object(index, '_resolve',
+                               wraps=index._resolve) as resolve:
+            for i in range(3):
+                index.lookup('test.create')
+                index.lookup('unknown.event')
+            self.assertEqual(2, resolve.call_count)
+            index.lookup('another.event')
+            index.lookup('test.create')
+            self.assertEqual(4, resolve.call_count)
+
+    def test_index_rebuilt_with_definitions(self):
+        self.handler.definitions = [self._definition('test.create')]
+        self.assertEqual(1, len(list(self.handler.build_sample(
+            NOTIFICATION))))
+        self.handler.definitions = [self._definition('test.update')]
+        self.assertEqual([], list(self.handler.build_sample(NOTIFICATION)))
@@ -419,6 +419,28 @@ class BasePipelineTestCase(base.BaseTestCase, metaclass=abc.ABCMeta):
         self.assertEqual(1, len(new_publisher.samples))
         self.assertEqual('a', getattr(new_publisher.samples[0], 'name'))
 
+    def test_publisher_gets_sample_list(self):
+        self._build_and_set_new_pipeline()
+        pipeline_manager = pipeline.SamplePipelineManager(self.CONF)
+        publisher = pipeline_manager.pipelines[0].publishers[0]
+        with mock.patch.object(publisher, 'publish_samples') as publish:
+            with pipeline_manager.publisher() as p:
+                p([self.test_counter])
+        self.assertEqual([self.test_counter], publish.call_args[0][0])
+
+    def test_batch_publisher_gets_sample_batch(self):
+        self._build_and_set_new_pipeline()
+        pipeline_manager = pipeline.SamplePipelineManager(self.CONF)
+        publisher = pipeline_manager.pipelines[0].publishers[0]
+        publisher.accepts_sample_batch = True
+        with mock.patch.object(publisher, 'publish_samples') as publish:
+            with pipeline_manager.publisher() as p:
+                p([self.test_counter])
+        batch = publish.call_args[0][0]
+        self.assertIsInstance(batch, sample.SampleBatch)
+        self.assertEqual(['a'], batch.names)
+        self.assertEqual([self.test_counter], list(batch))
+
     def test_multiple_counter_pipeline(self):
         self._set_pipeline_cfg('meters', ['a', 'b'])
         self._build_and_set_new_pipeline()
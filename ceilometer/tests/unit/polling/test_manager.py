@@ -18,10 +18,12 @@
 """Tests for ceilometer agent manager"""
 import copy
 import datetime
+import threading
 from unittest import mock
 
 import fixtures
 from keystoneauth1 import exceptions as ka_exceptions
+from oslo_serialization import jsonutils
 from stevedore import extension
 
 from ceilometer.compute import discovery as nova_discover
@@ -31,6 +33,7 @@ from ceilometer.polling.dynamic_pollster import \
 from ceilometer.polling.dynamic_pollster import SingleMetricPollsterDefinitions
 from ceilometer.polling import manager
 from ceilometer.polling import plugin_base
+from ceilometer.publisher import utils
 from ceilometer import sample
 from ceilometer import service
 from ceilometer.tests import base
@@ -844,6 +847,155 @@ class TestPollingAgent(BaseAgent):
     def test_batching_polled_samples_default(self):
         self._batching_samples(4, 1)
 
+    @mock.patch('ceilometer.cache_utils.CacheClient.'
+                'resolve_uuids_from_cache')
+    def test_tenant_name_discovery_batched(self, resolve):
+        resolve.side_effect = lambda attr, ids: dict(
+            (i, '%s-%s' % (attr, i)) for i in ids)
+        self.CONF.set_override('tenant_name_discovery', True,
+                               group='polling')
+        self.CONF.set_override('batch_size', 2, group='polling')
+        self._batching_samples(4, 2)
+        self.assertEqual(4, resolve.call_count)
+        resolve.assert_any_call('projects', ['test', 'test'])
+        resolve.assert_any_call('users', ['test', 'test'])
+        for s in self.notified_samples:
+            self.assertEqual('projects-test', s['project_name'])
+            self.assertEqual('users-test', s['user_name'])
+
+    @mock.patch('ceilometer.cache_utils.CacheClient.'
+                'resolve_uuids_from_cache')
+    def test_tenant_name_discovery_without_batch_size(self, resolve):
+        resolve.side_effect = lambda attr, ids: dict(
+            (i, '%s-%s' % (attr, i)) for i in ids)
+        self.CONF.set_override('tenant_name_discovery', True,
+                               group='polling')
+        self.CONF.set_override('batch_size', 0, group='polling')
+        self._batching_samples(4, 4)
+        resolve.assert_has_calls([
+            mock.call('projects', ['test'] * 4),
+            mock.call('users', ['test'] * 4)])
+        self.assertEqual(2, resolve.call_count)
+
+    def _concurrent_polling_cfg(self):
+        return {
+            'sources': [{
+                'name': 'test_polling',
+                'interval': 60,
+                'meters': ['test'],
+                'resources': ['test://']
+            }, {
+                'name': 'test_polling_another',
+                'interval': 60,
+                'meters': ['testanother'],
+                'resources': ['test://']
+            }]
+        }
+
+    def test_concurrent_pollsters(self):
+        self.CONF.set_override('pollster_workers', 2, group='polling')
+        self.setup_polling(self._concurrent_polling_cfg())
+        polling_task = list(self.mgr.setup_polling_tasks().values())[0]
+        self.mgr.interval_task(polling_task)
+        self.assertEqual(['test', 'testanother'],
+                         sorted(s['counter_name']
+                                for s in self.notified_samples))
+
+    @mock.patch('ceilometer.polling.manager.LOG')
+    def test_concurrent_pollster_timeout(self, LOG):
+        self.CONF.set_override('pollster_timeout', 1, group='polling')
+        self.CONF.set_override('pollster_workers', 2, group='polling')
+        self.setup_polling(self._concurrent_polling_cfg())
+        polling_task = list(self.mgr.setup_polling_tasks().values())[0]
+        unblock = threading.Event()
+        self.addCleanup(unblock.set)
+
+        def blocked_get_samples(manager, cache, resources):
+            unblock.wait()
+            return [default_test_data()]
+
+        with mock.patch.object(self.Pollster, 'get_samples',
+                               side_effect=blocked_get_samples):
+            self.mgr.interval_task(polling_task)
+            unblock.set()
+
+        self.assertEqual(['testanother'],
+                         [s['counter_name'] for s in self.notified_samples])
+        self.assertEqual(1, LOG.error.call_count)
+
+    @mock.patch('ceilometer.polling.manager.LOG')
+    def test_concurrent_pollster_hanging_across_cycles(self, LOG):
+        self.CONF.set_override('pollster_timeout', 1, group='polling')
+        self.CONF.set_override('pollster_workers', 2, group='polling')
+        self.setup_polling(self._concurrent_polling_cfg())
+        polling_task = list(self.mgr.setup_polling_tasks().values())[0]
+        unblock = threading.Event()
+        self.addCleanup(unblock.set)
+        calls = []
+
+        def blocked_get_samples(manager, cache, resources):
+            calls.append(threading.current_thread())
+            unblock.wait()
+            return [default_test_data()]
+
+        with mock.patch.object(self.Pollster, 'get_samples',
+                               side_effect=blocked_get_samples):
+            self.mgr.interval_task(polling_task)
+            self.mgr.interval_task(polling_task)
+            # NOTE: the hanging pollster is not polled again and still
+            # takes one of the workers
+            self.assertEqual(1, len(calls))
+            self.assertEqual(1, len(polling_task._abandoned))
+            self.assertEqual(1, LOG.warning.call_count)
+            self.assertEqual(['testanother', 'testanother'],
+                             [s['counter_name']
+                              for s in self.notified_samples])
+
+            unblock.set()
+            calls[0].join(5)
+            self.mgr.interval_task(polling_task)
+
+        self.assertEqual(2, len(calls))
+        self.assertEqual(set(), polling_task._abandoned)
+        self.assertEqual(['test', 'testanother'],
+                         sorted(s['counter_name']
+                                for s in self.notified_samples[2:]))
+
+    def test_batch_signing(self):
+        self.CONF.set_override('telemetry_signing', 'batch',
+                               group='publisher_notifier')
+        payloads = []
+        self.notifier.sample.side_effect = (
+            lambda ctxt, event_type, payload: payloads.append(payload))
+        self._batching_samples(0, 1)
+        self.assertEqual(4, len(payloads[0]['samples']))
+        self.assertEqual('batch', payloads[0]['signing'])
+        for s in payloads[0]['samples']:
+            self.assertEqual('', s['message_signature'])
+        self.assertTrue(utils.verify_signature(
+            payloads[0], self.CONF.publisher.telemetry_secret))
+
+    def test_batch_signing_json_round_trip(self):
+        self.CONF.set_override('telemetry_signing', 'batch',
+                               group='publisher_notifier')
+        self.setup_polling()
+        polling_task = list(self.mgr.setup_polling_tasks().values())[0]
+        payloads = []
+        self.notifier.sample.side_effect = (
+            lambda ctxt, event_type, payload: payloads.append(payload))
+        s = default_test_data()
+        s.resource_metadata = {1: 'one',
+                               'when': datetime.datetime(2024, 1, 2, 3, 4)}
+        polling_task._send_notification(
+            [utils.meter_message_from_counter(s, None)])
+
+        # NOTE: what the notification agent receives
+        payload = jsonutils.loads(jsonutils.dumps(payloads[0]))
+        self.assertEqual('one',
+                         payload['samples'][0]['resource_metadata']['1'])
+        self.assertTrue(utils.verify_signature(
+            payload, self.CONF.publisher.telemetry_secret))
+
     def _batching_samples(self, expected_samples, call_count):
         poll_cfg = {
             'sources': [{
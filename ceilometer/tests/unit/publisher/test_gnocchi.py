@@ -13,7 +13,9 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import copy
 import os
+import threading
 from unittest import mock
 import uuid
 
@@ -29,6 +31,7 @@ import requests
 from stevedore import extension
 import testscenarios
 
+from ceilometer import cache_utils
 from ceilometer.event import models
 from ceilometer.publisher import gnocchi
 from ceilometer import sample
@@ -279,6 +282,26 @@ class PublisherTest(base.BaseTestCase):
         operation = rd.event_match("image.delete")
         self.assertEqual('delete', operation)
 
+    def test_sample_attributes_memo(self):
+        pub = gnocchi.GnocchiPublisher(self.conf.conf,
+                                       netutils.urlsplit("gnocchi://"))
+        rd = pub.metric_map['disk.root.size']
+        self.assertIn('resource_metadata', rd._sample_fields)
+        self.assertNotIn('id', rd._sample_fields)
+        expected = rd.sample_attributes(self.samples[0])
+        self.assertEqual('myinstance', expected['display_name'])
+
+        memo = {}
+        with mock.patch.object(sample.Sample, 'as_dict') as as_dict:
+            attrs = rd.sample_attributes(self.samples[0], memo)
+            self.assertEqual(expected, attrs)
+            self.assertIs(attrs, rd.sample_attributes(self.samples[1], memo))
+            as_dict.assert_not_called()
+
+        self.samples[1].resource_metadata['display_name'] = 'renamed'
+        attrs = rd.sample_attributes(self.samples[1], memo)
+        self.assertEqual('renamed', attrs['display_name'])
+
     def test_metric_match(self):
         pub = gnocchi.GnocchiPublisher(self.conf.conf,
                                        netutils.urlsplit("gnocchi://"))
@@ -414,6 +437,130 @@ class PublisherTest(base.BaseTestCase):
         d.publish_samples(samples)
         self.assertEqual(0, len(fake_batch.call_args[0][1]))
 
+    def test_concurrent_resource_creation_and_update(self):
+        resource_ids = [str(uuid.uuid4()) for __ in range(4)]
+        samples = []
+        for resource_id in resource_ids:
+            s = copy.copy(self.samples[0])
+            s.resource_id = resource_id
+            samples.append(s)
+        url = netutils.urlsplit("gnocchi://?resource_workers=4")
+        d = gnocchi.GnocchiPublisher(self.conf.conf, url)
+        d._already_configured_archive_policies = True
+        d.cache = None
+
+        threads = set()
+        barrier = threading.Barrier(2, timeout=5)
+
+        def create(resource_type, resource):
+            threads.add(threading.current_thread())
+            if resource['id'] == resource_ids[0]:
+                raise gnocchi_exc.ClientException(500, 'boom')
+            if resource['id'] == resource_ids[1]:
+                raise gnocchi_exc.ResourceAlreadyExists(409)
+            # NOTE: two resources must be created at the same time
+            barrier.wait()
+
+        d._gnocchi.resource.create.side_effect = create
+        d._gnocchi.metric.batch_resources_metrics_measures.side_effect = [
+            gnocchi_exc.BadRequest(
+                400, {"cause": "Unknown resources",
+                      'detail': [{'resource_id': rid,
+                                  'original_resource_id': rid}
+                                 for rid in resource_ids]}),
+            None]
+        d.publish_samples(samples)
+
+        self.assertEqual(4, d._gnocchi.resource.create.call_count)
+        self.assertNotIn(threading.current_thread(), threads)
+        retried = (d._gnocchi.metric.batch_resources_metrics_measures
+                   .call_args_list[1][0][0])
+        self.assertEqual(set(resource_ids[1:]), set(retried))
+        updated = set(c[0][1] for c in
+                      d._gnocchi.resource.update.call_args_list)
+        self.assertEqual(set(resource_ids[1:]), updated)
+
+    def test_hash_resource(self):
+        resource = {'host': 'foo', 'flavor_id': 1234,
+                    'image_ref': None, 'metrics': {'cpu': 'x'}}
+        reordered = {'metrics': {}, 'image_ref': None, 'flavor_id': 1234,
+                     'host': 'foo'}
+        fingerprint = gnocchi.GnocchiPublisher._hash_resource(resource)
+        # NOTE: the fingerprint doesn't depend on the hash seed
+        self.assertEqual('dddd8c45624bd151252ef3a7694fab75', fingerprint)
+        self.assertEqual(fingerprint,
+                         gnocchi.GnocchiPublisher._hash_resource(reordered))
+        resource['host'] = 'bar'
+        self.assertNotEqual(fingerprint,
+                            gnocchi.GnocchiPublisher._hash_resource(resource))
+
+    def test_resource_cache_ttl(self):
+        url = netutils.urlsplit("gnocchi://?resource_cache_ttl=60&"
+                                "resource_cache_negative_ttl=30")
+        d = gnocchi.GnocchiPublisher(self.conf.conf, url)
+        cache = {}
+        d.cache = mock.Mock(get=cache.get, set=cache.__setitem__)
+        update = d._gnocchi.resource.update
+
+        with mock.patch('time.time', return_value=1000):
+            d._if_not_cached('instance', 'r1', {'host': 'foo'})
+            d._if_not_cached('instance', 'r1', {'host': 'foo'})
+            self.assertEqual(1, update.call_count)
+            d._if_not_cached('instance', 'r1', {'host': 'bar'})
+            self.assertEqual(2, update.call_count)
+
+            update.side_effect = gnocchi_exc.ResourceNotFound(404)
+            self.assertRaises(gnocchi_exc.ResourceNotFound,
+                              d._if_not_cached, 'instance', 'r2',
+                              {'host': 'foo'})
+            d._if_not_cached('instance', 'r2', {'host': 'foo'})
+            self.assertEqual(3, update.call_count)
+            update.side_effect = None
+
+        with mock.patch('time.time', return_value=1030):
+            d._if_not_cached('instance', 'r1', {'host': 'bar'})
+            self.assertEqual(3, update.call_count)
+            d._if_not_cached('instance', 'r2', {'host': 'foo'})
+            self.assertEqual(4, update.call_count)
+
+        with mock.patch('time.time', return_value=1060):
+            d._if_not_cached('instance', 'r1', {'host': 'bar'})
+            self.assertEqual(5, update.call_count)
+
+    def test_resource_cache_recheck_shared_backend(self):
+        self.conf.config(cache_local_size=10)
+        d = gnocchi.GnocchiPublisher(self.conf.conf,
+                                     netutils.urlsplit("gnocchi://"))
+        d.cache = cache_utils.CacheClient(
+            cache_utils.get_dict_cache_region(), self.conf.conf)
+        d.cache.set('r1', (d._hash_resource({'host': 'foo'}), None))
+        # NOTE: another agent updated the resource
+        d.cache.region.set('r1', (d._hash_resource({'host': 'bar'}), None))
+
+        d._if_not_cached('instance', 'r1', {'host': 'bar'})
+        d._gnocchi.resource.update.assert_not_called()
+
+    def test_resource_cache_read_once(self):
+        d = gnocchi.GnocchiPublisher(self.conf.conf,
+                                     netutils.urlsplit("gnocchi://"))
+        d._already_configured_archive_policies = True
+        samples = [self.samples[0], copy.copy(self.samples[0])]
+        samples[1].resource_id = str(uuid.uuid4())
+        attrs = d.metric_map['disk.root.size'].sample_attributes(samples[0])
+        cached = {self.resource_id: (d._hash_resource(attrs), None)}
+        d.cache = mock.Mock()
+        d.cache.get_multi.side_effect = lambda keys: [cached.get(k)
+                                                      for k in keys]
+        d.cache.get.return_value = None
+
+        d.publish_samples(samples)
+
+        d.cache.get_multi.assert_called_once_with(mock.ANY)
+        self.assertEqual({self.resource_id, samples[1].resource_id},
+                         set(d.cache.get_multi.call_args[0][0]))
+        d._gnocchi.resource.update.assert_called_once_with(
+            'instance', samples[1].resource_id, attrs)
+
 
 class MockResponse(mock.NonCallableMock):
     def __init__(self, code):
@@ -716,6 +863,8 @@ class PublisherWorkflowTest(base.BaseTestCase,
     def test_workflow(self, fakeclient_cls, logger):
         url = netutils.urlsplit("gnocchi://")
         publisher = gnocchi.GnocchiPublisher(self.conf.conf, url)
+        publisher.cache.get_multi.side_effect = lambda keys: [None] * len(
+            keys)
 
         fakeclient = fakeclient_cls.return_value
 
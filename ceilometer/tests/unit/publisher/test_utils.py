@@ -14,11 +14,13 @@
 # under the License.
 """Tests for ceilometer/publisher/utils.py
 """
+import datetime
 import json
 
 from oslotest import base
 
 from ceilometer.publisher import utils
+from ceilometer import sample
 
 
 class TestSignature(base.BaseTestCase):
@@ -122,6 +124,46 @@ class TestSignature(base.BaseTestCase):
         data = {'a': 'A', 'b': 'B'}
         self.assertTrue(utils.verify_signature(data, ''))
 
+    def test_compute_signature_same_as_reference(self):
+        messages = [
+            {},
+            {'a': 'A', 'b': 'B', 'message_signature': 'sig'},
+            {'\u00e9t\u00e9': '\u2603', 'bytes': b'abc', 'none': None,
+             'int': 1, 'float': 1.5, 'bool': True,
+             'date': datetime.datetime(2014, 10, 29, 14, 12, 15, 485877)},
+            {'nested': {'b': {'c': [1, 'x', b'y', ('t', {'k': 'v'})]},
+                        'a': 'A', 'empty': {},
+                        'message_signature': 'kept'},
+             'list': [{'z': 1, 'a': ['\u00e9']}], 'tuple': (1, 2)},
+            {'x': 1, 'message_signature': {'sub': 'kept'}},
+        ]
+        for message in messages:
+            for secret in ('not-so-secret', b'bytes-secret', ''):
+                self.assertEqual(
+                    utils.compute_signature_reference(message, secret),
+                    utils.compute_signature(message, secret))
+
+    def test_compute_signatures(self):
+        messages = [{'a': 'A'}, {'a': 'B'}, {'nested': {'a': 'A'}}]
+        self.assertEqual(
+            [utils.compute_signature_reference(m, 'not-so-secret')
+             for m in messages],
+            utils.compute_signatures(messages, 'not-so-secret'))
+        self.assertEqual(['', '', ''], utils.compute_signatures(messages, ''))
+
+    def test_meter_messages_from_counters(self):
+        samples = [sample.Sample('cpu', sample.TYPE_CUMULATIVE, 'ns', i,
+                                 'user', 'project', 'res',
+                                 resource_metadata={'a': [i]})
+                   for i in range(3)]
+        msgs = utils.meter_messages_from_counters(samples, 'not-so-secret',
+                                                  'publisher')
+        self.assertEqual([utils.meter_message_from_counter(s, 'not-so-secret',
+                                                           'publisher')
+                          for s in samples], msgs)
+        for msg in msgs:
+            self.assertTrue(utils.verify_signature(msg, 'not-so-secret'))
+
 
 class TestUtils(base.BaseTestCase):
     def test_recursive_keypairs(self):
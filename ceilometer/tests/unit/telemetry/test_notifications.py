@@ -0,0 +1,85 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+from unittest import mock
+
+from ceilometer.publisher import utils
+from ceilometer import sample
+from ceilometer import service
+from ceilometer.telemetry import notifications
+from ceilometer.tests import base
+
+
+class TestTelemetryIpc(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestTelemetryIpc, self).setUp()
+        self.CONF = service.prepare_service([], [])
+        self.samples = [
+            utils.meter_message_from_counter(
+                sample.Sample('cpu', sample.TYPE_CUMULATIVE, 'ns', i,
+                              'user', 'project', 'res',
+                              resource_metadata={'disks': ['vda']}),
+                None)
+            for i in range(3)]
+        self.endpoint = notifications.TelemetryIpc(self.CONF, mock.Mock())
+
+    def _message(self, secret, signing='batch'):
+        payload = {'samples': self.samples}
+        if signing:
+            payload['signing'] = signing
+            payload['message_signature'] = utils.compute_signature(payload,
+                                                                   secret)
+        return {'payload': payload, 'publisher_id': 'ceilometer.polling'}
+
+    def test_per_sample_signing_not_verified(self):
+        message = self._message(None, signing=None)
+        self.assertEqual([0, 1, 2], [s.volume for s in
+                                     self.endpoint.build_sample(message)])
+
+    def test_per_sample_signing_accepted_with_batch(self):
+        self.CONF.set_override('telemetry_signing', 'batch',
+                               group='publisher_notifier')
+        message = self._message(None, signing=None)
+        self.assertEqual([0, 1, 2], [s.volume for s in
+                                     self.endpoint.build_sample(message)])
+
+    @mock.patch('ceilometer.telemetry.notifications.LOG')
+    def test_per_sample_signing_batch_required(self, LOG):
+        self.CONF.set_override('telemetry_signing', 'batch_required',
+                               group='publisher_notifier')
+        message = self._message(None, signing=None)
+        self.assertEqual([], list(self.endpoint.build_sample(message)))
+        self.assertEqual(1, LOG.warning.call_count)
+
+    def test_batch_signing(self):
+        message = self._message(self.CONF.publisher.telemetry_secret)
+        self.assertEqual([0, 1, 2], [s.volume for s in
+                                     self.endpoint.build_sample(message)])
+
+    def test_batch_signing_batch_required(self):
+        self.CONF.set_override('telemetry_signing', 'batch_required',
+                               group='publisher_notifier')
+        message = self._message(self.CONF.publisher.telemetry_secret)
+        self.assertEqual([0, 1, 2], [s.volume for s in
+                                     self.endpoint.build_sample(message)])
+
+    @mock.patch('ceilometer.telemetry.notifications.LOG')
+    def test_batch_signing_invalid(self, LOG):
+        # NOTE: the marked batches are verified whatever the configuration
+        message = self._message(self.CONF.publisher.telemetry_secret)
+        message['payload']['samples'][0]['counter_volume'] = 42
+        self.assertEqual([], list(self.endpoint.build_sample(message)))
+        self.assertEqual(1, LOG.warning.call_count)
+
+        del message['payload']['message_signature']
+        self.assertEqual([], list(self.endpoint.build_sample(message)))
@@ -0,0 +1,43 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from ceilometer import agent
+from ceilometer.tests import base
+
+
+class TestNameMatcher(base.BaseTestCase):
+
+    NAMES = ['cpu', 'cpu_util', 'disk.read.bytes', 'disk.write.bytes',
+             'memory', 'network.incoming.bytes', 'instance', 'a', 'b', '']
+
+    DATASETS = [['*'], ['cpu'], ['cpu', 'disk.*'], ['!cpu'],
+                ['*', '!disk.*'], ['!disk.*', '!memory'],
+                ['disk.?ead.bytes', 'network.*'], ['[ab]'], ['!*']]
+
+    def test_same_verdict_as_is_supported(self):
+        for dataset in self.DATASETS:
+            matcher = agent.NameMatcher(dataset)
+            for name in self.NAMES:
+                self.assertEqual(agent.Source.is_supported(dataset, name),
+                                 matcher(name),
+                                 '%s / %s' % (dataset, name))
+                # second lookup is served from the verdict cache
+                self.assertEqual(agent.Source.is_supported(dataset, name),
+                                 matcher(name))
+
+    def test_cache_is_bounded(self):
+        matcher = agent.NameMatcher(['disk.*'], cache_size=3)
+        for i in range(10):
+            self.assertTrue(matcher('disk.%d' % i))
+            self.assertLessEqual(len(matcher._cache), 3)
+        self.assertFalse(matcher('cpu'))
@@ -13,8 +13,13 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import time
+from unittest import mock
+
 from ceilometer import cache_utils
 from ceilometer import service as ceilometer_service
+import fixtures
+from keystoneauth1 import exceptions as ka_exceptions
 from oslo_cache.backends import dictionary
 from oslo_cache import core as cache
 from oslo_config import fixture as config_fixture
@@ -98,3 +103,114 @@ class TestOsloCache(base.BaseTestCase):
                 'Retry client is only supported by '
                 'the \'dogpile.cache.pymemcache\' backend.',
                 cache_configure_failed)
+
+
+class TestLocalCache(base.BaseTestCase):
+    def setUp(self):
+        super(TestLocalCache, self).setUp()
+        conf = ceilometer_service.prepare_service(argv=[], config_files=[])
+        self.conf_fixture = self.useFixture(CacheConfFixture(conf))
+        self.conf_fixture.config(cache_local_size=10)
+        self.region = mock.Mock(wraps=cache_utils.get_dict_cache_region())
+
+    def test_get_from_local(self):
+        client = cache_utils.CacheClient(self.region, self.conf_fixture.conf)
+        client.set('key', 'value')
+        self.assertEqual('value', client.get('key'))
+        self.region.get.assert_not_called()
+        client.delete('key')
+        self.assertIsNone(client.get('key'))
+        self.region.get.assert_called_once_with('key')
+
+    def test_no_write_through(self):
+        self.conf_fixture.config(cache_local_write_through=False)
+        client = cache_utils.CacheClient(self.region, self.conf_fixture.conf)
+        client.set('key', 'value')
+        self.assertEqual('value', client.get('key'))
+        self.assertEqual('value', client.get('key'))
+        self.region.get.assert_called_once_with('key')
+
+    def test_disabled(self):
+        self.conf_fixture.config(cache_local_size=0)
+        client = cache_utils.CacheClient(self.region, self.conf_fixture.conf)
+        client.set('key', 'value')
+        self.assertEqual('value', client.get('key'))
+        self.assertEqual('value', client.get('key'))
+        self.assertEqual(2, self.region.get.call_count)
+
+    def test_get_set_multi(self):
+        client = cache_utils.CacheClient(self.region, self.conf_fixture.conf)
+        client.set_multi({'a': 1, 'b': 2})
+        self.region.set_multi.assert_called_once_with({'a': 1, 'b': 2})
+        self.region.set('c', 3)
+        self.assertEqual([1, None, 3, 2],
+                         client.get_multi(['a', 'd', 'c', 'b']))
+        self.region.get_multi.assert_called_once_with(['d', 'c'])
+        self.assertEqual(3, client.get('c'))
+        self.region.get.assert_not_called()
+
+
+class TestResolveUuids(base.BaseTestCase):
+    def setUp(self):
+        super(TestResolveUuids, self).setUp()
+        conf = ceilometer_service.prepare_service(argv=[], config_files=[])
+        self.conf_fixture = self.useFixture(CacheConfFixture(conf))
+        self.region = mock.Mock(wraps=cache_utils.get_dict_cache_region())
+        self.ks_client = mock.Mock()
+        self.ks_client.projects.get.side_effect = self._get_project
+        self.get_client = self.useFixture(fixtures.MockPatch(
+            'ceilometer.keystone_client.get_client',
+            return_value=self.ks_client)).mock
+
+    @staticmethod
+    def _get_project(uuid):
+        if uuid == 'unknown':
+            raise ka_exceptions.NotFound()
+        project = mock.Mock(id=uuid)
+        project.name = 'name-%s' % uuid
+        return project
+
+    def test_resolve_batch(self):
+        client = cache_utils.CacheClient(self.region, self.conf_fixture.conf)
+        client.set('p1', 'cached-p1')
+        names = client.resolve_uuids_from_cache(
+            'projects', ['p1', 'p2', None, 'p2', 'unknown', 'p3'])
+        self.assertEqual({'p1': 'cached-p1', 'p2': 'name-p2',
+                          'unknown': None, 'p3': 'name-p3'}, names)
+        self.region.get_multi.assert_called_once_with(
+            ['p1', 'p2', 'unknown', 'p3'])
+        self.assertEqual(3, self.ks_client.projects.get.call_count)
+        self.get_client.assert_called_once_with(self.conf_fixture.conf)
+
+        # NOTE: the unknown project is not looked up again
+        self.assertIsNone(client.resolve_uuid_from_cache('projects',
+                                                         'unknown'))
+        self.assertEqual('name-p2',
+                         client.resolve_uuid_from_cache('projects', 'p2'))
+        self.assertEqual(3, self.ks_client.projects.get.call_count)
+
+        with mock.patch('time.time', return_value=time.time() + 301):
+            self.assertIsNone(client.resolve_uuid_from_cache('projects',
+                                                             'unknown'))
+        self.assertEqual(4, self.ks_client.projects.get.call_count)
+
+    def test_resolve_negative_entry_as_list(self):
+        client = cache_utils.CacheClient(self.region, self.conf_fixture.conf)
+        self.region.set('unknown', [None, time.time() + 60])
+        self.assertIsNone(client.resolve_uuid_from_cache('projects',
+                                                         'unknown'))
+        self.ks_client.projects.get.assert_not_called()
+
+    def test_resolve_batch_prefetch(self):
+        self.conf_fixture.config(tenant_name_discovery_prefetch=True,
+                                 group='polling')
+        self.ks_client.projects.list.return_value = [
+            self._get_project('p1'), self._get_project('p2')]
+        client = cache_utils.CacheClient(self.region, self.conf_fixture.conf)
+        self.assertEqual({'p1': 'name-p1', 'unknown': None},
+                         client.resolve_uuids_from_cache(
+                             'projects', ['p1', 'unknown']))
+        self.ks_client.projects.get.assert_called_once_with('unknown')
+        self.assertEqual('name-p2',
+                         client.resolve_uuid_from_cache('projects', 'p2'))
+        self.ks_client.projects.list.assert_called_once_with()
@@ -46,3 +46,72 @@ class TestDefinition(base.BaseTestCase):
             mock.call("field4.`split(., 1, 1)`"),
             mock.call("(field5.arg)|(field6)"),
         ])
+
+
+class TestDirectGetter(base.BaseTestCase):
+
+    PAYLOAD = {
+        'publisher_id': 'compute.host-1',
+        'ctxt': {'user': 'u1', 'project_id': None},
+        'payload': {
+            'tenant_id': 't1',
+            'state': None,
+            'fixed_ips': [{'address': '10.0.0.2', 'meta': {}},
+                          {'address': '10.0.0.3'}],
+            'image_meta': {'org.openstack__1__architecture': 'x86_64'},
+            'name': 'abc',
+            'count': 3,
+        },
+    }
+
+    SIMPLE = ['payload.tenant_id', '$.payload.tenant_id', 'payload.state',
+              'payload.missing', 'payload.name.length',
+              'payload.fixed_ips[0].address', 'payload.fixed_ips[1].meta',
+              'payload.fixed_ips[5].address', 'payload.fixed_ips.address',
+              "payload.image_meta.'org.openstack__1__architecture'",
+              'payload[tenant_id]', 'ctxt.user_id|ctxt.user',
+              '(ctxt.project_id)|(payload.tenant_id)',
+              '(payload.missing)|(publisher_id)|($.ctxt.user)',
+              'payload.name[0]', 'payload.count.value', '$']
+
+    COMPLEX = ['payload.*', '$..address', 'payload.fixed_ips[*].address',
+               'payload.name.`split(b, 1, 1)`', 'payload.fixed_ips.`len`']
+
+    def _matches(self, getter):
+        matches = getter(self.PAYLOAD)
+        definition = declarative.Definition('test', 'a', {})
+        return [('.'.join(definition._get_path(m)), m.value)
+                for m in matches]
+
+    def test_same_matches_as_jsonpath(self):
+        for fields in self.SIMPLE:
+            expr = declarative.Definition.JSONPATH_RW_PARSER.parse(fields)
+            getter = declarative.compile_direct_getter(expr)
+            self.assertIsNotNone(getter, fields)
+            self.assertEqual(self._matches(expr.find),
+                             self._matches(getter), fields)
+
+    def test_complex_expressions_not_compiled(self):
+        for fields in self.COMPLEX:
+            expr = declarative.Definition.JSONPATH_RW_PARSER.parse(fields)
+            self.assertIsNone(declarative.compile_direct_getter(expr),
+                              fields)
+
+    def test_parse(self):
+        definition = declarative.Definition(
+            'test', ['ctxt.project_id', 'payload.tenant_id'], {})
+        self.assertEqual('t1', definition.parse(self.PAYLOAD))
+        self.assertEqual([None, 't1'],
+                         definition.parse(self.PAYLOAD, True))
+
+    def test_root_fields(self):
+        for fields, expected in [('payload.tenant_id', {'payload'}),
+                                 ('(ctxt.user)|(payload.name)',
+                                  {'ctxt', 'payload'}),
+                                 ('$.publisher_id', {'publisher_id'}),
+                                 ('$', None),
+                                 ('payload.*', None)]:
+            definition = declarative.Definition('test', fields, {})
+            self.assertEqual(expected, definition.root_fields, fields)
+        self.assertEqual(set(),
+                         declarative.Definition('test', 1, {}).root_fields)
@@ -14,6 +14,8 @@
 # under the License.
 """Tests for Ceilometer notify daemon."""
 
+import os
+import signal
 import time
 from unittest import mock
 
@@ -22,6 +24,8 @@ import yaml
 
 from ceilometer import messaging
 from ceilometer import notification
+from ceilometer.pipeline import conversion
+from ceilometer.pipeline import sample as pipe_sample
 from ceilometer.publisher import test as test_publisher
 from ceilometer import service
 from ceilometer.tests import base as tests_base
@@ -129,6 +133,140 @@ class TestNotification(BaseNotificationTest):
             'Could not load the following pipelines: %s', set(['bad']))
 
 
+class FakeSampleEndpoint(pipe_sample.SampleEndpoint):
+
+    def build_sample(self, message):
+        if message.get('poison'):
+            raise ValueError('poison message')
+        if message.get('kill'):
+            os.kill(os.getpid(), signal.SIGKILL)
+        for i in range(message['count']):
+            yield '%s-%d' % (message['event_type'], i)
+
+
+class TestSampleEndpointBatching(tests_base.BaseTestCase):
+
+    def setUp(self):
+        super(TestSampleEndpointBatching, self).setUp()
+        self.CONF = service.prepare_service([], [])
+        self.publisher = mock.MagicMock()
+        self.publish = self.publisher.__enter__.return_value
+        self.endpoint = FakeSampleEndpoint(self.CONF, self.publisher)
+        self.notifications = [{'event_type': 'a', 'count': 2},
+                              {'event_type': 'b', 'count': 1}]
+
+    def test_publish_per_notification(self):
+        self.endpoint.info(self.notifications)
+        self.assertEqual(2, self.publisher.__enter__.call_count)
+        self.assertEqual(2, self.publisher.__exit__.call_count)
+        self.publish.assert_has_calls([mock.call(['a-0', 'a-1']),
+                                       mock.call(['b-0'])])
+
+    def test_publish_per_batch(self):
+        self.CONF.set_override('batch_publish', True, group='notification')
+        self.endpoint.info(self.notifications)
+        self.assertEqual(1, self.publisher.__enter__.call_count)
+        self.assertEqual(1, self.publisher.__exit__.call_count)
+        self.publish.assert_called_once_with(['a-0', 'a-1', 'b-0'])
+
+    def test_publish_per_batch_poison_message(self):
+        self.CONF.set_override('batch_publish', True, group='notification')
+        self.notifications.insert(1, {'event_type': 'c', 'poison': True})
+        self.assertRaises(ValueError, self.endpoint.info, self.notifications)
+        # NOTE: the batch is requeued, the notifications after the failing
+        # one are not published to not publish them again on redelivery
+        self.publish.assert_called_once_with(['a-0', 'a-1'])
+
+    def test_publish_per_batch_poison_message_first(self):
+        self.CONF.set_override('batch_publish', True, group='notification')
+        self.notifications.insert(0, {'event_type': 'c', 'poison': True})
+        self.assertRaises(ValueError, self.endpoint.info, self.notifications)
+        self.publisher.__enter__.assert_not_called()
+
+    def test_publish_per_batch_nothing_to_publish(self):
+        self.CONF.set_override('batch_publish', True, group='notification')
+        self.endpoint.sample([{'event_type': 'a', 'count': 0}])
+        self.publisher.__enter__.assert_not_called()
+
+
+class TestConversionPool(tests_base.BaseTestCase):
+
+    def setUp(self):
+        super(TestConversionPool, self).setUp()
+        self.CONF = service.prepare_service([], [])
+        self.pool = conversion.ConversionPool(self.CONF, 2)
+        self.addCleanup(self.pool.shutdown)
+        self.publisher = mock.MagicMock()
+        self.publish = self.publisher.__enter__.return_value
+        self.endpoint = FakeSampleEndpoint(self.CONF, self.publisher)
+
+    def test_convert_same_as_local(self):
+        notifications = [{'event_type': 'r%d' % i, 'count': i % 3,
+                          'payload': {'resource_id': 'r%d' % (i % 5)}}
+                         for i in range(20)]
+        notifications[7]['poison'] = True
+        local = conversion.convert_notifications(self.endpoint, 'info',
+                                                 notifications)
+        remote = self.pool.convert(self.endpoint, 'info', notifications)
+        self.assertEqual([items for items, error in local],
+                         [items for items, error in remote])
+        self.assertEqual([error is None for items, error in local],
+                         [error is None for items, error in remote])
+        self.assertIsInstance(remote[7][1], ValueError)
+
+    def test_convert_after_worker_killed(self):
+        notifications = [{'event_type': 'a', 'count': 1,
+                          'payload': {'resource_id': 'r%d' % i}}
+                         for i in range(4)]
+        for executor in self.pool._executors:
+            for pid in list(executor._processes):
+                os.kill(pid, signal.SIGKILL)
+        results = self.pool.convert(self.endpoint, 'info', notifications)
+        self.assertEqual([(['a-0'], None)] * 4, results)
+
+    def test_convert_killing_worker(self):
+        killer = [{'event_type': 'k', 'count': 1, 'kill': True,
+                   'payload': {'resource_id': 'r1'}}]
+        results = self.pool.convert(self.endpoint, 'info', killer)
+        self.assertEqual([], results[0][0])
+        self.assertIsNotNone(results[0][1])
+        # NOTE: only the batch killing the worker fails
+        notifications = [{'event_type': 'a', 'count': 1,
+                          'payload': {'resource_id': 'r1'}}]
+        self.assertEqual([(['a-0'], None)],
+                         self.pool.convert(self.endpoint, 'info',
+                                           notifications))
+
+    def test_endpoint_publish_per_batch(self):
+        self.endpoint.conversion_pool = self.pool
+        self.endpoint.info([{'event_type': 'a', 'count': 2,
+                             'payload': {'resource_id': 'r1'}},
+                            {'event_type': 'b', 'count': 1,
+                             'payload': {'resource_id': 'r2'}}])
+        self.publish.assert_called_once_with(['a-0', 'a-1', 'b-0'])
+
+    def test_endpoint_publish_per_batch_poison_message(self):
+        self.endpoint.conversion_pool = self.pool
+        self.assertRaises(ValueError, self.endpoint.info,
+                          [{'event_type': 'a', 'count': 2,
+                            'payload': {'resource_id': 'r1'}},
+                           {'event_type': 'c', 'poison': True,
+                            'payload': {'resource_id': 'r2'}},
+                           {'event_type': 'b', 'count': 1,
+                            'payload': {'resource_id': 'r3'}}])
+        self.publish.assert_called_once_with(['a-0', 'a-1'])
+
+    def test_resource_key(self):
+        self.assertEqual('r1', conversion.resource_key(
+            {'payload': {'resource_id': 'r1', 'instance_id': 'i1'}}))
+        self.assertEqual('i1', conversion.resource_key(
+            {'payload': {'instance_id': 'i1'}}))
+        self.assertEqual('u1', conversion.resource_key(
+            {'payload': {'nova_object.data': {'uuid': 'u1'}}}))
+        self.assertEqual('compute.host', conversion.resource_key(
+            {'publisher_id': 'compute.host', 'payload': [1, 2]}))
+
+
 class BaseRealNotification(BaseNotificationTest):
     def setup_pipeline(self, counter_names):
         pipeline = yaml.dump({
@@ -242,3 +242,58 @@ class TestNovaClient(base.BaseTestCase):
         self.assertIsNone(instance.kernel_id)
         self.assertIsNone(instance.image)
         self.assertIsNone(instance.ramdisk_id)
+
+    def _cached_client(self, **overrides):
+        self.CONF.set_override('nova_lookup_cache_ttl', 600, 'compute')
+        for name, value in overrides.items():
+            self.CONF.set_override(name, value, 'compute')
+        nv = nova_client.Client(self.CONF)
+        self.useFixture(fixtures.MockPatchObject(
+            nv.nova_client.flavors, 'get',
+            side_effect=self.fake_flavors_get))
+        self.useFixture(fixtures.MockPatchObject(
+            nv.glance_client.images, 'get',
+            side_effect=self.fake_images_get))
+        return nv
+
+    def test_with_flavor_and_image_ttl_cache(self):
+        nv = self._cached_client()
+        nv._with_flavor_and_image(self.fake_servers_list())
+        nv._with_flavor_and_image(self.fake_servers_list_unknown_flavor())
+        results = nv._with_flavor_and_image(
+            self.fake_servers_list() +
+            self.fake_servers_list_unknown_flavor())
+        self.assertEqual('m1.tiny', results[0].flavor['name'])
+        self.assertEqual('unknown-id-666', results[2].flavor['name'])
+        # the flavor not found is cached too
+        self.assertEqual(3, self._flavors_count)
+        self.assertEqual(2, self._images_count)
+
+    def test_with_flavor_and_image_ttl_cache_expired(self):
+        nv = self._cached_client()
+        nv._with_flavor_and_image(self.fake_servers_list())
+        nv._flavor_cache.expire(nv._flavor_cache.timer() + 601)
+        nv._with_flavor_and_image(self.fake_servers_list())
+        self.assertEqual(4, self._flavors_count)
+        self.assertEqual(2, self._images_count)
+
+    def test_with_flavor_and_image_prefetch(self):
+        nv = self._cached_client(nova_prefetch_flavors=True)
+        flavors = [self.fake_flavors_get(1), self.fake_flavors_get(2)]
+        self._flavors_count = 0
+        with mock.patch.object(nv.nova_client.flavors, 'list',
+                               return_value=flavors) as flavors_list:
+            results = nv._with_flavor_and_image(self.fake_servers_list())
+            nv._with_flavor_and_image(self.fake_servers_list())
+        flavors_list.assert_called_once_with(detailed=True, is_public=None)
+        self.assertEqual(0, self._flavors_count)
+        self.assertEqual('m1.tiny', results[0].flavor['name'])
+        self.assertEqual('m1.large', results[1].flavor['name'])
+
+    def test_with_flavor_and_image_prefetch_failure(self):
+        nv = self._cached_client(nova_prefetch_flavors=True)
+        with mock.patch.object(nv.nova_client.flavors, 'list',
+                               side_effect=Exception('boom')):
+            results = nv._with_flavor_and_image(self.fake_servers_list())
+        self.assertEqual(2, self._flavors_count)
+        self.assertEqual('m1.tiny', results[0].flavor['name'])
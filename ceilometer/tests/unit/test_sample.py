@@ -13,6 +13,8 @@
 """Tests for ceilometer/sample.py"""
 
 import datetime
+import pickle
+from unittest import mock
 
 from ceilometer import sample
 from ceilometer.tests import base
@@ -96,3 +98,103 @@ class TestSample(base.BaseTestCase):
         s = sample.Sample.from_notification(
             'sample', 'type', 1.0, '%', 'user', 'project', 'res', msg)
         self.assertEqual('2015-06-19T09:19:35.786893+01:00', s.timestamp)
+
+    def test_sample_id_generated_once(self):
+        s = sample.Sample('cpu', sample.TYPE_CUMULATIVE, 'ns', 1,
+                          'user', 'project', 'res')
+        self.assertEqual(s.id, s.id)
+        self.assertEqual(s.id, s.as_dict()['id'])
+        s.id = 'fixed'
+        self.assertEqual('fixed', s.as_dict()['id'])
+
+    def test_sample_from_notification_metadata_copied_on_access(self):
+        msg = {
+            'event_type': 'sample.create',
+            'metadata': {
+                'timestamp': '2015-06-19T09:19:35.786893',
+                'message_id': '939823de-c242-45a2-a399-083f4d6a8c3e'},
+            'payload': {'counter_name': 'instance100'},
+            'priority': 'info',
+            'publisher_id': 'ceilometer.api',
+        }
+        s = sample.Sample.from_notification(
+            'sample', 'type', 1.0, '%', 'user', 'project', 'res', msg)
+        s.resource_metadata['foo'] = 'bar'
+        self.assertEqual({'counter_name': 'instance100'}, msg['payload'])
+        self.assertEqual({'counter_name': 'instance100', 'foo': 'bar',
+                          'event_type': 'sample.create',
+                          'host': 'ceilometer.api'}, s.resource_metadata)
+
+    def test_sample_as_dict_and_pickle(self):
+        s = sample.Sample('cpu', sample.TYPE_CUMULATIVE, 'ns', 1,
+                          'user', 'project', 'res',
+                          resource_metadata={'a': 1})
+        self.assertEqual(['name', 'type', 'unit', 'volume', 'user_id',
+                          'user_name', 'project_id', 'project_name',
+                          'resource_id', 'timestamp', 'resource_metadata',
+                          'source', 'id', 'monotonic_time'],
+                         list(s.as_dict()))
+        copy = pickle.loads(pickle.dumps(s))
+        self.assertEqual(s, copy)
+        self.assertEqual(s.as_dict(), copy.as_dict())
+        self.assertRaises(AttributeError, setattr, s, 'unknown', 1)
+
+
+class TestSampleBatch(base.BaseTestCase):
+
+    @staticmethod
+    def _sample(name, volume, resource_id):
+        return sample.Sample(name, sample.TYPE_GAUGE, 'B', volume,
+                             'user', 'project', resource_id,
+                             resource_metadata={})
+
+    def setUp(self):
+        super(TestSampleBatch, self).setUp()
+        self.samples = [self._sample('a', 1, 'r1'),
+                        self._sample('b', '2.5', 'r2'),
+                        self._sample('a', None, 'r1'),
+                        self._sample('c', 'fake', 'r3'),
+                        self._sample('b', 4, 'r1')]
+        self.batch = sample.SampleBatch(self.samples)
+
+    def test_columns(self):
+        self.assertEqual(5, len(self.batch))
+        self.assertEqual(self.samples, list(self.batch))
+        self.assertEqual(['a', 'b', 'a', 'c', 'b'], self.batch.names)
+        self.assertEqual(['r1', 'r2', 'r1', 'r3', 'r1'],
+                         self.batch.resource_ids)
+        self.assertEqual([True, True, False, False, True],
+                         self.batch.valid_volumes())
+        self.assertEqual(2.5, self.batch.volumes[1])
+
+    def test_huge_volumes(self):
+        batch = sample.SampleBatch([self._sample('a', 10 ** 400, 'r1'),
+                                    self._sample('a', -10 ** 400, 'r1')])
+        self.assertEqual([float('inf'), float('-inf')], list(batch.volumes))
+        self.assertEqual([True, True], batch.valid_volumes())
+
+    def test_from_data(self):
+        self.assertIs(self.batch,
+                      sample.SampleBatch.from_data(self.batch))
+        batch = sample.SampleBatch.from_data(self.samples[0])
+        self.assertEqual([self.samples[0]], list(batch))
+
+    def test_filter_names(self):
+        predicate = mock.Mock(side_effect=lambda name: name != 'a')
+        batch = self.batch.filter_names(predicate)
+        self.assertEqual(3, predicate.call_count)
+        self.assertEqual(['b', 'c', 'b'], batch.names)
+        self.assertEqual([self.samples[1], self.samples[3], self.samples[4]],
+                         list(batch))
+        self.assertEqual([2.5, 4.0], list(batch.volumes)[::2])
+
+    def test_filter_everything_kept(self):
+        self.assertIs(self.batch, self.batch.filter([True] * 5))
+
+    def test_group_by_resource(self):
+        self.assertEqual({'r1': [0, 2, 4], 'r2': [1], 'r3': [3]},
+                         self.batch.group_by_resource())
+
+    def test_as_dicts(self):
+        self.assertEqual([s.as_dict() for s in self.samples],
+                         self.batch.as_dicts())
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Compare compiled field getters with the jsonpath engine.
+
+Every trait of the default event definitions and every attribute of the
+default meter definitions handling compute.instance.create.end is parsed
+from a nova notification, once through the compiled direct getters and
+once through jsonpath_rw_ext.
+
+Usage:
+
+./tools/bench_jsonpath.py --iterations 2000
+"""
+import argparse
+import copy
+import os
+import timeit
+
+from stevedore import extension
+import yaml
+
+import ceilometer
+from ceilometer import declarative
+
+NOTIFICATION = {
+    'event_type': 'compute.instance.create.end',
+    'priority': 'INFO',
+    'publisher_id': 'compute.compute-0.localdomain',
+    'ctxt': {
+        'user_id': '1e3ce043029547f1a61c1996d1a531a2',
+        'project_id': '7c150a59fe714e6f9263774af9688f0e',
+        'request_id': 'req-d68b36e0-9233-467f-9afb-d81435d64d66',
+    },
+    'metadata': {
+        'message_id': 'dae6f69c-00e0-41c0-b371-41ec3b7f4451',
+        'timestamp': '2012-05-08 20:23:48.028195',
+    },
+    'payload': {
+        'created_at': '2012-05-08 20:23:41',
+        'deleted_at': '',
+        'disk_gb': 1,
+        'display_name': 'testme',
+        'fixed_ips': [{'address': '10.0.0.2', 'floating_ips': [],
+                       'meta': {}, 'type': 'fixed', 'version': 4}],
+        'image_ref_url': 'http://10.0.2.15:9292/images/UUID',
+        'image_meta': {'base_image_ref': 'UUID',
+                       'org.openstack__1__architecture': 'x86_64',
+                       'org.openstack__1__os_distro': 'fedora',
+                       'org.openstack__1__os_version': '38'},
+        'instance_id': '9f9d01b9-4a58-4271-9e27-398b21ab20d1',
+        'instance_type': 'm1.tiny',
+        'instance_type_id': 2,
+        'launched_at': '2012-05-08 20:23:47.985999',
+        'memory_mb': 512,
+        'metadata': {'metering.server_group': 'sg-1'},
+        'state': 'active',
+        'state_description': '',
+        'tenant_id': '7c150a59fe714e6f9263774af9688f0e',
+        'user_id': '1e3ce043029547f1a61c1996d1a531a2',
+        'reservation_id': '1e3ce043029547f1a61c1996d1a531a3',
+        'vcpus': 1,
+        'root_gb': 1,
+        'ephemeral_gb': 0,
+        'host': 'compute-0.localdomain',
+        'node': 'compute-0.localdomain',
+        'availability_zone': 'nova',
+        'cell_name': '',
+        'os_type': 'linux',
+        'architecture': 'x86_64',
+        'image_ref': 'UUID',
+        'kernel_id': '',
+        'ramdisk_id': '',
+    },
+}
+
+DATA_DIR = os.path.dirname(ceilometer.__file__)
+
+
+def _load(path):
+    with open(os.path.join(DATA_DIR, path)) as f:
+        return yaml.safe_load(f)
+
+
+def get_definitions(plugin_manager):
+    event_type = NOTIFICATION['event_type']
+    configs = []
+    for event_def in _load('pipeline/data/event_definitions.yaml'):
+        types = event_def['event_type']
+        types = [types] if isinstance(types, str) else types
+        if event_type in types:
+            configs.extend(event_def['traits'].items())
+    for meter_def in _load('data/meters.d/meters.yaml')['metric']:
+        types = meter_def['event_type']
+        types = [types] if isinstance(types, str) else types
+        if not any(t.startswith('compute.instance') for t in types):
+            continue
+        for name in ('volume', 'resource_id', 'user_id', 'project_id'):
+            if isinstance(meter_def.get(name), str):
+                configs.append((name, meter_def[name]))
+        configs.extend(meter_def.get('metadata', {}).items())
+    return [declarative.Definition(name, cfg, plugin_manager)
+            for name, cfg in configs]
+
+
+def jsonpath_definition(definition):
+    slow = copy.copy(definition)
+    fields = (definition.cfg['fields'] if isinstance(definition.cfg, dict)
+              else definition.cfg)
+    if isinstance(fields, list):
+        fields = '|'.join('(%s)' % path for path in fields)
+    slow.getter = definition.JSONPATH_RW_PARSER.parse(fields).find
+    return slow
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--iterations',
+        type=int,
+        default=2000
+    )
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    plugin_manager = extension.ExtensionManager(
+        namespace='ceilometer.event.trait_plugin')
+    definitions = get_definitions(plugin_manager)
+    compiled = [d for d in definitions
+                if callable(d.getter) and
+                all(isinstance(m, declarative.DirectMatch)
+                    for m in d.getter(NOTIFICATION))]
+    slow = [jsonpath_definition(d) for d in definitions]
+
+    for d, s in zip(definitions, slow):
+        assert d.parse(NOTIFICATION) == s.parse(NOTIFICATION), d.cfg
+
+    def run(defs):
+        for d in defs:
+            d.parse(NOTIFICATION)
+
+    print('%d field definitions, %d compiled to direct getters'
+          % (len(definitions), len(compiled)))
+    fast_time = timeit.timeit(lambda: run(definitions),
+                              number=args.iterations)
+    slow_time = timeit.timeit(lambda: run(slow), number=args.iterations)
+    per_notification = 1000000.0 / args.iterations
+    print('jsonpath engine: %8.1f us/notification'
+          % (slow_time * per_notification))
+    print('direct getters:  %8.1f us/notification'
+          % (fast_time * per_notification))
+    print('speedup:         %8.1fx' % (slow_time / fast_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure the cost of a sample through a pipeline to the Gnocchi publisher.
+
+Samples are built from a nova notification, published through a
+SamplePipeline and pushed by the GnocchiPublisher to a fake Gnocchi
+client. Both the time and the memory allocated per sample are reported.
+
+Usage:
+
+./tools/bench_sample.py --samples 10000 --resources 100
+"""
+import argparse
+import time
+import tracemalloc
+from unittest import mock
+
+import bench_jsonpath
+
+from ceilometer.pipeline import sample as pipeline
+from ceilometer.publisher import gnocchi
+from ceilometer import sample
+from ceilometer import service
+
+METERS = [('memory', 'gauge', 'MB', 'memory_mb'),
+          ('vcpus', 'gauge', 'vcpu', 'vcpus'),
+          ('disk.root.size', 'gauge', 'GB', 'root_gb'),
+          ('disk.ephemeral.size', 'gauge', 'GB', 'ephemeral_gb')]
+
+
+def make_samples(count, resources):
+    message = bench_jsonpath.NOTIFICATION
+    payload = message['payload']
+    samples = []
+    for i in range(count):
+        name, type_, unit, field = METERS[i % len(METERS)]
+        samples.append(sample.Sample.from_notification(
+            name=name, type=type_, unit=unit, volume=payload[field],
+            user_id=payload['user_id'], project_id=payload['tenant_id'],
+            resource_id='instance-%d' % (i % resources), message=message))
+    return samples
+
+
+def get_pipeline(conf):
+    with mock.patch('ceilometer.keystone_client.get_client'), \
+            mock.patch('ceilometer.gnocchi_client.get_gnocchiclient'):
+        publisher = gnocchi.GnocchiPublisher(
+            conf, mock.Mock(query=''))
+    publisher._already_configured_archive_policies = True
+    publisher.filter_project = None
+    publisher.cache = None
+
+    publisher_manager = mock.Mock()
+    publisher_manager.get.return_value = publisher
+    source = pipeline.SampleSource({'name': 'bench',
+                                    'meters': ['*'],
+                                    'sinks': ['gnocchi']})
+    sink = pipeline.SampleSink(conf, {'name': 'gnocchi',
+                                      'publishers': ['gnocchi://']},
+                               publisher_manager)
+    return pipeline.SamplePipeline(conf, source, sink)
+
+
+def run(pipe, args):
+    samples = make_samples(args.samples, args.resources)
+    pipe.publish_data(samples)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--samples',
+        type=int,
+        default=10000
+    )
+    parser.add_argument(
+        '--resources',
+        type=int,
+        default=100
+    )
+    parser.add_argument(
+        '--rounds',
+        type=int,
+        default=5
+    )
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    conf = service.prepare_service([], [])
+    pipe = get_pipeline(conf)
+
+    # warm up caches and lazily built objects
+    run(pipe, args)
+
+    best = None
+    for __ in range(args.rounds):
+        start = time.perf_counter_ns()
+        run(pipe, args)
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    run(pipe, args)
+    __, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print('%d samples, %d resources' % (args.samples, args.resources))
+    print('time:   %8.0f ns/sample' % (best / args.samples))
+    print('memory: %8.0f bytes/sample (peak)' % (peak / args.samples))
+
+
+if __name__ == '__main__':
+    main()